@@ -1,21 +1,6 @@
 import csv
-import sqlite3
 from datetime import date
-
-def insert_row(platform, userID, username, wa, date):
-    # Connect to the SQLite database
-    conn = sqlite3.connect('gmetis.db')
-    cursor = conn.cursor()
-    
-    # Insert a new row into the gmetis table
-    cursor.execute('''
-    INSERT INTO waMap (platform, userID, username, wa, date)
-    VALUES (?, ?, ?, ?, ?)
-    ''', (platform, userID, username, wa, date))
-    
-    # Commit the changes and close the connection
-    conn.commit()
-    conn.close()
+from scripts.sqlite_db import SQLiteDatabaseManager
 
 def read_csv_and_insert(csv_filename, platform):
     rows = []
@@ -27,9 +12,10 @@ def read_csv_and_insert(csv_filename, platform):
             rows.append((platform, userID, username, wa, date.today()))
     
     if rows:
-        # Insert all rows into the SQLite database
-        for row in rows:
-            insert_row(*row)
+        # Insert all rows into the SQLite database in a single transaction
+        db_manager = SQLiteDatabaseManager('gmetis.db')
+        db_manager.add_wallets(rows)
+        db_manager.close()
         
         # Wipe all rows from the CSV file
         with open(csv_filename, 'w', newline='') as csvfile:
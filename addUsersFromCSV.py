@@ -1,10 +1,13 @@
 import csv
+import functools
+import re
 from datetime import date
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, bindparam
 import os
 from tenacity import retry, stop_after_attempt, wait_exponential
 from sqlalchemy.orm import Session
 import logging
+from scripts.db_migrations import current_wallet_rows, get_schema_version, upsert_current_wallet_stmt
 
 # Set up logging
 logging.basicConfig(
@@ -13,6 +16,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+try:
+    from eth_utils import to_checksum_address
+except ImportError:  # the addnewusers workflow only installs sqlalchemy/pyodbc/tenacity
+    to_checksum_address = None
+
+ADDRESS_RE = re.compile(r'^0x[0-9a-fA-F]{40}$')
+BATCH_SIZE = 1000  # stays under SQL Server's 2100 parameter limit for the IN lookups
+REJECTED_CSV = 'newusers_rejected.csv'
+CURRENT_WALLETS_VERSION = 3  # schema migration that adds waCurrent
+
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
 def get_engine():
     # Connection details from environment variables
@@ -33,9 +46,16 @@ def get_engine():
             'backoff_factor': 2
         },
         pool_size=5,
-        max_overflow=10
+        max_overflow=10,
+        fast_executemany=True  # send executemany batches as one ODBC array insert
     )
 
+@functools.lru_cache(maxsize=None)
+def has_current_wallets(engine):
+    # Before the reward script has migrated the schema there is no waCurrent yet;
+    # the migration backfills it from waMap, so skipping the upsert loses nothing
+    return get_schema_version(engine, 'telegram') >= CURRENT_WALLETS_VERSION
+
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
 def insert_row(engine, platform, userID, username, wa, date_value):
     # Insert a new row into the waMap table
@@ -53,6 +73,11 @@ def insert_row(engine, platform, userID, username, wa, date_value):
                 'wa': wa,
                 'date': date_value
             })
+            if has_current_wallets(engine):
+                session.execute(
+                    upsert_current_wallet_stmt(engine.dialect.name, 'telegram'),
+                    current_wallet_rows('telegram', platform, userID, username, wa, date_value)
+                )
             session.commit()
             logger.info(f"Successfully inserted row for user {username}")
         except Exception as e:
@@ -61,7 +86,103 @@ def insert_row(engine, platform, userID, username, wa, date_value):
             logger.error(f"Data: platform={platform}, userID={userID}, username={username}, wa={wa}, date={date_value}")
             raise
 
-def read_csv_and_insert(csv_filename, platform):
+def normalize_rows(rows):
+    """Validate and normalize CSV rows in one pass.
+
+    Returns (accepted, rejected). Addresses are stripped and checksummed
+    when eth_utils is available. Within the file the last row per userID
+    wins, and exact repeats are dropped.
+    """
+    accepted = {}
+    rejected = []
+    for platform, userID, username, wa, date_value in rows:
+        userID, username, wa = userID.strip(), username.strip().lstrip('@'), wa.strip()
+        if not userID or not ADDRESS_RE.match(wa):
+            rejected.append((userID, username, wa, 'invalid userID or wallet address'))
+            continue
+        if to_checksum_address is not None:
+            wa = to_checksum_address(wa)
+        # Later registrations in the file replace earlier ones for the same user
+        accepted.pop(userID, None)
+        accepted[userID] = (platform, userID, username, wa, date_value)
+    return list(accepted.values()), rejected
+
+def drop_existing(engine, rows):
+    """Drop rows that repeat the user's latest registration, username included."""
+    query = text("""
+        SELECT w.userID, w.username, w.wa
+        FROM waMap w
+        JOIN (SELECT userID, MAX(ID) AS latest_id FROM waMap WHERE userID IN :user_ids GROUP BY userID) latest
+            ON latest.latest_id = w.ID
+    """).bindparams(bindparam('user_ids', expanding=True))
+
+    latest = {}
+    with engine.connect() as connection:
+        for i in range(0, len(rows), BATCH_SIZE):
+            user_ids = [row[1] for row in rows[i:i + BATCH_SIZE]]
+            for userID, username, wa in connection.execute(query, {'user_ids': user_ids}):
+                latest[userID] = (username or '', (wa or '').lower())
+
+    # A new username with the same wallet is still inserted so lookups by username find it
+    return [row for row in rows if latest.get(row[1]) != (row[2], row[3].lower())]
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+def bulk_insert_rows(engine, rows):
+    """Load all rows into waMap in batches inside a single transaction."""
+    insert_query = text("""
+        INSERT INTO waMap (platform, userID, username, wa, date)
+        VALUES (:platform, :userID, :username, :wa, :date)
+    """)
+    params = [
+        {'platform': platform, 'userID': userID, 'username': username, 'wa': wa, 'date': date_value}
+        for platform, userID, username, wa, date_value in rows
+    ]
+    current_params = [
+        current_row
+        for row in rows
+        for current_row in current_wallet_rows('telegram', *row)
+    ]
+    update_current = has_current_wallets(engine)
+    with engine.begin() as connection:
+        for i in range(0, len(params), BATCH_SIZE):
+            connection.execute(insert_query, params[i:i + BATCH_SIZE])
+        if update_current:
+            # Same transaction, so waCurrent never points past what waMap holds
+            upsert_stmt = upsert_current_wallet_stmt(engine.dialect.name, 'telegram')
+            for i in range(0, len(current_params), BATCH_SIZE):
+                connection.execute(upsert_stmt, current_params[i:i + BATCH_SIZE])
+    logger.info(f"Bulk inserted {len(rows)} rows into waMap")
+
+def write_rejected(rejected, csv_filename=REJECTED_CSV):
+    # Append so rejects from earlier runs stay visible until someone fixes them
+    write_header = not os.path.exists(csv_filename)
+    with open(csv_filename, 'a', newline='') as csvfile:
+        csv_writer = csv.writer(csvfile)
+        if write_header:
+            csv_writer.writerow(['userID', 'username', 'wa', 'reason'])
+        csv_writer.writerows(rejected)
+    for row in rejected:
+        logger.warning(f"Rejected row {row[:3]}: {row[3]}")
+
+def bulk_ingest(engine, rows):
+    """Validate, de-duplicate and load rows; returns the number inserted."""
+    accepted, rejected = normalize_rows(rows)
+    duplicates = len(rows) - len(accepted) - len(rejected)
+    new_rows = drop_existing(engine, accepted) if accepted else []
+    already_registered = len(accepted) - len(new_rows)
+
+    if new_rows:
+        bulk_insert_rows(engine, new_rows)
+    if rejected:
+        write_rejected(rejected)
+
+    logger.info(
+        f"Ingest summary: {len(new_rows)} inserted, {duplicates} duplicate in file, "
+        f"{already_registered} already registered, {len(rejected)} rejected"
+    )
+    return len(new_rows)
+
+def read_csv_and_insert(csv_filename, platform, bulk=True):
     engine = get_engine()
     rows = []
     
@@ -82,22 +203,33 @@ def read_csv_and_insert(csv_filename, platform):
 
     if rows:
         successful_inserts = 0
-        # Insert all rows into the Azure SQL database
-        for row in rows:
+        clear_csv = False
+        if bulk:
+            # Validate, de-duplicate and load everything in one transaction
             try:
-                insert_row(engine, *row)
-                successful_inserts += 1
+                successful_inserts = bulk_ingest(engine, rows)
+                # Every row is now in waMap, already registered, a repeat, or in REJECTED_CSV
+                clear_csv = True
             except Exception as e:
-                logger.error(f"Failed to insert row: {e}")
-                continue
+                logger.error(f"Bulk ingest failed: {e}")
+        else:
+            # Insert all rows into the Azure SQL database
+            for row in rows:
+                try:
+                    insert_row(engine, *row)
+                    successful_inserts += 1
+                except Exception as e:
+                    logger.error(f"Failed to insert row: {e}")
+                    continue
+            clear_csv = successful_inserts > 0
         
-        if successful_inserts > 0:
-            # Clear the CSV file and write header only if we had successful inserts
+        if clear_csv:
+            # Clear the CSV file and write header only once its rows are accounted for
             try:
                 with open(csv_filename, 'w', newline='') as csvfile:
                     csv_writer = csv.writer(csvfile)
                     csv_writer.writerow(['userID', 'username', 'wa'])  # Write header
-                logger.info(f"Successfully processed {successful_inserts} rows and cleared the CSV file.")
+                logger.info(f"Inserted {successful_inserts} of {len(rows)} rows and cleared the CSV file.")
             except Exception as e:
                 logger.error(f"Error clearing CSV file: {e}")
         else:
@@ -31,10 +31,15 @@ load_dotenv()
 class DatabaseManager:
     def __init__(self, db_name='gmetis.db'):
         self.db_name = db_name
+        # One connection for the whole run instead of one per operation
+        self.conn = sqlite3.connect(self.db_name, cached_statements=256)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('PRAGMA mmap_size=268435456')
         self.setup_database()
 
     def setup_database(self):
-        conn = sqlite3.connect(self.db_name)
+        conn = self.conn
         cursor = conn.cursor()
         
         # Create rewards table if it doesn't exist
@@ -64,10 +69,9 @@ class DatabaseManager:
         ''')
         
         conn.commit()
-        conn.close()
 
     def get_last_winner(self):
-        conn = sqlite3.connect(self.db_name)
+        conn = self.conn
         cursor = conn.cursor()
         cursor.execute('''
         SELECT userid 
@@ -76,28 +80,25 @@ class DatabaseManager:
         LIMIT 1
         ''')
         result = cursor.fetchone()
-        conn.close()
         return result[0] if result else None
     
     def get_latest_wa(self, identifier, value):
-        conn = sqlite3.connect(self.db_name)
+        conn = self.conn
         cursor = conn.cursor()
         column = 'userID' if identifier == 'userID' else 'username'
         cursor.execute(f'SELECT wa FROM waMap WHERE {column} = ? ORDER BY ID DESC LIMIT 1', (value,))
         result = cursor.fetchone()
-        conn.close()
         return result[0] if result else None
 
     def get_next_reward_round(self):
-        conn = sqlite3.connect(self.db_name)
+        conn = self.conn
         cursor = conn.cursor()
         cursor.execute('SELECT MAX(reward_round) FROM rewards')
         result = cursor.fetchone()[0]
-        conn.close()
         return (result or 0) + 1
 
     def add_reward_entry(self, userid, reward_round=None, wa=None, balance=None, reward=None, tx=None):
-        conn = sqlite3.connect(self.db_name)
+        conn = self.conn
         cursor = conn.cursor()
         current_date = datetime.now().date()
         if not reward_round:
@@ -131,13 +132,12 @@ class DatabaseManager:
         
         conn.commit()
         reward_id = cursor.lastrowid if not existing else existing[0]
-        conn.close()
         return reward_round
 
     def add_pending_reward(self, userid):
         """Add a pending reward entry with just the userID"""
         reward_round = self.get_next_reward_round()
-        conn = sqlite3.connect(self.db_name)
+        conn = self.conn
         cursor = conn.cursor()
         current_date = datetime.now().date()
         
@@ -147,12 +147,11 @@ class DatabaseManager:
         ''', (userid, current_date, reward_round))
         
         conn.commit()
-        conn.close()
         return reward_round
 
     def get_pending_rewards(self):
         """Get all rewards entries that have userID but no wallet address"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self.conn
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -163,7 +162,6 @@ class DatabaseManager:
         ''')
         
         results = cursor.fetchall()
-        conn.close()
         return results
 
 
@@ -1,18 +1,22 @@
 import os
+import sys
+import time
 import json
 import asyncio
 import sqlite3
 import requests
 import logging
 from datetime import datetime, timedelta, timezone
-from telethon import TelegramClient
+from telethon import TelegramClient, events
+from telethon.utils import get_peer_id
+from telethon.errors import FloodWaitError
 from web3 import Web3
 from dotenv import load_dotenv
 import openai
 from telegram import Bot
 
 #Azure
-from sqlalchemy import create_engine, text, MetaData, Table, Column, Integer, String, Date, select, desc, insert, update 
+from sqlalchemy import create_engine, text, MetaData, Table, Column, Integer, BigInteger, String, Date, select, desc, insert, update, func, event
 from sqlalchemy.orm import declarative_base, Session
 
 
@@ -21,7 +25,24 @@ from sqlalchemy.orm import declarative_base, Session
 WINDOW_IN_H = 3
 TOTAL_REWARD = 50000
 AMOUNT_HELD = 1000000
+PLATFORM = 'Telegram'  # waMap.platform value for this bot's registrations
 EXCLUDED_USERS = [7340946957,5571930248, 7843080080, 7694522043, 609517172, 301429358]
+ARCHIVE_DB = os.getenv('TG_ARCHIVE_DB', 'messages.db')  # local archive of fetched group messages
+# Opt-in: archived messages older than this are deleted, imported exports included; unset or 0 keeps everything
+ARCHIVE_RETENTION_S = int(os.getenv('TG_ARCHIVE_RETENTION_DAYS') or 0) * 24 * 3600
+USER_REFRESH_S = 24 * 3600  # re-resolve a cached sender's username after this long
+ENTITY_BATCH_SIZE = 200  # users per get_entity batch
+FETCH_RATE = 0.5  # history fetches per second per group, bursting to FETCH_BURST
+FETCH_BURST = 2
+ROUND_INTERVAL_S = WINDOW_IN_H * 3600  # --listen mode: time between rounds
+SNAPSHOT_INTERVAL_S = 60  # --listen mode: how often engagement counters are persisted
+LLM_TIEBREAK = os.getenv('LLM_TIEBREAK', '1') == '1'  # let gpt-4 choose between near-tied top scorers
+TIEBREAK_CANDIDATES = 3  # at most this many top scorers go to the tie-breaker
+TIE_MARGIN = 0.1  # runners-up within 10% of the top score count as tied
+LLM_PROMPT_BUDGET = 6000  # conversation tokens sent to gpt-4 (8k context, leaving room for instructions)
+LLM_CACHE_DB = os.getenv('LLM_CACHE_DB', 'llm_cache.db')  # answers keyed by (model, messages, params)
+LLM_TIMEOUT_S = 30  # an OpenAI call slower than this falls back to the non-LLM answer
+LLM_CONCURRENCY = 4  # OpenAI calls in flight at once
 
 # Set up logging
 logging.basicConfig(
@@ -37,26 +58,64 @@ Base = declarative_base()
 
 from sqlalchemy import create_engine, text, MetaData, Table, Column, Integer, String, Date, select, desc
 from tenacity import retry, stop_after_attempt, wait_exponential
+from db_migrations import migrate, sync_current_wallets, telegram_tables, current_wallet_rows, upsert_current_wallet_stmt
+from sqlite_db import PRAGMAS, SQLiteDatabaseManager
+from async_db import AsyncDatabaseManager
+from ttl_cache import TTLCache
+from message_archive import MessageArchive
+from rate_limit import TokenBucket
+from send_queue import SendQueue
+from engagement import EngagementCounter
+from message_batch import NO_SENDER, MessageBatch
+from wallet_registration import WalletRegistrar
+from engagement_scorer import top_candidates
+from conversation_packer import pack_conversation
+from llm_cache import LLMCache
+from async_llm import AsyncLLMClient
+
+# Shared by every OpenAI call in this process, and with the X bot when pointed at the same file
+LLM_CACHE = LLMCache(LLM_CACHE_DB)
+LLM = AsyncLLMClient(LLM_CACHE, LLM_CONCURRENCY, LLM_TIMEOUT_S)
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    for pragma in PRAGMAS:
+        dbapi_connection.execute(pragma)
 
 class DatabaseManager:
-    def __init__(self):
-        server = os.getenv('AZURE_SQL_SERVER')
-        database = os.getenv('AZURE_SQL_DATABASE')
-        username = os.getenv('AZURE_SQL_USERNAME')
-        password = os.getenv('AZURE_SQL_PASSWORD')
+    def __init__(self, connection_string=None):
+        if connection_string is None:
+            server = os.getenv('AZURE_SQL_SERVER')
+            database = os.getenv('AZURE_SQL_DATABASE')
+            username = os.getenv('AZURE_SQL_USERNAME')
+            password = os.getenv('AZURE_SQL_PASSWORD')
+            connection_string = f'mssql+pyodbc://{username}:{password}@{server}/{database}?driver=ODBC+Driver+18+for+SQL+Server'
         
-        self.connection_string = f'mssql+pyodbc://{username}:{password}@{server}/{database}?driver=ODBC+Driver+18+for+SQL+Server'
+        self.connection_string = connection_string
         
-        # Add retry logic and longer timeout
-        self.engine = create_engine(
-            self.connection_string,
-            connect_args={
-                'timeout': 300,  # Increase timeout to 5 minutes
-                'retry_with_backoff': True,
-                'backoff_factor': 2
-            },
-            pool_size=5,
-            max_overflow=10
+        if self.connection_string.startswith('sqlite'):
+            # Local runs and replays against gmetis.db; pooled connections stay open
+            self.engine = create_engine(
+                self.connection_string,
+                connect_args={'cached_statements': 256}
+            )
+            event.listen(self.engine, 'connect', _apply_sqlite_pragmas)
+        else:
+            # Add retry logic and longer timeout
+            self.engine = create_engine(
+                self.connection_string,
+                connect_args={
+                    'timeout': 300,  # Increase timeout to 5 minutes
+                    'retry_with_backoff': True,
+                    'backoff_factor': 2
+                },
+                pool_size=5,
+                max_overflow=10
+            )
+        self.dialect = self.engine.dialect.name
+        # Identity/wallet lookups repeat within a round; writes from this process invalidate
+        self.cache = TTLCache(
+            maxsize=int(os.getenv('DB_CACHE_SIZE', 1024)),
+            ttl=int(os.getenv('DB_CACHE_TTL', 300))
         )
         self.setup_database()
 
@@ -65,35 +124,28 @@ class DatabaseManager:
     def setup_database(self):
         # Create tables using SQLAlchemy
         metadata = MetaData()
-        
-        # Define rewards table
-        self.rewards = Table(
-            'rewards', metadata,
-            Column('ID', Integer, primary_key=True, autoincrement=True),
-            Column('userid', String),
-            Column('wa', String),
-            Column('balance', Integer),
-            Column('reward', Integer),
-            Column('tx', String),
-            Column('date', Date),
-            Column('reward_round', Integer)
-        )
-
-        # Define waMap table
-        self.waMap = Table(
-            'waMap', metadata,
-            Column('ID', Integer, primary_key=True, autoincrement=True),
-            Column('platform', String),
-            Column('userID', String),
-            Column('username', String),
-            Column('wa', String),
-            Column('date', Date)
-        )
-
-        # Create tables
-        metadata.create_all(self.engine)
+        tables = telegram_tables(metadata)
+        self.rewards = tables['rewards']
+        self.round_counters = tables['round_counters']
+        self.waMap = tables['waMap']
+        self.waCurrent = tables['waCurrent']
+        self.rewardTotals = tables['rewardTotals']
+
+        # Create tables and indexes; a single version check when already current
+        migrate(self.engine, metadata, 'telegram')
+        # Pick up wallets inserted into waMap outside the bots
+        with self.engine.begin() as conn:
+            synced = sync_current_wallets(conn, self.dialect, 'telegram')
+        if synced:
+            logger.info(f"Synced {synced} new wallet registrations into waCurrent")
+
+    def close(self):
+        self.engine.dispose()
 
     def get_last_winner(self):
+        return self.cache.get_or_load(('last_winner',), self._load_last_winner)
+
+    def _load_last_winner(self):
         with Session(self.engine) as session:
             query = select(self.rewards.c.userid)\
                 .order_by(desc(self.rewards.c.date), desc(self.rewards.c.reward_round))\
@@ -102,79 +154,236 @@ class DatabaseManager:
             return result[0] if result else None
 
     def get_latest_wa(self, identifier, value):
+        key = ('wa', 'userID' if identifier == 'userID' else 'username', str(value))
+        return self.cache.get_or_load(key, lambda: self._load_latest_wa(identifier, value))
+
+    def _load_latest_wa(self, identifier, value):
+        # Primary-key read on the compacted table instead of sorting the user's waMap history
+        with Session(self.engine) as session:
+            query = select(self.waCurrent.c.wa).where(
+                self.waCurrent.c.platform == PLATFORM,
+                self.waCurrent.c.id_type == ('userID' if identifier == 'userID' else 'username'),
+                self.waCurrent.c.user_key == str(value)
+            )
+            result = session.execute(query).first()
+            return result[0] if result else None
+
+    def get_username(self, userid):
+        """Latest registered username for a Telegram userID, or None."""
+        return self.cache.get_or_load(('username', str(userid)), lambda: self._load_identity(
+            self.waMap.c.username, self.waMap.c.userID, str(userid)
+        ))
+
+    def get_userid(self, username):
+        """Latest registered Telegram userID for a username, or None."""
+        return self.cache.get_or_load(('userID', username), lambda: self._load_identity(
+            self.waMap.c.userID, self.waMap.c.username, username
+        ))
+
+    def _load_identity(self, wanted, column, value):
+        # Seeks ix_waMap_userID / ix_waMap_username and reads the newest row
         with Session(self.engine) as session:
-            column = self.waMap.c.userID if identifier == 'userID' else self.waMap.c.username
-            query = select(self.waMap.c.wa)\
+            query = select(wanted)\
                 .where(column == value)\
                 .order_by(desc(self.waMap.c.ID))\
                 .limit(1)
             result = session.execute(query).first()
             return result[0] if result else None
 
+    def invalidate_user(self, userid=None, username=None):
+        """Drop cached wallet/identity entries after this process writes waMap for a user."""
+        keys = []
+        if userid is not None:
+            keys += [('wa', 'userID', str(userid)), ('username', str(userid))]
+        if username is not None:
+            keys += [('wa', 'username', username), ('userID', username)]
+        self.cache.invalidate(*keys)
+
+    def _allocate_round(self, session):
+        # Single atomic increment on the counter row; the row lock serialises concurrent runs
+        if self.dialect == 'mssql':
+            stmt = text("UPDATE round_counters SET value = value + 1 OUTPUT inserted.value WHERE name = 'rewards'")
+        else:
+            stmt = text("UPDATE round_counters SET value = value + 1 WHERE name = 'rewards' RETURNING value")
+        return session.execute(stmt).scalar_one()
+
+    def allocate_reward_round(self):
+        """Reserve the next reward round number.
+
+        Every call returns a distinct round, also across overlapping runs.
+        """
+        with Session(self.engine) as session:
+            reward_round = self._allocate_round(session)
+            session.commit()
+            return reward_round
+
     def get_next_reward_round(self):
+        """Peek at the round the next allocation will return, without reserving it."""
         with Session(self.engine) as session:
-            query = select(self.rewards.c.reward_round)\
-                .order_by(desc(self.rewards.c.reward_round))\
-                .limit(1)
+            query = select(self.round_counters.c.value)\
+                .where(self.round_counters.c.name == 'rewards')
             result = session.execute(query).first()
             return (result[0] if result else 0) + 1
 
     def add_reward_entry(self, userid, reward_round=None, wa=None, balance=None, reward=None, tx=None):
+        """Write one ledger entry in a single statement / round trip.
+
+        With ``tx`` set this only stamps the transaction hash on the existing
+        (reward_round, userid) row. Otherwise the row is upserted: MERGE on
+        MSSQL, INSERT ... ON CONFLICT on SQLite. A missing ``reward_round`` is
+        allocated from the round counter in the same transaction.
+        """
+        current_date = datetime.now().date()
         with Session(self.engine) as session:
-            current_date = datetime.now().date()
-            if not reward_round:
-                reward_round = self.get_next_reward_round()
-    
             try:
                 if tx:
-                    # Update existing entry with transaction hash
-                    stmt = update(self.rewards).where(
-                        (self.rewards.c.reward_round == reward_round) & 
-                        (self.rewards.c.userid == userid)
-                    ).values(tx=tx)
-                    session.execute(stmt)
+                    # Update existing entry with transaction hash; a first tx marks the reward paid
+                    params = {'tx': tx, 'reward_round': reward_round, 'userid': userid}
+                    if self.dialect == 'mssql':
+                        paid = session.execute(text(
+                            "UPDATE rewards SET tx = :tx "
+                            "OUTPUT inserted.userid, inserted.reward, inserted.date, deleted.tx "
+                            "WHERE reward_round = :reward_round AND userid = :userid"
+                        ), params).all()
+                    else:
+                        paid = session.execute(text(
+                            "SELECT userid, reward, date, tx FROM rewards WHERE reward_round = :reward_round AND userid = :userid"
+                        ), params).all()
+                        session.execute(text("UPDATE rewards SET tx = :tx WHERE reward_round = :reward_round AND userid = :userid"), params)
+                    for paid_user, paid_reward, paid_date, previous_tx in paid:
+                        if previous_tx is None and paid_reward:
+                            self._add_to_totals(session, paid_user, paid_reward, paid_date)
                 else:
-                    # Check if entry exists for this reward round and user
-                    query = select(self.rewards.c.ID).where(
-                        (self.rewards.c.reward_round == reward_round) & 
-                        (self.rewards.c.userid == userid)
-                    )
-                    existing = session.execute(query).first()
-    
-                    if existing:
-                        # Update existing entry
-                        stmt = update(self.rewards).where(
-                            (self.rewards.c.reward_round == reward_round) & 
-                            (self.rewards.c.userid == userid)
-                        ).values(
-                            wa=wa,
-                            balance=balance,
-                            reward=reward,
-                            date=current_date
-                        )
-                        session.execute(stmt)
+                    if not reward_round:
+                        reward_round = self._allocate_round(session)
+                    params = {
+                        'userid': userid,
+                        'reward_round': reward_round,
+                        'wa': wa,
+                        'balance': balance,
+                        'reward': reward,
+                        'date': current_date
+                    }
+                    if self.dialect == 'mssql':
+                        reward_round = session.execute(self._merge_reward_stmt(), params).scalar_one()
                     else:
-                        # Create new entry
-                        stmt = insert(self.rewards).values(
-                            userid=userid,
-                            wa=wa,
-                            balance=balance,
-                            reward=reward,
-                            tx=tx,
-                            date=current_date,
-                            reward_round=reward_round
-                        )
-                        result = session.execute(stmt)
+                        reward_round = session.execute(self._upsert_reward_stmt(), params).scalar_one()
     
                 session.commit()
+                self.cache.invalidate(('last_winner',))
                 return reward_round
             except Exception as e:
                 session.rollback()
                 raise
 
+    def _merge_reward_stmt(self):
+        # HOLDLOCK keeps the match/insert decision atomic under concurrent runs
+        return text("""
+            MERGE rewards WITH (HOLDLOCK) AS target
+            USING (
+                SELECT :userid AS userid,
+                       :reward_round AS reward_round
+            ) AS source
+            ON target.reward_round = source.reward_round AND target.userid = source.userid
+            WHEN MATCHED THEN
+                UPDATE SET wa = :wa, balance = :balance, reward = :reward, date = :date
+            WHEN NOT MATCHED THEN
+                INSERT (userid, wa, balance, reward, tx, date, reward_round)
+                VALUES (source.userid, :wa, :balance, :reward, NULL, :date, source.reward_round)
+            OUTPUT inserted.reward_round;
+        """)
+
+    def _upsert_reward_stmt(self):
+        return text("""
+            INSERT INTO rewards (userid, wa, balance, reward, tx, date, reward_round)
+            VALUES (:userid, :wa, :balance, :reward, NULL, :date, :reward_round)
+            ON CONFLICT (reward_round, userid) DO UPDATE SET
+                wa = excluded.wa,
+                balance = excluded.balance,
+                reward = excluded.reward,
+                date = excluded.date
+            RETURNING reward_round
+        """)
+
+    def _add_to_totals(self, session, user, reward, paid_date):
+        # Runs inside the ledger write's transaction, so totals and ledger never diverge
+        paid_date = paid_date or datetime.now().date()
+        rows = [
+            {'period': period, 'user': user, 'reward': reward, 'date': paid_date}
+            for period in ('all', str(paid_date)[:7])
+        ]
+        if self.dialect == 'mssql':
+            stmt = text("""
+                MERGE rewardTotals WITH (HOLDLOCK) AS target
+                USING (SELECT :period AS period, :user AS userid) AS source
+                ON target.period = source.period AND target.userid = source.userid
+                WHEN MATCHED THEN
+                    UPDATE SET total_reward = target.total_reward + :reward,
+                               reward_count = target.reward_count + 1,
+                               last_date = CASE WHEN target.last_date > :date THEN target.last_date ELSE :date END
+                WHEN NOT MATCHED THEN
+                    INSERT (period, userid, total_reward, reward_count, last_date)
+                    VALUES (:period, :user, :reward, 1, :date);
+            """)
+        else:
+            stmt = text("""
+                INSERT INTO rewardTotals (period, userid, total_reward, reward_count, last_date)
+                VALUES (:period, :user, :reward, 1, :date)
+                ON CONFLICT (period, userid) DO UPDATE SET
+                    total_reward = total_reward + excluded.total_reward,
+                    reward_count = reward_count + 1,
+                    last_date = MAX(last_date, excluded.last_date)
+            """)
+        session.execute(stmt, rows)
+
+    def get_leaderboard(self, period='all', limit=10):
+        """Top earners for ``period`` ('all' or 'YYYY-MM') as (userid, total_reward, reward_count) rows."""
+        with Session(self.engine) as session:
+            query = select(
+                self.rewardTotals.c.userid,
+                self.rewardTotals.c.total_reward,
+                self.rewardTotals.c.reward_count
+            ).where(
+                self.rewardTotals.c.period == period
+            ).order_by(
+                desc(self.rewardTotals.c.total_reward)
+            ).limit(limit)
+            return session.execute(query).fetchall()
+
+    def get_user_totals(self, userid):
+        """All-time and per-month (period, total_reward, reward_count, last_date) rows for one user."""
+        with Session(self.engine) as session:
+            query = select(
+                self.rewardTotals.c.period,
+                self.rewardTotals.c.total_reward,
+                self.rewardTotals.c.reward_count,
+                self.rewardTotals.c.last_date
+            ).where(
+                self.rewardTotals.c.userid == str(userid)
+            ).order_by(
+                desc(self.rewardTotals.c.period)
+            )
+            return session.execute(query).fetchall()
+
+    def get_user_history(self, userid, limit=20):
+        """Most recent ledger rows for one user, newest round first."""
+        with Session(self.engine) as session:
+            query = select(
+                self.rewards.c.reward_round,
+                self.rewards.c.date,
+                self.rewards.c.reward,
+                self.rewards.c.wa,
+                self.rewards.c.tx
+            ).where(
+                self.rewards.c.userid == str(userid)
+            ).order_by(
+                desc(self.rewards.c.reward_round)
+            ).limit(limit)
+            return session.execute(query).fetchall()
+
     def add_pending_reward(self, userid):
         with Session(self.engine) as session:
-            reward_round = self.get_next_reward_round()
+            reward_round = self._allocate_round(session)
             current_date = datetime.now().date()
             
             stmt = self.rewards.insert().values(
@@ -184,6 +393,7 @@ class DatabaseManager:
             )
             session.execute(stmt)
             session.commit()
+            self.cache.invalidate(('last_winner',))
             return reward_round
 
     def get_pending_rewards(self):
@@ -203,13 +413,66 @@ class DatabaseManager:
             results = session.execute(query).fetchall()
             return results
 
+    def get_settleable_rewards(self, userid=None):
+        """Pending rewards whose winner has since registered a wallet.
+
+        Joins each pending row to the user's current wallet in one query,
+        replacing a get_latest_wa() call per pending row. ``userid``
+        narrows it to one winner right after they register.
+        """
+        with Session(self.engine) as session:
+            query = select(
+                self.rewards.c.reward_round,
+                self.rewards.c.userid,
+                self.rewards.c.date,
+                self.waCurrent.c.wa
+            ).join(
+                self.waCurrent,
+                (self.waCurrent.c.platform == PLATFORM) &
+                (self.waCurrent.c.id_type == 'userID') &
+                (self.waCurrent.c.user_key == self.rewards.c.userid)
+            ).where(
+                self.rewards.c.wa.is_(None),
+                self.rewards.c.tx.is_(None),
+                self.waCurrent.c.wa.is_not(None)
+            ).order_by(
+                self.rewards.c.date.asc(),
+                self.rewards.c.reward_round.asc()
+            )
+            if userid is not None:
+                query = query.where(self.rewards.c.userid == str(userid))
+
+            results = session.execute(query).fetchall()
+            return results
+
+    def add_wallets(self, rows):
+        """Insert (platform, userID, username, wa, date) rows into waMap and waCurrent in one transaction."""
+        if not rows:
+            return 0
+        params = [
+            {'platform': platform, 'userID': userID, 'username': username, 'wa': wa, 'date': date_value}
+            for platform, userID, username, wa, date_value in rows
+        ]
+        with Session(self.engine) as session:
+            session.execute(self.waMap.insert(), params)
+            session.execute(
+                upsert_current_wallet_stmt(self.dialect, 'telegram'),
+                [current_row for row in rows for current_row in current_wallet_rows('telegram', *row)]
+            )
+            session.commit()
+        for _, userID, username, _, _ in rows:
+            self.invalidate_user(userid=userID, username=username)
+        return len(rows)
+
 
 class TelegramManager:
     def __init__(self):
         # User client credentials for getting messages
         self.api_id = os.getenv('TG_API_ID')
         self.api_hash = os.getenv('TG_API_HASH')
-        self.group_id = int(os.getenv('GROUP_IDPROD'))
+        # GROUP_IDS is a comma-separated list of chats to run rounds in; the first is the main group
+        self.group_ids = [int(g) for g in (os.getenv('GROUP_IDS') or os.getenv('GROUP_IDPROD')).split(',')]
+        self.group_id = self.group_ids[0]
         
         # Bot credentials for sending messages
         self.bot_token = os.getenv('BOT_TOKEN')
@@ -217,34 +480,168 @@ class TelegramManager:
         # Initialize both clients
         self.user_client = TelegramClient('user', self.api_id, self.api_hash)
         self.bot = Bot(token=self.bot_token)
+        self.outbox = SendQueue(self.bot)
+        self.archive = MessageArchive(ARCHIVE_DB)
+        self._started = False
+        # One bucket per group so a FloodWait on one chat does not hold up the others
+        self.buckets = {group_id: TokenBucket(FETCH_RATE, FETCH_BURST) for group_id in self.group_ids}
+
+        # userid -> username seen during this round, so announcements never refetch history
+        self.usernames = {}
+
+    async def start(self):
+        """Connect the user client once; it stays open until close() at the end of the round."""
+        if not self._started:
+            await self.user_client.start()
+            self._started = True
+
+    async def close(self):
+        # Let queued announcements go out before the process exits
+        await self.outbox.drain()
+        logger.info(f"Telegram send stats: {self.outbox.stats()}")
+        if self._started:
+            await self.user_client.disconnect()
+            self._started = False
+        self.prune_archive()
+        self.archive.close()
+
+    def prune_archive(self):
+        if not ARCHIVE_RETENTION_S:
+            return
+        removed = self.archive.prune(ARCHIVE_RETENTION_S)
+        if removed:
+            logger.info(f"Pruned {removed} archived messages past the retention window")
 
-    async def get_recent_messages(self, hours):
-        """Get messages using user account"""
-        await self.user_client.start()
-        messages = []
+    async def collect_windows(self, hours):
+        """Fetch every group's window concurrently, yielding (group_id, messages) as each one finishes.
+
+        A group whose fetch fails is logged and skipped; the others are still yielded.
+        """
+        await self.start()
+
+        async def fetch(group_id):
+            try:
+                return group_id, await self.get_recent_messages(hours, group_id)
+            except Exception as e:
+                return group_id, e
+
+        for done in asyncio.as_completed([fetch(group_id) for group_id in self.group_ids]):
+            group_id, result = await done
+            if isinstance(result, Exception):
+                logger.error(f"Failed to fetch window for group {group_id}: {result}")
+                continue
+            yield group_id, result
+
+    async def get_recent_messages(self, hours, group_id=None):
+        """Get a group's messages, retrying after FloodWait once the group's bucket allows it"""
+        group_id = group_id or self.group_id
+        bucket = self.buckets.setdefault(group_id, TokenBucket(FETCH_RATE, FETCH_BURST))
+        while True:
+            await bucket.acquire()
+            try:
+                return await self._fetch_window(hours, group_id)
+            except FloodWaitError as e:
+                logger.warning(f"FloodWait on group {group_id}, retrying in {e.seconds}s")
+                bucket.pause(e.seconds)
+
+    async def _fetch_window(self, hours, group_id):
+        """Get messages using user account
+
+        Syncs the local archive first: iter_messages walks newest first and
+        stops at the archive's last-seen id or the first message older than
+        the window, whichever comes first. The window is then read back
+        from the archive.
+        """
+        await self.start()
         hours_ago = datetime.now(timezone.utc) - timedelta(hours=hours)
-        
-        group = await self.user_client.get_entity(self.group_id)
-        async for message in self.user_client.iter_messages(group):
-            if message.date >= hours_ago:
-                messages.append({
-                    "username": message.sender.username if message.sender else None,
-                    "userid": message.sender_id,
-                    "text": message.text,
-                    "date": message.date.isoformat()
-                })
-        
-        await self.user_client.disconnect()
+        min_id = self.archive.sync_point(group_id, hours_ago)
+
+        fetched = MessageBatch()
+        attached = {}
+        contiguous = True
+        group = await self.user_client.get_entity(group_id)
+        async for message in self.user_client.iter_messages(group, min_id=min_id):
+            if message.date < hours_ago:
+                contiguous = False
+                break
+            # Only take senders that came with the response; never trigger a lookup per message
+            if message.sender is not None:
+                attached[message.sender_id] = getattr(message.sender, 'username', None)
+            fetched.append(message.id, message.sender_id, None, message.text, message.date, message.reply_to_msg_id)
+
+        usernames = await self.resolve_senders(fetched.senders(), attached)
+        fetched.usernames.update((userid, username) for userid, username in usernames.items() if username)
+        self.archive.add_messages(group_id, fetched, hours_ago, contiguous)
+
+        messages = self.archive.get_window(group_id, hours_ago)
+        self.remember_users(messages)
         return messages
 
-    async def send_message(self, message):
-        """Send message using bot account"""
-        try:
-            await self.bot.send_message(chat_id=self.group_id, text=message)
-            return True
-        except Exception as e:
-            print(f"Failed to send message: {e}")
-            return False
+    async def record_message(self, group_id, message):
+        """Archive one live message (listener mode) and return its sender's username."""
+        attached = {message.sender_id: getattr(message.sender, 'username', None)} if message.sender is not None else {}
+        usernames = await self.resolve_senders([message.sender_id], attached) if message.sender_id is not None else {}
+        entry = MessageBatch()
+        entry.append(
+            message.id, message.sender_id, usernames.get(message.sender_id), message.text, message.date, message.reply_to_msg_id
+        )
+        # Stored without touching sync_state: live events can skip messages across a reconnect, so only
+        # a history fetch may advance last_id, and the next one picks up anything that was missed
+        self.archive.add_messages(group_id, entry)
+        self.remember_users(entry)
+        return usernames.get(message.sender_id)
+
+    async def resolve_senders(self, userids, attached=None):
+        """Usernames for a window's distinct senders, resolved in batches and cached in the archive.
+
+        Entities that arrived with the messages refresh the cache for free.
+        Only ids that are neither attached nor cached within USER_REFRESH_S
+        are fetched, ENTITY_BATCH_SIZE per get_entity call.
+        """
+        attached = attached or {}
+        if attached:
+            self.archive.set_users(attached)
+        usernames = self.archive.get_users(userids, max_age=USER_REFRESH_S)
+        missing = [userid for userid in userids if userid not in usernames]
+
+        resolved = {}
+        for i in range(0, len(missing), ENTITY_BATCH_SIZE):
+            batch = missing[i:i + ENTITY_BATCH_SIZE]
+            try:
+                entities = await self.user_client.get_entity(batch)
+            except ValueError as e:
+                # An id Telethon has never seen fails the whole batch; keep whatever is cached
+                logger.warning(f"Could not resolve {len(batch)} senders: {e}")
+                continue
+            resolved.update((get_peer_id(entity), getattr(entity, 'username', None)) for entity in entities)
+        if resolved:
+            self.archive.set_users(resolved)
+            usernames.update(resolved)
+
+        # Stale entries are still better than nothing when a refresh failed
+        stale = [userid for userid in missing if userid not in usernames]
+        if stale:
+            usernames.update(self.archive.get_users(stale))
+        return usernames
+
+    def remember_users(self, messages):
+        for userid, username in messages.usernames.items():
+            self.usernames.setdefault(userid, username)
+
+    async def get_username(self, userid, db_manager):
+        """Username for a userid from this round's messages or the sender cache, falling back to waMap."""
+        username = self.usernames.get(int(userid))
+        if username is None:
+            username = self.archive.get_users([int(userid)]).get(int(userid))
+        if username is None:
+            username = await db_manager.get_username(userid)
+            if username:
+                self.usernames[int(userid)] = username
+        return username
+
+    async def send_message(self, message, chat_id=None):
+        """Send a message from the bot account through the rate-limited outbox; returns True once delivered"""
+        return await self.outbox.put(chat_id or self.group_id, message)
 
 
 class Web3Manager:
@@ -305,45 +702,73 @@ def calculate_reward(total_reward=250000, amount_held=250000, tokens_held=0):
     else:
         return int(total_reward * (0.2 + (tokens_held / amount_held) * 0.8))
 
-def get_most_engaging_member(messages, excluded_users):
+async def select_winner(messages, excluded_users):
+    """Winner from the local engagement scorer; the LLM only breaks near-ties between the top few"""
+    candidates = top_candidates(messages, excluded_users, TIEBREAK_CANDIDATES, TIE_MARGIN)
+    if not candidates:
+        return None
+    if len(candidates) > 1 and LLM_TIEBREAK:
+        answer = await get_most_engaging_member(messages, excluded_users, candidates)
+        try:
+            choice = int(answer)
+            if choice in candidates:
+                return str(choice)
+            logger.warning(f"Tie-breaker returned {choice}, not one of {candidates}")
+        except (TypeError, ValueError):
+            logger.warning(f"Tie-breaker gave no usable userid ({answer!r}), keeping the top scorer")
+    return str(candidates[0])
+
+async def get_most_engaging_member(messages, excluded_users, candidates=None):
+    """gpt-4's pick as a string, or None when the call failed or timed out"""
     openai.api_key = os.getenv('OPENAI_API_KEY')
     
-    conversation_history = ""
-    for message in messages[:100]:  # Limit to last 100 messages
-        if message['text']:
-            conversation_history += f"{message['userid']}: {message['text']}\n"
+    # Whole window, deduplicated and clipped to the token budget
+    conversation_history, stats = pack_conversation(messages, LLM_PROMPT_BUDGET)
+    logger.info(f"LLM prompt: {stats['messages_included']}/{stats['messages_with_text']} messages, {stats['tokens']} tokens")
 
     # Convert excluded_users list to string
     excluded_users_str = ', '.join(map(str, excluded_users))
+    candidates_str = f"\nYou must choose one of these userids: ({', '.join(map(str, candidates))})" if candidates else ""
     
-    response = openai.ChatCompletion.create(
+    answer = await LLM.complete(
         model="gpt-4",
         messages=[
             {"role": "system", "content": f"You are a helpful assistant. Only provide a single number as the userid and nothing more. The following users cannot win and you cannot return these userids: ({excluded_users_str})"},
-            {"role": "user", "content": f"Given the following conversation history, identify the most engaging member by returning their ID:\n\n{conversation_history}\nThe following users cannot win and you cannot return these userids: ({excluded_users_str})"}
+            {"role": "user", "content": f"Given the following conversation history, identify the most engaging member by returning their ID:\n\n{conversation_history}\nThe following users cannot win and you cannot return these userids: ({excluded_users_str}){candidates_str}"}
         ],
         max_tokens=50,
         temperature=0.5
     )
     
-    return response.choices[0].message['content'].strip()
+    return answer.strip() if answer is not None else None
+
+# Rounds and DM registrations can both settle; one at a time so a pending reward is never paid twice
+SETTLEMENT_LOCK = asyncio.Lock()
+# Transfers leave the event loop while they confirm; one at a time so two never take the same nonce
+TRANSFER_LOCK = asyncio.Lock()
+
+async def send_reward(web3_manager, wallet_address, amount):
+    """``send_gmetis`` on a worker thread, so polling, listening and the LLM keep running while it confirms"""
+    async with TRANSFER_LOCK:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, web3_manager.send_gmetis, wallet_address, amount
+        )
+
+async def process_pending_rewards(db_manager, tg_manager, web3_manager, userid=None):
+    """Process all pending rewards where wallet address is now available (only ``userid``'s when given)"""
+    async with SETTLEMENT_LOCK:
+        await _settle_pending_rewards(db_manager, tg_manager, web3_manager, userid)
 
-async def process_pending_rewards(db_manager, tg_manager, web3_manager):
-    """Process all pending rewards where wallet address is now available"""
-    pending_rewards = db_manager.get_pending_rewards()
+async def _settle_pending_rewards(db_manager, tg_manager, web3_manager, userid):
+    settleable_rewards = await db_manager.get_settleable_rewards(userid)
     
-    for reward_round, userid, date in pending_rewards:
-        # Check if wallet address is now available
-        wallet_address = db_manager.get_latest_wa('userID', userid)
-        if not wallet_address:
-            continue
-            
+    for reward_round, userid, date, wallet_address in settleable_rewards:
         # Get balance and calculate reward
         balance = web3_manager.get_gmetis_balance(wallet_address)
         reward_amount = calculate_reward(TOTAL_REWARD, AMOUNT_HELD, balance)
         
         # Update the existing reward entry with wallet and balance
-        db_manager.add_reward_entry(
+        await db_manager.add_reward_entry(
             userid=userid,
             wa=wallet_address,
             balance=balance,
@@ -352,19 +777,17 @@ async def process_pending_rewards(db_manager, tg_manager, web3_manager):
         )
         
         # Send reward
-        tx_hash = web3_manager.send_gmetis(wallet_address, reward_amount)
+        tx_hash = await send_reward(web3_manager, wallet_address, reward_amount)
         
         # Update with transaction hash
-        db_manager.add_reward_entry(
+        await db_manager.add_reward_entry(
             userid=userid,
             tx=tx_hash,
             reward_round=reward_round
         )
         
         # Get username for notification
-        messages = await tg_manager.get_recent_messages(24)  # Look in last 24h to find username
-        user_info = next((m for m in messages if str(m['userid']) == str(userid)), None)
-        username = user_info['username'] if user_info else str(userid)
+        username = await tg_manager.get_username(userid, db_manager) or str(userid)
         
         # Send retrospective reward announcement
         await tg_manager.send_message(
@@ -377,98 +800,201 @@ async def process_pending_rewards(db_manager, tg_manager, web3_manager):
             f"🚀 Better late than never! Keep vibing! 🚀"
         )
 
-async def main():
-
+async def run_round(db_manager, tg_manager, web3_manager, group_id, messages):
+    """Pick and pay one group's winner from that group's window"""
+    # 2. Handle quiet period
+    if not messages:
+        await tg_manager.send_message("It's awfully quiet here. Anyone is vibing? 🎵", group_id)
+        return
     
-    # Initialize managers
-    db_manager = DatabaseManager()
-    tg_manager = TelegramManager()
-    web3_manager = Web3Manager()
+    # 3. Select winner and start reward process
+    winner_id = await select_winner(messages, EXCLUDED_USERS)
+    # Winners are announced by @username; live windows may not have resolved every sender yet
+    winner_username = messages.username(winner_id) or (
+        await tg_manager.get_username(winner_id, db_manager) if winner_id else None
+    )
     
-    try:
-        # Get last winner and add to excluded users
-        last_winner = db_manager.get_last_winner()
-        if last_winner:
-            EXCLUDED_USERS.append(int(last_winner))
+    if not messages.has_user(winner_id) or not winner_username:
+        logger.error("Winner not found in messages")
+        #await tg_manager.send_message("Seems like we don't have much of a crowd here huh? ")
+        return
+        return
+
+    await reward_winner(db_manager, tg_manager, web3_manager, group_id, winner_id, winner_username)
+
+async def reward_winner(db_manager, tg_manager, web3_manager, group_id, winner_id, winner_username):
+    """Pay one round's winner, or record the reward as pending until they register, and announce it"""
+    # 4. Get wallet address for current winner
+    wallet_address = await db_manager.get_latest_wa('userID', winner_id)
+
+    if not wallet_address:
+        # Add pending reward entry
+        reward_round = await db_manager.add_pending_reward(winner_id)
         
-        # 1. Get recent messages
-        messages = await tg_manager.get_recent_messages(WINDOW_IN_H)
+        # Notify user to register wallet
+        await tg_manager.send_message(
+            f"🎯 Reward Round #{reward_round}\n\n"
+            f"🎉 Congratulations @{winner_username}! 🎉\n"
+            f"✨ You've been selected for a reward! \n"
+            f"📝 Please message @gMetisL2 with /register <your wallet address>.\n"
+            f"💫 Your reward will be processed automatically once registered!",
+            group_id
+        )
+    else:
+        # Process current winner's reward
+        balance = web3_manager.get_gmetis_balance(wallet_address)
+        reward_amount = calculate_reward(TOTAL_REWARD, AMOUNT_HELD, balance)
         
-        # Save messages to file
-        with open('messages_lh.json', 'w', encoding='utf-8') as f:
-            json.dump(messages, f, ensure_ascii=False, indent=4)
+        # Create/update reward entry
+        reward_round = await db_manager.add_reward_entry(
+            userid=winner_id,
+            wa=wallet_address,
+            balance=balance,
+            reward=reward_amount
+        )
         
-        # 2. Handle quiet period
-        if not messages:
-            await tg_manager.send_message("It's awfully quiet here. Anyone is vibing? 🎵")
-            return
+        # Send reward
+        tx_hash = await send_reward(web3_manager, wallet_address, reward_amount)
         
-        # 3. Select winner and start reward process
-        winner_id = get_most_engaging_member(messages, EXCLUDED_USERS)
-        winner_info = next((m for m in messages if str(m['userid']) == str(winner_id)), None)
+        # Update with transaction hash
+        await db_manager.add_reward_entry(
+            userid=winner_id,
+            tx=tx_hash,
+            reward_round=reward_round
+        )
         
-        if not winner_info or winner_info['username']==None or winner_info['username']=="None":
-            logger.error("Winner not found in messages")
-            #await tg_manager.send_message("Seems like we don't have much of a crowd here huh? ")
+        # Send current round winner announcement
+        await tg_manager.send_message(
+            f"🎯 Reward Round #{reward_round}\n\n"
+            f"🎉 Congratulations @{winner_username}! 🎉\n"
+            f"✨ Thank you for vibing with us! \n"
+            f"🎁 You've received {reward_amount} gMetis! \n"
+            f"🔗 Transaction: https://andromeda-explorer.metis.io/tx/0x{tx_hash}\n\n"
+            f"🚀 Keep shining and stay awesome! 🚀",
+            group_id
+        )
+
+async def run_listen_round(db_manager, tg_manager, web3_manager, group_id, counter):
+    """Score a live EngagementCounter's window exactly like a polled one; nothing is downloaded when the round fires"""
+    logger.info(f"Group {group_id} message counts: {counter.leaderboard(excluded=EXCLUDED_USERS)}")
+    await run_round(db_manager, tg_manager, web3_manager, group_id, counter.window())
+
+async def listen(db_manager, tg_manager, web3_manager, registrar):
+    """Long-running mode: keep engagement counters live from NewMessage events and fire a round every ROUND_INTERVAL_S"""
+    window_s = WINDOW_IN_H * 3600
+    counters = {}
+
+    # Catch the archive up once; counters resume from their snapshot and replay only what came after it
+    async for group_id, messages in tg_manager.collect_windows(WINDOW_IN_H):
+        snapshot = tg_manager.archive.load_snapshot(group_id)
+        counter = EngagementCounter.restore(snapshot, window_s) if snapshot else None
+        # An older snapshot format is dropped and the window rebuilt from the archive
+        resume_from = snapshot['taken_at'] if counter else 0
+        counter = counter or EngagementCounter(window_s)
+        for (msg_id, userid, text, ts), reply_to in reversed(list(zip(messages, messages.reply_to))):
+            if ts > resume_from and userid != NO_SENDER:
+                counter.add(userid, messages.username(userid), ts, text, msg_id, reply_to or None)
+        counters[group_id] = counter
+
+    async def on_new_message(event):
+        counter = counters.get(event.chat_id)
+        if counter is None:
             return
+        username = await tg_manager.record_message(event.chat_id, event.message)
+        if event.message.sender_id is not None:
+            counter.add(
+                event.message.sender_id, username, event.message.date.timestamp(), event.message.text,
+                event.message.id, event.message.reply_to_msg_id
+            )
+
+    tg_manager.user_client.add_event_handler(on_new_message, events.NewMessage(chats=list(counters)))
+    registrations = asyncio.create_task(registrar.run())
+    logger.info(f"Listening to {len(counters)} groups")
+
+    next_round = time.monotonic() + ROUND_INTERVAL_S
+    try:
+        while True:
+            await asyncio.sleep(SNAPSHOT_INTERVAL_S)
+            for group_id, counter in counters.items():
+                tg_manager.archive.save_snapshot(group_id, counter.snapshot())
+            if time.monotonic() < next_round:
+                continue
+            next_round += ROUND_INTERVAL_S
+
+            last_winner = await db_manager.get_last_winner()
+            if last_winner and int(last_winner) not in EXCLUDED_USERS:
+                EXCLUDED_USERS.append(int(last_winner))
+
+            tg_manager.prune_archive()
+            for group_id, counter in counters.items():
+                # One failed payout or DB call must not end the listener
+                try:
+                    await run_listen_round(db_manager, tg_manager, web3_manager, group_id, counter)
+                except Exception as e:
+                    logger.error(f"Round for group {group_id} failed: {e}")
+            try:
+                await process_pending_rewards(db_manager, tg_manager, web3_manager)
+            except Exception as e:
+                logger.error(f"Settling pending rewards failed: {e}")
+    finally:
+        registrations.cancel()
+        tg_manager.user_client.remove_event_handler(on_new_message)
+        for group_id, counter in counters.items():
+            tg_manager.archive.save_snapshot(group_id, counter.snapshot())
+
+async def main():
+
+    
+    # Initialize managers
+    if os.getenv('SQLITE_DB'):
+        # Local runs and replays against a gmetis.db file
+        db_manager = await AsyncDatabaseManager.create(SQLiteDatabaseManager, os.getenv('SQLITE_DB'))
+    else:
+        db_manager = await AsyncDatabaseManager.create(DatabaseManager)
+    tg_manager = TelegramManager()
+    web3_manager = Web3Manager()
+    
+    try:
+        # Wallets DMed to the bot are registered (and their pending rounds settled) straight away
+        registrar = WalletRegistrar(
+            tg_manager.bot, db_manager, tg_manager.send_message,
+            lambda userid: process_pending_rewards(db_manager, tg_manager, web3_manager, userid)
+        )
+        if '--listen' in sys.argv:
+            await listen(db_manager, tg_manager, web3_manager, registrar)
             return
-        
-        # 4. Get wallet address for current winner
-        wallet_address = db_manager.get_latest_wa('userID', winner_id)
-        reward_round = db_manager.get_next_reward_round()
+        await registrar.drain()
+
+        # 1. Get recent messages for every group while the last winner is looked up
+        last_winner_task = asyncio.ensure_future(db_manager.get_last_winner())
+
+        # Each group's round starts as soon as its own window has been fetched
+        async for group_id, messages in tg_manager.collect_windows(WINDOW_IN_H):
+            # Add last winner to excluded users
+            last_winner = await last_winner_task
+            if last_winner and int(last_winner) not in EXCLUDED_USERS:
+                EXCLUDED_USERS.append(int(last_winner))
+
+            # A failed round in one group must not cost the remaining groups theirs
+            try:
+                await run_round(db_manager, tg_manager, web3_manager, group_id, messages)
+            except Exception as e:
+                logger.error(f"Round for group {group_id} failed: {e}")
 
-        if not wallet_address:
-            # Add pending reward entry
-            reward_round = db_manager.add_pending_reward(winner_id)
-            
-            # Notify user to register wallet
-            await tg_manager.send_message(
-                f"🎯 Reward Round #{reward_round}\n\n"
-                f"🎉 Congratulations @{winner_info['username']}! 🎉\n"
-                f"✨ You've been selected for a reward! \n"
-                f"📝 Please message @gMetisL2 to register your wallet address.\n"
-                f"💫 Your reward will be processed automatically once registered!"
-            )
-        else:
-            # Process current winner's reward
-            balance = web3_manager.get_gmetis_balance(wallet_address)
-            reward_amount = calculate_reward(TOTAL_REWARD, AMOUNT_HELD, balance)
-            
-            # Create/update reward entry
-            reward_round = db_manager.add_reward_entry(
-                userid=winner_id,
-                wa=wallet_address,
-                balance=balance,
-                reward=reward_amount,
-                reward_round=reward_round
-            )
-            
-            # Send reward
-            tx_hash = web3_manager.send_gmetis(wallet_address, reward_amount)
-            
-            # Update with transaction hash
-            db_manager.add_reward_entry(
-                userid=winner_id,
-                tx=tx_hash,
-                reward_round=reward_round
-            )
-            
-            # Send current round winner announcement
-            await tg_manager.send_message(
-                f"🎯 Reward Round #{reward_round}\n\n"
-                f"🎉 Congratulations @{winner_info['username']}! 🎉\n"
-                f"✨ Thank you for vibing with us! \n"
-                f"🎁 You've received {reward_amount} gMetis! \n"
-                f"🔗 Transaction: https://andromeda-explorer.metis.io/tx/0x{tx_hash}\n\n"
-                f"🚀 Keep shining and stay awesome! 🚀"
-            )
-            
         # 5. Process any pending rewards after current round
         await process_pending_rewards(db_manager, tg_manager, web3_manager)
         
     except Exception as e:
         logger.error(f"Error in main process: {str(e)}")
         raise
+    finally:
+        cache = getattr(db_manager, 'cache', None)
+        if cache is not None:
+            logger.info(f"DB cache stats: {cache.stats()}")
+        logger.info(f"LLM stats: {LLM.stats()}")
+        LLM.close()
+        await tg_manager.close()
+        db_manager.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
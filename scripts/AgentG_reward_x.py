@@ -9,15 +9,22 @@ from web3 import Web3
 import openai
 import tweepy
 
-from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, Date, select, desc, update, insert
+from sqlalchemy import create_engine, MetaData, Table, Column, Integer, BigInteger, String, Date, select, desc, update, insert, text, func, event
 from sqlalchemy.orm import Session
 from tenacity import retry, stop_after_attempt, wait_exponential
 
+from db_migrations import migrate, sync_current_wallets
+from sqlite_db import PRAGMAS
+from async_db import AsyncDatabaseManager
+from ttl_cache import TTLCache
+from announcement_pool import AnnouncementPool
+
 
 # global constants
 WINDOW_IN_H = 24
 TOTAL_REWARD = 10
 AMOUNT_HELD = 100
+PLATFORM = 'twitter'  # waMap.platform value for this bot's registrations
 BOT_USERNAME = os.getenv('BOT_USERNAME')
 EXCLUDED_USERS = ["user1", "user2"]  # Usernames instead of IDs
 
@@ -34,25 +41,50 @@ load_dotenv()
 # Import OpenAI
 openai.api_key = os.getenv('OPENAI_API_KEY')
 
+# Announcements come from a pool of reviewed rephrasings (scripts/announcement_variants.json),
+# refreshed offline with scripts/announcement_pool.py generate / export
+ANNOUNCEMENTS = AnnouncementPool(os.getenv('ANNOUNCEMENT_DB', 'announcements.db'))
+ANNOUNCEMENTS.seed()
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    for pragma in PRAGMAS:
+        dbapi_connection.execute(pragma)
+
 class DatabaseManager:
-    def __init__(self):
-        server = os.getenv('AZURE_SQL_SERVER')
-        database = os.getenv('AZURE_SQL_DATABASE')
-        username = os.getenv('AZURE_SQL_USERNAME')
-        password = os.getenv('AZURE_SQL_PASSWORD')
+    def __init__(self, connection_string=None):
+        if connection_string is None:
+            server = os.getenv('AZURE_SQL_SERVER')
+            database = os.getenv('AZURE_SQL_DATABASE')
+            username = os.getenv('AZURE_SQL_USERNAME')
+            password = os.getenv('AZURE_SQL_PASSWORD')
+            connection_string = f'mssql+pyodbc://{username}:{password}@{server}/{database}?driver=ODBC+Driver+18+for+SQL+Server'
         
-        self.connection_string = f'mssql+pyodbc://{username}:{password}@{server}/{database}?driver=ODBC+Driver+18+for+SQL+Server'
+        self.connection_string = connection_string
         
-        # Add retry logic and longer timeout
-        self.engine = create_engine(
-            self.connection_string,
-            connect_args={
-                'timeout': 300,  # Increase timeout to 5 minutes
-                'retry_with_backoff': True,
-                'backoff_factor': 2
-            },
-            pool_size=5,
-            max_overflow=10
+        if self.connection_string.startswith('sqlite'):
+            # Local runs and replays against gmetisx.db; pooled connections stay open
+            self.engine = create_engine(
+                self.connection_string,
+                connect_args={'cached_statements': 256}
+            )
+            event.listen(self.engine, 'connect', _apply_sqlite_pragmas)
+        else:
+            # Add retry logic and longer timeout
+            self.engine = create_engine(
+                self.connection_string,
+                connect_args={
+                    'timeout': 300,  # Increase timeout to 5 minutes
+                    'retry_with_backoff': True,
+                    'backoff_factor': 2
+                },
+                pool_size=5,
+                max_overflow=10
+            )
+        self.dialect = self.engine.dialect.name
+        # Identity/wallet lookups repeat within a round; writes from this process invalidate
+        self.cache = TTLCache(
+            maxsize=int(os.getenv('DB_CACHE_SIZE', 1024)),
+            ttl=int(os.getenv('DB_CACHE_TTL', 300))
         )
         self.setup_database()
 
@@ -65,30 +97,68 @@ class DatabaseManager:
         self.rewards = Table(
             'xrewards', metadata,
             Column('ID', Integer, primary_key=True, autoincrement=True),
-            Column('username', String),  # Using username instead of userid
+            Column('username', String(64)),  # Using username instead of userid
             Column('post_id', String),
-            Column('wa', String),
+            Column('wa', String(128)),
             Column('balance', Integer),
             Column('reward', Integer),
-            Column('tx', String),
+            Column('tx', String(128)),
             Column('date', Date),
             Column('reward_round', Integer)
         )
 
+        # Define round_counters table (one row per rewards table)
+        self.round_counters = Table(
+            'round_counters', metadata,
+            Column('name', String(32), primary_key=True),
+            Column('value', Integer, nullable=False)
+        )
+
         # Define xwaMap table
         self.waMap = Table(
             'xwaMap', metadata,
             Column('ID', Integer, primary_key=True, autoincrement=True),
             Column('platform', String),
-            Column('username', String),  # Using username as identifier
-            Column('wa', String),
+            Column('username', String(64)),  # Using username as identifier
+            Column('wa', String(128)),
+            Column('date', Date)
+        )
+
+        # Define xwaCurrent table (latest wallet per user, maintained on every waMap insert)
+        self.waCurrent = Table(
+            'xwaCurrent', metadata,
+            Column('platform', String(32), primary_key=True),
+            Column('id_type', String(16), primary_key=True),  # 'username'
+            Column('user_key', String(64), primary_key=True),
+            Column('wa', String(128)),
             Column('date', Date)
         )
 
-        # Create tables if they don't exist
-        metadata.create_all(self.engine)
+        # Define xrewardTotals table (paid gMetis per user, all time and per month)
+        self.rewardTotals = Table(
+            'xrewardTotals', metadata,
+            Column('period', String(7), primary_key=True),  # 'all' or 'YYYY-MM'
+            Column('username', String(64), primary_key=True),
+            Column('total_reward', BigInteger, nullable=False),
+            Column('reward_count', Integer, nullable=False),
+            Column('last_date', Date)
+        )
+
+        # Create tables and indexes; a single version check when already current
+        migrate(self.engine, metadata, 'x')
+        # Pick up wallets inserted into xwaMap outside the bots
+        with self.engine.begin() as conn:
+            synced = sync_current_wallets(conn, self.dialect, 'x')
+        if synced:
+            logger.info(f"Synced {synced} new wallet registrations into xwaCurrent")
+
+    def close(self):
+        self.engine.dispose()
 
     def get_last_winner(self):
+        return self.cache.get_or_load(('last_winner',), self._load_last_winner)
+
+    def _load_last_winner(self):
         with Session(self.engine) as session:
             query = select(self.rewards.c.username)\
                 .order_by(desc(self.rewards.c.date), desc(self.rewards.c.ID))\
@@ -97,76 +167,208 @@ class DatabaseManager:
             return result[0] if result else None
 
     def get_latest_wa(self, username):
+        return self.cache.get_or_load(('wa', 'username', username), lambda: self._load_latest_wa(username))
+
+    def _load_latest_wa(self, username):
+        # Primary-key read on the compacted table instead of sorting the user's xwaMap history
         with Session(self.engine) as session:
-            query = select(self.waMap.c.wa)\
-                .where(self.waMap.c.username == username)\
-                .order_by(desc(self.waMap.c.ID))\
-                .limit(1)
+            query = select(self.waCurrent.c.wa).where(
+                self.waCurrent.c.platform == PLATFORM,
+                self.waCurrent.c.id_type == 'username',
+                self.waCurrent.c.user_key == username
+            )
             result = session.execute(query).first()
             return result[0] if result else None
 
+    def invalidate_user(self, username):
+        """Drop the cached wallet after this process writes xwaMap for a user."""
+        self.cache.invalidate(('wa', 'username', username))
+
+    def _allocate_round(self, session):
+        # Single atomic increment on the counter row; the row lock serialises concurrent runs
+        if self.dialect == 'mssql':
+            stmt = text("UPDATE round_counters SET value = value + 1 OUTPUT inserted.value WHERE name = 'xrewards'")
+        else:
+            stmt = text("UPDATE round_counters SET value = value + 1 WHERE name = 'xrewards' RETURNING value")
+        return session.execute(stmt).scalar_one()
+
+    def allocate_reward_round(self):
+        """Reserve the next reward round number.
+
+        Every call returns a distinct round, also across overlapping runs.
+        """
+        with Session(self.engine) as session:
+            reward_round = self._allocate_round(session)
+            session.commit()
+            return reward_round
+
     def get_next_reward_round(self):
+        """Peek at the round the next allocation will return, without reserving it."""
         with Session(self.engine) as session:
-            query = select(self.rewards.c.reward_round)\
-                .order_by(desc(self.rewards.c.reward_round))\
-                .limit(1)
+            query = select(self.round_counters.c.value)\
+                .where(self.round_counters.c.name == 'xrewards')
             result = session.execute(query).first()
             return (result[0] if result else 0) + 1
 
     def add_reward_entry(self, username, post_id, reward_round=None, wa=None, balance=None, reward=None, tx=None):
+        """Write one ledger entry in a single statement / round trip.
+
+        With ``tx`` set this only stamps the transaction hash on the round's
+        row. Otherwise the row is upserted: MERGE on MSSQL, INSERT ... ON
+        CONFLICT on SQLite. A missing ``reward_round`` is allocated from the
+        round counter in the same transaction.
+        """
+        current_date = datetime.now().date()
         with Session(self.engine) as session:
-            current_date = datetime.now().date()
-            if not reward_round:
-                reward_round = self.get_next_reward_round()
-    
             try:
                 if tx:
-                    # Update existing entry with transaction hash
-                    stmt = update(self.rewards).where(
-                        self.rewards.c.reward_round == reward_round
-                    ).values(tx=tx)
-                    session.execute(stmt)
+                    # Update existing entry with transaction hash; a first tx marks the reward paid
+                    params = {'tx': tx, 'reward_round': reward_round}
+                    if self.dialect == 'mssql':
+                        paid = session.execute(text(
+                            "UPDATE xrewards SET tx = :tx "
+                            "OUTPUT inserted.username, inserted.reward, inserted.date, deleted.tx "
+                            "WHERE reward_round = :reward_round"
+                        ), params).all()
+                    else:
+                        paid = session.execute(text(
+                            "SELECT username, reward, date, tx FROM xrewards WHERE reward_round = :reward_round"
+                        ), params).all()
+                        session.execute(text("UPDATE xrewards SET tx = :tx WHERE reward_round = :reward_round"), params)
+                    for paid_user, paid_reward, paid_date, previous_tx in paid:
+                        if previous_tx is None and paid_reward:
+                            self._add_to_totals(session, paid_user, paid_reward, paid_date)
                 else:
-                    # Check if entry exists for this reward round
-                    query = select(self.rewards.c.ID).where(
-                        self.rewards.c.reward_round == reward_round
-                    )
-                    existing = session.execute(query).first()
-    
-                    if existing:
-                        # Update existing entry
-                        stmt = update(self.rewards).where(
-                            self.rewards.c.reward_round == reward_round
-                        ).values(
-                            wa=wa,
-                            balance=balance,
-                            reward=reward,
-                            date=current_date
-                        )
-                        session.execute(stmt)
+                    if not reward_round:
+                        reward_round = self._allocate_round(session)
+                    params = {
+                        'username': username,
+                        'post_id': post_id,
+                        'reward_round': reward_round,
+                        'wa': wa,
+                        'balance': balance,
+                        'reward': reward,
+                        'date': current_date
+                    }
+                    if self.dialect == 'mssql':
+                        reward_round = session.execute(self._merge_reward_stmt(), params).scalar_one()
                     else:
-                        # Create new entry
-                        stmt = insert(self.rewards).values(
-                            username=username,
-                            post_id=post_id,
-                            wa=wa,
-                            balance=balance,
-                            reward=reward,
-                            tx=tx,
-                            date=current_date,
-                            reward_round=reward_round
-                        )
-                        session.execute(stmt)
+                        reward_round = session.execute(self._upsert_reward_stmt(), params).scalar_one()
     
                 session.commit()
+                self.cache.invalidate(('last_winner',))
                 return reward_round
             except Exception as e:
                 session.rollback()
                 raise
 
+    def _merge_reward_stmt(self):
+        # HOLDLOCK keeps the match/insert decision atomic under concurrent runs
+        return text("""
+            MERGE xrewards WITH (HOLDLOCK) AS target
+            USING (
+                SELECT :reward_round AS reward_round
+            ) AS source
+            ON target.reward_round = source.reward_round
+            WHEN MATCHED THEN
+                UPDATE SET wa = :wa, balance = :balance, reward = :reward, date = :date
+            WHEN NOT MATCHED THEN
+                INSERT (username, post_id, wa, balance, reward, tx, date, reward_round)
+                VALUES (:username, :post_id, :wa, :balance, :reward, NULL, :date, source.reward_round)
+            OUTPUT inserted.reward_round;
+        """)
+
+    def _upsert_reward_stmt(self):
+        return text("""
+            INSERT INTO xrewards (username, post_id, wa, balance, reward, tx, date, reward_round)
+            VALUES (:username, :post_id, :wa, :balance, :reward, NULL, :date, :reward_round)
+            ON CONFLICT (reward_round) DO UPDATE SET
+                wa = excluded.wa,
+                balance = excluded.balance,
+                reward = excluded.reward,
+                date = excluded.date
+            RETURNING reward_round
+        """)
+
+    def _add_to_totals(self, session, user, reward, paid_date):
+        # Runs inside the ledger write's transaction, so totals and ledger never diverge
+        paid_date = paid_date or datetime.now().date()
+        rows = [
+            {'period': period, 'user': user, 'reward': reward, 'date': paid_date}
+            for period in ('all', str(paid_date)[:7])
+        ]
+        if self.dialect == 'mssql':
+            stmt = text("""
+                MERGE xrewardTotals WITH (HOLDLOCK) AS target
+                USING (SELECT :period AS period, :user AS username) AS source
+                ON target.period = source.period AND target.username = source.username
+                WHEN MATCHED THEN
+                    UPDATE SET total_reward = target.total_reward + :reward,
+                               reward_count = target.reward_count + 1,
+                               last_date = CASE WHEN target.last_date > :date THEN target.last_date ELSE :date END
+                WHEN NOT MATCHED THEN
+                    INSERT (period, username, total_reward, reward_count, last_date)
+                    VALUES (:period, :user, :reward, 1, :date);
+            """)
+        else:
+            stmt = text("""
+                INSERT INTO xrewardTotals (period, username, total_reward, reward_count, last_date)
+                VALUES (:period, :user, :reward, 1, :date)
+                ON CONFLICT (period, username) DO UPDATE SET
+                    total_reward = total_reward + excluded.total_reward,
+                    reward_count = reward_count + 1,
+                    last_date = MAX(last_date, excluded.last_date)
+            """)
+        session.execute(stmt, rows)
+
+    def get_leaderboard(self, period='all', limit=10):
+        """Top earners for ``period`` ('all' or 'YYYY-MM') as (username, total_reward, reward_count) rows."""
+        with Session(self.engine) as session:
+            query = select(
+                self.rewardTotals.c.username,
+                self.rewardTotals.c.total_reward,
+                self.rewardTotals.c.reward_count
+            ).where(
+                self.rewardTotals.c.period == period
+            ).order_by(
+                desc(self.rewardTotals.c.total_reward)
+            ).limit(limit)
+            return session.execute(query).fetchall()
+
+    def get_user_totals(self, username):
+        """All-time and per-month (period, total_reward, reward_count, last_date) rows for one user."""
+        with Session(self.engine) as session:
+            query = select(
+                self.rewardTotals.c.period,
+                self.rewardTotals.c.total_reward,
+                self.rewardTotals.c.reward_count,
+                self.rewardTotals.c.last_date
+            ).where(
+                self.rewardTotals.c.username == str(username)
+            ).order_by(
+                desc(self.rewardTotals.c.period)
+            )
+            return session.execute(query).fetchall()
+
+    def get_user_history(self, username, limit=20):
+        """Most recent ledger rows for one user, newest round first."""
+        with Session(self.engine) as session:
+            query = select(
+                self.rewards.c.reward_round,
+                self.rewards.c.date,
+                self.rewards.c.reward,
+                self.rewards.c.wa,
+                self.rewards.c.tx
+            ).where(
+                self.rewards.c.username == str(username)
+            ).order_by(
+                desc(self.rewards.c.reward_round)
+            ).limit(limit)
+            return session.execute(query).fetchall()
+
     def add_pending_reward(self, username, post_id):
         with Session(self.engine) as session:
-            reward_round = self.get_next_reward_round()
+            reward_round = self._allocate_round(session)
             current_date = datetime.now().date()
             
             stmt = insert(self.rewards).values(
@@ -177,6 +379,7 @@ class DatabaseManager:
             )
             session.execute(stmt)
             session.commit()
+            self.cache.invalidate(('last_winner',))
             return reward_round
 
     def get_pending_rewards(self):
@@ -196,6 +399,36 @@ class DatabaseManager:
             
             results = session.execute(query).fetchall()
             return results
+
+    def get_settleable_rewards(self):
+        """Pending rewards whose winner has since registered a wallet.
+
+        Joins each pending row to the user's current wallet in one query,
+        replacing a get_latest_wa() call per pending row.
+        """
+        with Session(self.engine) as session:
+            query = select(
+                self.rewards.c.reward_round,
+                self.rewards.c.username,
+                self.rewards.c.post_id,
+                self.rewards.c.date,
+                self.waCurrent.c.wa
+            ).join(
+                self.waCurrent,
+                (self.waCurrent.c.platform == PLATFORM) &
+                (self.waCurrent.c.id_type == 'username') &
+                (self.waCurrent.c.user_key == self.rewards.c.username)
+            ).where(
+                self.rewards.c.wa.is_(None),
+                self.rewards.c.tx.is_(None),
+                self.waCurrent.c.wa.is_not(None)
+            ).order_by(
+                self.rewards.c.date.asc(),
+                self.rewards.c.reward_round.asc()
+            )
+
+            results = session.execute(query).fetchall()
+            return results
         
 # logger = logging.getLogger(__name__)
 
@@ -864,18 +1097,20 @@ def calculate_reward(total_reward=TOTAL_REWARD, amount_held=AMOUNT_HELD, tokens_
     else:
         return int(total_reward * (0.2 + (tokens_held / amount_held) * 0.8))
 
+async def send_reward(web3_manager, wallet_address, amount):
+    """``send_gmetis`` on a worker thread so the browser session stays responsive while it confirms"""
+    return await asyncio.get_running_loop().run_in_executor(
+        None, web3_manager.send_gmetis, wallet_address, amount
+    )
+
 async def process_pending_rewards(db_manager, x_manager, web3_manager):
-    pending_rewards = db_manager.get_pending_rewards()
+    settleable_rewards = await db_manager.get_settleable_rewards()
     
-    for reward_round, username, post_id, date in pending_rewards:
-        wallet_address = db_manager.get_latest_wa(username)
-        if not wallet_address:
-            continue
-            
+    for reward_round, username, post_id, date, wallet_address in settleable_rewards:
         balance = web3_manager.get_gmetis_balance(wallet_address)
         reward_amount = calculate_reward(TOTAL_REWARD, AMOUNT_HELD, balance)
         
-        db_manager.add_reward_entry(
+        await db_manager.add_reward_entry(
             username=username,
             post_id=post_id,
             wa=wallet_address,
@@ -884,52 +1119,37 @@ async def process_pending_rewards(db_manager, x_manager, web3_manager):
             reward_round=reward_round
         )
         
-        tx_hash = web3_manager.send_gmetis(wallet_address, reward_amount)
+        tx_hash = await send_reward(web3_manager, wallet_address, reward_amount)
         
-        db_manager.add_reward_entry(
+        await db_manager.add_reward_entry(
             username=username,
             post_id=post_id,
             tx=tx_hash,
             reward_round=reward_round
         )
-        
-        # Construct the message for OpenAI 
-        message = f"🎯 Reward Round #{reward_round} - Retroactive Payout 🎯\n\n" \
-                    f"✨ Congratulations @{username} \n" \
-                    f"🎁 You've received {reward_amount} gMetis for writing the most active post! \n" \
-                    f"📅 Original win date: {date}\n" \
-                    f"🔗 Transaction: https://andromeda-explorer.metis.io/tx/0x{tx_hash}\n\n" \
-                    f"🚀 Better late than never! Keep engaging! 🚀"
-
-        # Call OpenAI API
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a professional social media writer. Rephrase the following crypto reward announcement message while keeping all the information, emojis and formatting. Make it engaging but professional."},
-                {"role": "user", "content": message}
-            ]
-        )
-
-        # Get rephrased message
-        msg = response.choices[0].message.content.strip()
 
-        # Log the rephrased message
-        logger.info(f"Rephrased message: {msg}")
+        msg = ANNOUNCEMENTS.render(
+            'retroactive', reward_round=reward_round, username=username,
+            reward_amount=reward_amount, date=date, tx_hash=tx_hash
+        )
+        logger.info(f"Announcement: {msg}")
 
         # Reply to the tweet
         await x_manager.reply_to_tweet(post_id, msg)
 
 
 async def main():
-    db_manager = DatabaseManager()
     x_manager = XManager()
     web3_manager = Web3Manager()
     
+    # Connect/migrate the database while the browser logs in
+    db_manager, _ = await asyncio.gather(
+        AsyncDatabaseManager.create(DatabaseManager),
+        x_manager.initialize()
+    )
+    
     try:
-        # Initialize Twitter client
-        await x_manager.initialize()
-        
-        last_winner = db_manager.get_last_winner()
+        last_winner = await db_manager.get_last_winner()
         if last_winner:
             EXCLUDED_USERS.append(last_winner)
         
@@ -950,32 +1170,15 @@ async def main():
         logger.info(f"Selected winner: {winner_username}")
         
         # Get wallet address for winner
-        wallet_address = db_manager.get_latest_wa(winner_username)
-        reward_round = db_manager.get_next_reward_round()
+        wallet_address = await db_manager.get_latest_wa(winner_username)
 
         if not wallet_address:
-            reward_round = db_manager.add_pending_reward(winner_username, winning_post.id)
-            
-            message = f"🎯 Reward Round #{reward_round}\n\n" \
-                    f"🎉 Congratulations @{winner_username}! 🎉\n" \
-                    f"✨ Your post has been selected for a reward! \n" \
-                    f"📝 Please DM @{BOT_USERNAME} to register your wallet address.\n" \
-                    f"💫 Your reward will be processed automatically once registered!"
-
-            # Call OpenAI API
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a professional social media writer. Rephrase the following crypto reward announcement message while keeping all the information, emojis and formatting. Make it engaging but professional."},
-                    {"role": "user", "content": message}
-                ]
+            reward_round = await db_manager.add_pending_reward(winner_username, winning_post.id)
+            
+            msg = ANNOUNCEMENTS.render(
+                'pending', reward_round=reward_round, username=winner_username, bot_username=BOT_USERNAME
             )
-
-            # Get rephrased message
-            msg = response.choices[0].message.content.strip()
-
-            # Log the rephrased message
-            logger.info(f"Rephrased message: {msg}")
+            logger.info(f"Announcement: {msg}")
             
             await x_manager.reply_to_tweet(winning_post.id, msg)
             logger.info(f"Added pending reward for {winner_username}")
@@ -983,7 +1186,7 @@ async def main():
             balance = web3_manager.get_gmetis_balance(wallet_address)
             reward_amount = calculate_reward(TOTAL_REWARD, AMOUNT_HELD, balance)
             
-            reward_round = db_manager.add_reward_entry(
+            reward_round = await db_manager.add_reward_entry(
                 username=winner_username,
                 post_id=winning_post.id,
                 wa=wallet_address,
@@ -991,37 +1194,21 @@ async def main():
                 reward=reward_amount
             )
             
-            tx_hash = web3_manager.send_gmetis(wallet_address, reward_amount)
+            tx_hash = await send_reward(web3_manager, wallet_address, reward_amount)
             logger.info(f"Sent {reward_amount} gMetis to {wallet_address}, tx: {tx_hash}")
             
-            db_manager.add_reward_entry(
+            await db_manager.add_reward_entry(
                 username=winner_username,
                 post_id=winning_post.id,
                 tx=tx_hash,
                 reward_round=reward_round
             )
 
-            message = f"🎯 Reward Round #{reward_round}\n\n"\
-                    f"🎉 Congratulations @{winner_username}! 🎉\n"\
-                    f"✨ Thank you for engaging with us! \n"\
-                    f"🎁 You've received {reward_amount} gMetis! \n"\
-                    f"🔗 Transaction: https://andromeda-explorer.metis.io/tx/0x{tx_hash}\n\n"\
-                    f"🚀 Keep engaging and stay awesome! 🚀"
-
-            # Call OpenAI API
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a professional social media writer. Rephrase the following crypto reward announcement message while keeping all the information, emojis and formatting. Make it engaging but professional."},
-                    {"role": "user", "content": message}
-                ]
+            msg = ANNOUNCEMENTS.render(
+                'winner', reward_round=reward_round, username=winner_username,
+                reward_amount=reward_amount, tx_hash=tx_hash
             )
-
-            # Get rephrased message
-            msg = response.choices[0].message.content.strip()
-
-            # Log the rephrased message
-            logger.info(f"Rephrased message: {msg}")
+            logger.info(f"Announcement: {msg}")
 
             await x_manager.reply_to_tweet(winning_post.id, msg)
         
@@ -1031,6 +1218,11 @@ async def main():
     except Exception as e:
         logger.error(f"Error in main process: {str(e)}")
         raise
+    finally:
+        logger.info(f"DB cache stats: {db_manager.cache.stats()}")
+        logger.info(f"Announcement pool: {ANNOUNCEMENTS.stats()}")
+        ANNOUNCEMENTS.close()
+        db_manager.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,216 @@
+import os
+import sys
+import json
+import time
+import logging
+from string import Formatter
+
+import openai
+
+from sqlite_db import connect
+
+
+logger = logging.getLogger(__name__)
+
+# Base wording of every X announcement; {fields} are filled in when the reply is posted
+TEMPLATES = {
+    'winner': (
+        "🎯 Reward Round #{reward_round}\n\n"
+        "🎉 Congratulations @{username}! 🎉\n"
+        "✨ Thank you for engaging with us! \n"
+        "🎁 You've received {reward_amount} gMetis! \n"
+        "🔗 Transaction: https://andromeda-explorer.metis.io/tx/0x{tx_hash}\n\n"
+        "🚀 Keep engaging and stay awesome! 🚀"
+    ),
+    'pending': (
+        "🎯 Reward Round #{reward_round}\n\n"
+        "🎉 Congratulations @{username}! 🎉\n"
+        "✨ Your post has been selected for a reward! \n"
+        "📝 Please DM @{bot_username} to register your wallet address.\n"
+        "💫 Your reward will be processed automatically once registered!"
+    ),
+    'retroactive': (
+        "🎯 Reward Round #{reward_round} - Retroactive Payout 🎯\n\n"
+        "✨ Congratulations @{username} \n"
+        "🎁 You've received {reward_amount} gMetis for writing the most active post! \n"
+        "📅 Original win date: {date}\n"
+        "🔗 Transaction: https://andromeda-explorer.metis.io/tx/0x{tx_hash}\n\n"
+        "🚀 Better late than never! Keep engaging! 🚀"
+    ),
+}
+
+GENERATE_PROMPT = (
+    "You are a professional social media writer. Rephrase the following crypto reward announcement message "
+    "while keeping all the information, emojis and formatting. Make it engaging but professional. "
+    "Keep every placeholder in curly braces, such as {username}, exactly as written and use no other curly braces."
+)
+VARIANTS_PER_CALL = 5
+MAX_GROWTH = 1.5  # a variant longer than this times its template is rejected as rambling
+# Reviewed variants committed with the bot, so a fresh announcements.db is never empty
+VARIANTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'announcement_variants.json')
+
+
+def fields(text):
+    """Placeholder names used in ``text``; raises ValueError on unbalanced braces."""
+    return {name for _, name, _, _ in Formatter().parse(text) if name is not None}
+
+
+class AnnouncementPool:
+    """Approved rephrasings of each template in TEMPLATES, rotated without repeats.
+
+    Variants are written offline by ``generate`` and only kept when they
+    carry exactly the template's placeholders, so ``render`` never needs
+    a model call. Each pick takes a least-used variant at random, never
+    the one posted last, which cycles through the whole pool before any
+    variant comes back. ``seed`` loads the reviewed variants committed in
+    VARIANTS_FILE; with no approved variants the template itself is used.
+    """
+
+    def __init__(self, db_name='announcements.db'):
+        self.conn = connect(db_name)
+        with self.conn:
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS variants (
+                variant_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                template TEXT NOT NULL,
+                text TEXT NOT NULL,
+                approved INTEGER NOT NULL DEFAULT 1,
+                uses INTEGER NOT NULL DEFAULT 0,
+                last_used REAL,
+                created_at REAL NOT NULL,
+                UNIQUE (template, text)
+            )
+            ''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS ix_variants_template_uses ON variants (template, uses)')
+
+    def validate(self, template, text):
+        """Reason ``text`` cannot stand in for ``template``, or None when it can."""
+        base = TEMPLATES[template]
+        try:
+            if fields(text) != fields(base):
+                return 'placeholders differ from the template'
+            text.format(**{name: '' for name in fields(base)})
+        except (ValueError, IndexError, KeyError) as e:
+            return f'not a valid format string ({e})'
+        if len(text) > len(base) * MAX_GROWTH:
+            return 'too long'
+        return None
+
+    def add(self, template, text):
+        """Store ``text`` as an approved variant; returns False when it is invalid or already pooled."""
+        text = text.strip()
+        reason = self.validate(template, text)
+        if reason:
+            logger.info(f"Rejected {template} variant: {reason}")
+            return False
+        with self.conn:
+            # Join the current rotation cycle instead of being replayed until it catches up
+            cursor = self.conn.execute('''
+                INSERT OR IGNORE INTO variants (template, text, uses, created_at)
+                SELECT ?, ?, COALESCE(MIN(uses), 0), ? FROM variants WHERE template = ? AND approved = 1
+            ''', (template, text, time.time(), template))
+        return cursor.rowcount > 0
+
+    def seed(self, path=VARIANTS_FILE):
+        """Pool the reviewed variants in ``path``; returns how many were new.
+
+        Variants already pooled keep their use counts and rejected ones stay
+        rejected, so seeding on every start is safe.
+        """
+        with open(path, encoding='utf-8') as f:
+            variants = json.load(f)
+        return sum(self.add(template, text) for template in TEMPLATES for text in variants.get(template, []))
+
+    def export(self, path=VARIANTS_FILE):
+        """Write the approved variants to ``path`` for review and commit."""
+        variants = {template: [] for template in TEMPLATES}
+        for template, text in self.conn.execute(
+            'SELECT template, text FROM variants WHERE approved = 1 ORDER BY template, variant_id'
+        ):
+            variants.setdefault(template, []).append(text)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(variants, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        return sum(map(len, variants.values()))
+
+    def reject(self, variant_id):
+        with self.conn:
+            return self.conn.execute('UPDATE variants SET approved = 0 WHERE variant_id = ?', (variant_id,)).rowcount > 0
+
+    def generate(self, template, count=VARIANTS_PER_CALL, model="gpt-3.5-turbo"):
+        """Ask ``model`` for ``count`` rephrasings of ``template``; returns how many were approved."""
+        response = openai.ChatCompletion.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": GENERATE_PROMPT},
+                {"role": "user", "content": TEMPLATES[template]}
+            ],
+            n=count,
+            temperature=1.0
+        )
+        return sum(self.add(template, choice.message['content']) for choice in response.choices)
+
+    def render(self, template, **values):
+        """Next variant of ``template`` in the rotation with ``values`` filled in."""
+        with self.conn:
+            row = self.conn.execute('''
+                SELECT variant_id, text FROM variants
+                WHERE template = ? AND approved = 1
+                ORDER BY uses, variant_id = (
+                    SELECT variant_id FROM variants WHERE template = ? AND last_used IS NOT NULL
+                    ORDER BY last_used DESC LIMIT 1
+                ), RANDOM()
+                LIMIT 1
+            ''', (template, template)).fetchone()
+            if row is None:
+                return TEMPLATES[template].format(**values)
+            self.conn.execute(
+                'UPDATE variants SET uses = uses + 1, last_used = ? WHERE variant_id = ?', (time.time(), row[0])
+            )
+        return row[1].format(**values)
+
+    def stats(self):
+        rows = self.conn.execute(
+            'SELECT template, COUNT(*), SUM(uses) FROM variants WHERE approved = 1 GROUP BY template'
+        ).fetchall()
+        return {template: {'variants': count, 'posted': uses} for template, count, uses in rows}
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    # Offline batch job: generate, list and reject variants, then export them to
+    # announcement_variants.json and commit the reviewed file
+    commands = ('generate', 'list', 'reject', 'export')
+    if len(sys.argv) < 2 or sys.argv[1] not in commands:
+        sys.exit("usage: announcement_pool.py generate [per-template] | list | reject <variant-id> | export [path]")
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    pool = AnnouncementPool(os.getenv('ANNOUNCEMENT_DB', 'announcements.db'))
+    try:
+        if sys.argv[1] == 'generate':
+            openai.api_key = os.getenv('OPENAI_API_KEY')
+            per_template = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+            for template in TEMPLATES:
+                approved = 0
+                # A few extra calls make up for rejected and duplicate variants
+                for _ in range(2 * -(-per_template // VARIANTS_PER_CALL)):
+                    if approved >= per_template:
+                        break
+                    approved += pool.generate(template, min(VARIANTS_PER_CALL, per_template - approved))
+                logger.info(f"{template}: {approved} new variants approved")
+            logger.info(f"Pool: {pool.stats()}")
+        elif sys.argv[1] == 'list':
+            for variant_id, template, text, uses in pool.conn.execute(
+                'SELECT variant_id, template, text, uses FROM variants WHERE approved = 1 ORDER BY template, variant_id'
+            ):
+                print(f"--- #{variant_id} {template} (posted {uses}x)\n{text}")
+        elif sys.argv[1] == 'reject':
+            if not pool.reject(int(sys.argv[2])):
+                sys.exit(f"No variant {sys.argv[2]}")
+        else:
+            path = sys.argv[2] if len(sys.argv) > 2 else VARIANTS_FILE
+            logger.info(f"Exported {pool.export(path)} variants to {path}")
+    finally:
+        pool.close()
@@ -0,0 +1,46 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncDatabaseManager:
+    """Awaitable variant of a reward script's DatabaseManager.
+
+    Every public method of the wrapped manager is exposed under the same name
+    as a coroutine that runs on a worker thread, so a Telethon fetch, a
+    Playwright page load or a web3 call can proceed while a query waits on
+    the ODBC link. The worker count matches the engine's pool_size, so
+    concurrent calls never queue for a pooled connection inside a thread.
+    Works with both DatabaseManager and the local SQLiteDatabaseManager.
+    """
+
+    def __init__(self, db_manager, max_workers=None):
+        self.db_manager = db_manager
+        if max_workers is None:
+            engine = getattr(db_manager, 'engine', None)
+            # The raw SQLite backend has a single connection, so one worker is enough
+            max_workers = engine.pool.size() if engine is not None and hasattr(engine.pool, 'size') else 1
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db')
+
+    @classmethod
+    async def create(cls, manager_cls, *args, **kwargs):
+        """Build ``manager_cls(*args, **kwargs)`` off the event loop (connect + migrate) and wrap it."""
+        loop = asyncio.get_running_loop()
+        db_manager = await loop.run_in_executor(None, functools.partial(manager_cls, *args, **kwargs))
+        return cls(db_manager)
+
+    def __getattr__(self, name):
+        attr = getattr(self.db_manager, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(attr, *args, **kwargs))
+
+        return call
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.db_manager.close()
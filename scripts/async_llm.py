@@ -0,0 +1,46 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncLLMClient:
+    """Awaitable, bounded front for ``LLMCache.complete``.
+
+    Calls run on a small thread pool so the blocking openai 0.28 client
+    never stalls the event loop, at most ``max_concurrency`` at a time.
+    A call that errors or takes longer than ``timeout`` seconds returns
+    ``fallback`` instead, so callers always get something they can use
+    without an LLM.
+    """
+
+    def __init__(self, cache, max_concurrency=4, timeout=30):
+        self.cache = cache
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='llm')
+        self.timeouts = 0
+        self.failures = 0
+
+    async def complete(self, model, messages, fallback=None, **params):
+        call = functools.partial(self.cache.complete, model, messages, request_timeout=self.timeout, **params)
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            try:
+                return await asyncio.wait_for(loop.run_in_executor(self._executor, call), self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                logger.warning(f"{model} call timed out after {self.timeout}s, using fallback")
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"{model} call failed ({e}), using fallback")
+        return fallback
+
+    def stats(self):
+        return {'timeouts': self.timeouts, 'failures': self.failures, **self.cache.stats()}
+
+    def close(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,93 @@
+import re
+
+try:
+    import tiktoken
+except ImportError:  # not in requirements.txt; fall back to a character estimate
+    tiktoken = None
+
+
+# Per-message character caps tried in turn until the window fits the budget
+MESSAGE_CAPS = (400, 200, 100, 50)
+_WHITESPACE = re.compile(r'\s+')
+
+
+class TokenCounter:
+    """Counts tokens with tiktoken's encoding for ``model`` when installed, else ~4 characters per token."""
+
+    def __init__(self, model='gpt-4'):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding('cl100k_base')
+
+    def __call__(self, text):
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        return len(text) // 4 + 1
+
+
+def _compress(messages):
+    """Oldest-first ``[userid, text, repeats]`` entries with whitespace collapsed and repeats folded."""
+    entries = []
+    last_by_user = {}
+    for _, userid, text, _ in reversed(list(messages)):
+        text = _WHITESPACE.sub(' ', text or '').strip()
+        if not text:
+            continue
+        previous = last_by_user.get(userid)
+        if previous is not None and previous[1] == text:
+            # The same user repeating themselves ("gm", spam, retries) becomes one line with a count
+            previous[2] += 1
+            continue
+        entry = [userid, text, 1]
+        entries.append(entry)
+        last_by_user[userid] = entry
+    return entries
+
+
+def _render(entries, cap):
+    lines = []
+    for userid, text, repeats in entries:
+        if len(text) > cap:
+            text = text[:cap - 1] + '…'
+        lines.append(f"{userid}: {text} (x{repeats})" if repeats > 1 else f"{userid}: {text}")
+    return lines
+
+
+def pack_conversation(messages, budget, count_tokens=None):
+    """Fit a window's conversation into ``budget`` tokens, oldest message first.
+
+    The whole window is kept when it fits after collapsing whitespace and
+    folding repeated messages; otherwise long messages are clipped
+    progressively harder, and only as a last resort the oldest lines are
+    dropped. Returns ``(text, stats)`` where stats reports how many
+    messages and tokens made it in.
+    """
+    count_tokens = count_tokens or TokenCounter()
+    entries = _compress(messages)
+    total = sum(repeats for _, _, repeats in entries)
+
+    for cap in MESSAGE_CAPS:
+        lines = _render(entries, cap)
+        # Each line costs its tokens plus a newline
+        costs = [count_tokens(line) + 1 for line in lines]
+        if sum(costs) <= budget:
+            break
+    else:
+        # Still too long at the tightest cap: keep the newest lines that fit
+        used, keep = 0, len(lines)
+        while keep and used + costs[keep - 1] <= budget:
+            used += costs[keep - 1]
+            keep -= 1
+        lines, costs, entries = lines[keep:], costs[keep:], entries[keep:]
+
+    return '\n'.join(lines), {
+        'messages_in_window': len(messages),
+        'messages_included': sum(repeats for _, _, repeats in entries),
+        'messages_with_text': total,
+        'lines': len(lines),
+        'tokens': sum(costs),
+        'char_cap': cap,
+    }
@@ -0,0 +1,509 @@
+import logging
+import os
+import sys
+from contextlib import contextmanager, nullcontext
+
+from sqlalchemy import create_engine, text, Table, Column, Integer, BigInteger, String, Date
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+logger = logging.getLogger(__name__)
+
+
+# Table names per schema: the Telegram bot writes rewards/waMap, the X bot xrewards/xwaMap
+SCHEMAS = {
+    'telegram': {
+        'rewards': 'rewards', 'waMap': 'waMap', 'waCurrent': 'waCurrent', 'rewardTotals': 'rewardTotals',
+        'platform': 'Telegram',
+        'user_column': 'userid', 'wa_user_column': 'userID', 'id_types': ('userID', 'username')
+    },
+    'x': {
+        'rewards': 'xrewards', 'waMap': 'xwaMap', 'waCurrent': 'xwaCurrent', 'rewardTotals': 'xrewardTotals',
+        'platform': 'twitter',
+        'user_column': 'username', 'wa_user_column': 'username', 'id_types': ('username',)
+    },
+}
+
+
+def telegram_tables(metadata):
+    """Define the Telegram bot's tables on ``metadata``; shared by both database backends."""
+    return {
+        'rewards': Table(
+            'rewards', metadata,
+            Column('ID', Integer, primary_key=True, autoincrement=True),
+            Column('userid', String(64)),
+            Column('wa', String(128)),
+            Column('balance', Integer),
+            Column('reward', Integer),
+            Column('tx', String(128)),
+            Column('date', Date),
+            Column('reward_round', Integer)
+        ),
+        # One row per rewards table
+        'round_counters': Table(
+            'round_counters', metadata,
+            Column('name', String(32), primary_key=True),
+            Column('value', Integer, nullable=False)
+        ),
+        'waMap': Table(
+            'waMap', metadata,
+            Column('ID', Integer, primary_key=True, autoincrement=True),
+            Column('platform', String),
+            Column('userID', String(64)),
+            Column('username', String(64)),
+            Column('wa', String(128)),
+            Column('date', Date)
+        ),
+        # Latest wallet per user, maintained on every waMap insert
+        'waCurrent': Table(
+            'waCurrent', metadata,
+            Column('platform', String(32), primary_key=True),
+            Column('id_type', String(16), primary_key=True),  # 'userID' or 'username'
+            Column('user_key', String(64), primary_key=True),
+            Column('wa', String(128)),
+            Column('date', Date)
+        ),
+        # Paid gMetis per user, all time and per month
+        'rewardTotals': Table(
+            'rewardTotals', metadata,
+            Column('period', String(7), primary_key=True),  # 'all' or 'YYYY-MM'
+            Column('userid', String(64), primary_key=True),
+            Column('total_reward', BigInteger, nullable=False),
+            Column('reward_count', Integer, nullable=False),
+            Column('last_date', Date)
+        ),
+    }
+
+
+def _create_index(conn, dialect, name, table, columns, unique=False, where=None, include=None):
+    # Idempotent so a migration that failed half way can simply be re-run
+    unique_sql = 'UNIQUE ' if unique else ''
+    if dialect == 'mssql':
+        include_sql = f' INCLUDE ({include})' if include else ''
+        where_sql = f' WHERE {where}' if where else ''
+        conn.execute(text(
+            f"IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = '{name}' AND object_id = OBJECT_ID('{table}')) "
+            f"CREATE {unique_sql}INDEX {name} ON {table} ({columns}){include_sql}{where_sql}"
+        ))
+    else:
+        where_sql = f' WHERE {where}' if where else ''
+        conn.execute(text(
+            f"CREATE {unique_sql}INDEX IF NOT EXISTS {name} ON {table} ({columns}){where_sql}"
+        ))
+
+
+def _v1_create_tables(conn, dialect, metadata, schema):
+    """Base tables and the round counter, seeded from the existing rewards."""
+    names = SCHEMAS[schema]
+    metadata.create_all(conn)
+
+    if dialect == 'mssql':
+        conn.execute(text(f"""
+            MERGE round_counters WITH (HOLDLOCK) AS target
+            USING (SELECT '{names['rewards']}' AS name) AS source
+            ON target.name = source.name
+            WHEN NOT MATCHED THEN
+                INSERT (name, value)
+                VALUES ('{names['rewards']}', (SELECT COALESCE(MAX(reward_round), 0) FROM {names['rewards']}));
+        """))
+    else:
+        conn.execute(text(f"""
+            INSERT OR IGNORE INTO round_counters (name, value)
+            SELECT '{names['rewards']}', COALESCE(MAX(reward_round), 0) FROM {names['rewards']}
+        """))
+
+
+def _v2_hot_query_indexes(conn, dialect, metadata, schema):
+    """Indexes behind wallet lookups, round lookups and the pending-reward scan."""
+    names = SCHEMAS[schema]
+    rewards, wa_map = names['rewards'], names['waMap']
+    user_column, wa_user_column = names['user_column'], names['wa_user_column']
+
+    if dialect == 'mssql':
+        # Tables created before this migration (or by scripts/test/importdata.py) use
+        # VARCHAR(max), which SQL Server cannot use as an index key or filter column
+        resized = [(rewards, user_column, 64), (rewards, 'wa', 128), (rewards, 'tx', 128), (wa_map, 'username', 64)]
+        if wa_user_column != 'username':
+            resized.append((wa_map, wa_user_column, 64))
+        for table, column, length in resized:
+            conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} VARCHAR({length}) NULL"))
+
+    # Latest wallet per user: seek on the user, newest ID first
+    _create_index(conn, dialect, f'ix_{wa_map}_{wa_user_column}', wa_map, f'{wa_user_column}, ID', include='wa')
+    if wa_user_column != 'username':
+        _create_index(conn, dialect, f'ix_{wa_map}_username', wa_map, 'username, ID', include='wa')
+
+    _create_index(conn, dialect, f'ix_{rewards}_reward_round', rewards, 'reward_round')
+    _create_index(conn, dialect, f'ix_{rewards}_{user_column}', rewards, user_column)
+
+    # Pending rewards are a small, shrinking slice of the ledger
+    _create_index(
+        conn, dialect, f'ix_{rewards}_pending', rewards, 'date, reward_round',
+        include=user_column, where='wa IS NULL AND tx IS NULL'
+    )
+
+    if dialect == 'sqlite':
+        # ON CONFLICT in add_reward_entry resolves against this unique index
+        if schema == 'telegram':
+            _drop_duplicate_rewards(conn, rewards, 'reward_round, userid')
+            _create_index(conn, dialect, 'ux_rewards_round_userid', rewards, 'reward_round, userid', unique=True)
+        else:
+            _drop_duplicate_rewards(conn, rewards, 'reward_round')
+            _create_index(conn, dialect, 'ux_xrewards_round', rewards, 'reward_round', unique=True)
+
+
+def _drop_duplicate_rewards(conn, rewards, columns):
+    """Fold rows the old select-then-insert writes duplicated, so the unique index can be built.
+
+    Per key the paid row wins, then the one with a wallet, then the newest.
+    Folded rows are copied to ``{rewards}_duplicates`` before they are
+    deleted. A key with two different tx hashes may be a double payment:
+    the migration then fails and lists the rows, and nothing is deleted.
+    """
+    key = [column.strip() for column in columns.split(',')]
+    not_null = ' AND '.join(f'{column} IS NOT NULL' for column in key)
+    join_on = ' AND '.join(f'r.{column} = paid.{column}' for column in key)
+    conflicts = conn.execute(text(f"""
+        SELECT r.* FROM {rewards} r
+        JOIN (
+            SELECT {columns} FROM {rewards}
+            WHERE {not_null} AND tx IS NOT NULL
+            GROUP BY {columns} HAVING COUNT(DISTINCT tx) > 1
+        ) paid ON {join_on}
+        ORDER BY {', '.join(f'r.{column}' for column in key)}, r.ID
+    """)).mappings().all()
+    if conflicts:
+        rows = '\n'.join(f"  {dict(row)}" for row in conflicts)
+        raise RuntimeError(
+            f"{rewards} has {len(conflicts)} rows sharing ({columns}) with different tx hashes, which may be "
+            f"double payments. Resolve them by hand before the unique index can be added:\n{rows}"
+        )
+
+    duplicate_ids = conn.execute(text(f"""
+        SELECT ID FROM (
+            SELECT ID, ROW_NUMBER() OVER (
+                PARTITION BY {columns} ORDER BY tx IS NULL, wa IS NULL, ID DESC
+            ) AS duplicate
+            FROM {rewards}
+            WHERE {not_null}
+        ) WHERE duplicate > 1
+    """)).scalars().all()
+    if not duplicate_ids:
+        return
+
+    audit = f'{rewards}_duplicates'
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {audit} AS SELECT * FROM {rewards} WHERE 0"))
+    for i in range(0, len(duplicate_ids), 500):
+        chunk = ', '.join(str(int(row_id)) for row_id in duplicate_ids[i:i + 500])
+        conn.execute(text(f"INSERT INTO {audit} SELECT * FROM {rewards} WHERE ID IN ({chunk})"))
+        conn.execute(text(f"DELETE FROM {rewards} WHERE ID IN ({chunk})"))
+    logger.warning(
+        f"Folded {len(duplicate_ids)} duplicate {rewards} rows before adding the unique index; "
+        f"the removed rows are kept in {audit}"
+    )
+
+
+def rebuild_current_wallets(conn, schema):
+    """Recompute the current-wallet table from the append-only waMap history."""
+    names = SCHEMAS[schema]
+    wa_map, current = names['waMap'], names['waCurrent']
+
+    platform = names['platform']
+
+    conn.execute(text(f"DELETE FROM {current}"))
+    newest = conn.execute(text(f"SELECT MAX(ID) FROM {wa_map}")).scalar()
+    _set_current_wallets_mark(conn, current, newest or 0)
+    for id_type in names['id_types']:
+        conn.execute(text(f"""
+            INSERT INTO {current} (platform, id_type, user_key, wa, date)
+            SELECT COALESCE(w.platform, '{platform}'), '{id_type}', w.{id_type}, w.wa, w.date
+            FROM {wa_map} w
+            JOIN (
+                SELECT MAX(ID) AS latest_id
+                FROM {wa_map}
+                WHERE {id_type} IS NOT NULL AND {id_type} <> ''
+                GROUP BY COALESCE(platform, '{platform}'), {id_type}
+            ) latest ON latest.latest_id = w.ID
+        """))
+
+
+def _create_sync_marks(conn, dialect):
+    # Sync state lives apart from round_counters, which only allocates reward rounds.
+    # One row per current-wallet table: the highest waMap ID already folded into it.
+    if dialect == 'mssql':
+        conn.execute(text(
+            "IF OBJECT_ID('sync_marks') IS NULL "
+            "CREATE TABLE sync_marks (name VARCHAR(32) PRIMARY KEY, value INT NOT NULL)"
+        ))
+    else:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS sync_marks (name VARCHAR(32) PRIMARY KEY, value INT NOT NULL)"
+        ))
+
+
+def _set_current_wallets_mark(conn, current, last_id):
+    updated = conn.execute(
+        text("UPDATE sync_marks SET value = :value WHERE name = :name"), {'name': current, 'value': last_id}
+    ).rowcount
+    if not updated:
+        conn.execute(
+            text("INSERT INTO sync_marks (name, value) VALUES (:name, :value)"), {'name': current, 'value': last_id}
+        )
+
+
+def sync_current_wallets(conn, dialect, schema):
+    """Fold waMap rows added since the last sync into the current-wallet table; returns how many.
+
+    Registrations written straight into waMap (manual inserts, other
+    tools) would otherwise stay invisible to the bots, which only read
+    the current table. Costs one range seek on the waMap primary key
+    when nothing is new.
+    """
+    names = SCHEMAS[schema]
+    wa_map, current = names['waMap'], names['waCurrent']
+    row = conn.execute(text("SELECT value FROM sync_marks WHERE name = :name"), {'name': current}).first()
+    last_id = row[0] if row else 0
+    newest = conn.execute(text(f"SELECT MAX(ID) FROM {wa_map} WHERE ID > :last_id"), {'last_id': last_id}).scalar()
+    if newest is None:
+        return 0
+
+    keys = ', '.join(names['id_types'])
+    rows = conn.execute(text(f"""
+        SELECT platform, {keys}, wa, date FROM {wa_map}
+        WHERE ID > :last_id AND ID <= :newest
+        ORDER BY ID
+    """), {'last_id': last_id, 'newest': newest}).fetchall()
+    latest = {}
+    for platform, *user_keys, wa, date_value in rows:
+        ids = dict(zip(names['id_types'], user_keys))
+        for current_row in current_wallet_rows(schema, platform, ids.get('userID'), ids.get('username'), wa, date_value):
+            # Oldest first, so the newest row per user wins
+            latest[(current_row['platform'], current_row['id_type'], current_row['user_key'])] = current_row
+    if latest:
+        conn.execute(upsert_current_wallet_stmt(dialect, schema), list(latest.values()))
+    _set_current_wallets_mark(conn, current, newest)
+    return len(rows)
+
+
+def current_wallet_rows(schema, platform, userID, username, wa, date_value):
+    """Expand one waMap row into the current-wallet rows it replaces."""
+    keys = {'userID': userID, 'username': username}
+    return [
+        {'platform': platform or SCHEMAS[schema]['platform'], 'id_type': id_type,
+         'user_key': keys[id_type], 'wa': wa, 'date': date_value}
+        for id_type in SCHEMAS[schema]['id_types'] if keys[id_type]
+    ]
+
+
+def upsert_current_wallet_stmt(dialect, schema):
+    """Statement that points (platform, id_type, user_key) at a new wallet; run it after the waMap insert."""
+    current = SCHEMAS[schema]['waCurrent']
+    if dialect == 'mssql':
+        return text(f"""
+            MERGE {current} WITH (HOLDLOCK) AS target
+            USING (SELECT :platform AS platform, :id_type AS id_type, :user_key AS user_key) AS source
+            ON target.platform = source.platform AND target.id_type = source.id_type
+                AND target.user_key = source.user_key
+            WHEN MATCHED THEN
+                UPDATE SET wa = :wa, date = :date
+            WHEN NOT MATCHED THEN
+                INSERT (platform, id_type, user_key, wa, date)
+                VALUES (:platform, :id_type, :user_key, :wa, :date);
+        """)
+    return text(f"""
+        INSERT INTO {current} (platform, id_type, user_key, wa, date)
+        VALUES (:platform, :id_type, :user_key, :wa, :date)
+        ON CONFLICT (platform, id_type, user_key) DO UPDATE SET
+            wa = excluded.wa,
+            date = excluded.date
+    """)
+
+
+def _v3_current_wallets(conn, dialect, metadata, schema):
+    """Compacted current-wallet table keyed by (platform, id_type, user_key)."""
+    metadata.tables[SCHEMAS[schema]['waCurrent']].create(conn, checkfirst=True)
+    _create_sync_marks(conn, dialect)
+    rebuild_current_wallets(conn, schema)
+
+
+def rebuild_reward_totals(conn, dialect, schema):
+    """Recompute the per-user totals from every paid (tx IS NOT NULL) ledger row."""
+    names = SCHEMAS[schema]
+    rewards, totals, user_column = names['rewards'], names['rewardTotals'], names['user_column']
+    month = "CONVERT(CHAR(7), date, 126)" if dialect == 'mssql' else "strftime('%Y-%m', date)"
+
+    conn.execute(text(f"DELETE FROM {totals}"))
+    # SQL Server rejects a bare constant in GROUP BY, so the all-time pass groups by user only
+    for period, group_by in (("'all'", user_column), (month, f"{month}, {user_column}")):
+        conn.execute(text(f"""
+            INSERT INTO {totals} (period, {user_column}, total_reward, reward_count, last_date)
+            SELECT {period}, {user_column}, SUM(reward), COUNT(*), MAX(date)
+            FROM {rewards}
+            WHERE tx IS NOT NULL AND reward IS NOT NULL
+            GROUP BY {group_by}
+        """))
+
+
+def _v4_reward_totals(conn, dialect, metadata, schema):
+    """Incrementally maintained per-user reward totals (all time and per month)."""
+    names = SCHEMAS[schema]
+    totals = names['rewardTotals']
+    metadata.tables[totals].create(conn, checkfirst=True)
+    # Leaderboards read the top of one period; user lookups go by user
+    _create_index(conn, dialect, f'ix_{totals}_leaderboard', totals, 'period, total_reward DESC')
+    _create_index(conn, dialect, f'ix_{totals}_{names["user_column"]}', totals, names['user_column'])
+    rebuild_reward_totals(conn, dialect, schema)
+
+
+def _v5_sync_marks(conn, dialect, metadata, schema):
+    """Move the current-wallet sync mark out of round_counters into sync_marks."""
+    current = SCHEMAS[schema]['waCurrent']
+    _create_sync_marks(conn, dialect)
+    # Databases migrated before this step kept the mark as a round_counters row
+    conn.execute(text("""
+        INSERT INTO sync_marks (name, value)
+        SELECT name, value FROM round_counters
+        WHERE name = :name AND NOT EXISTS (SELECT 1 FROM sync_marks WHERE name = :name)
+    """), {'name': current})
+    conn.execute(text("DELETE FROM round_counters WHERE name = :name"), {'name': current})
+
+
+MIGRATIONS = [
+    (1, _v1_create_tables),
+    (2, _v2_hot_query_indexes),
+    (3, _v3_current_wallets),
+    (4, _v4_reward_totals),
+    (5, _v5_sync_marks),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+MIGRATION_LOCK_TIMEOUT_MS = 10 * 60 * 1000  # how long a run waits for another one's migration to finish
+
+
+def get_schema_version(engine, schema):
+    """Return the applied migration version for ``schema`` (0 if never migrated)."""
+    try:
+        with engine.connect() as conn:
+            result = conn.execute(
+                text("SELECT version FROM schema_version WHERE name = :name"),
+                {'name': schema}
+            ).first()
+            return result[0] if result else 0
+    except (OperationalError, ProgrammingError):
+        # schema_version does not exist yet
+        return 0
+
+
+@contextmanager
+def _migration_lock(engine, schema):
+    """Hold a cross-process lock while migrating; yields the ``begin()`` each step runs in.
+
+    SQL Server takes a session-owned sp_getapplock and every step still
+    commits on its own. SQLite holds the database write lock with one
+    BEGIN IMMEDIATE transaction that every step joins.
+    """
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as lock_conn:
+        if engine.dialect.name == 'mssql':
+            params = {'resource': f'migrate_{schema}', 'timeout': MIGRATION_LOCK_TIMEOUT_MS}
+            result = lock_conn.execute(text(
+                "SET NOCOUNT ON; DECLARE @result INT; "
+                "EXEC @result = sp_getapplock @Resource = :resource, @LockMode = 'Exclusive', "
+                "@LockOwner = 'Session', @LockTimeout = :timeout; "
+                "SELECT @result"
+            ), params).scalar()
+            if result < 0:
+                raise RuntimeError(f"Could not take the {schema} migration lock (sp_getapplock returned {result})")
+            try:
+                yield engine.begin
+            finally:
+                lock_conn.execute(
+                    text("EXEC sp_releaseapplock @Resource = :resource, @LockOwner = 'Session'"), params
+                )
+        else:
+            lock_conn.exec_driver_sql(f'PRAGMA busy_timeout = {MIGRATION_LOCK_TIMEOUT_MS}')
+            lock_conn.exec_driver_sql('BEGIN IMMEDIATE')
+            try:
+                yield lambda: nullcontext(lock_conn)
+            except BaseException:
+                lock_conn.exec_driver_sql('ROLLBACK')
+                raise
+            lock_conn.exec_driver_sql('COMMIT')
+
+
+def migrate(engine, metadata, schema):
+    """Apply every pending migration for ``schema``.
+
+    When the database is already at LATEST_VERSION this costs one query and
+    skips the metadata.create_all reflection entirely. Otherwise the steps
+    run under _migration_lock, so concurrent first runs (the reward bot and
+    addUsersFromCSV, say) apply each step exactly once.
+    """
+    current = get_schema_version(engine, schema)
+    if current >= LATEST_VERSION:
+        return current
+
+    dialect = engine.dialect.name
+    with _migration_lock(engine, schema) as begin:
+        with begin() as conn:
+            if dialect == 'mssql':
+                conn.execute(text(
+                    "IF OBJECT_ID('schema_version') IS NULL "
+                    "CREATE TABLE schema_version (name VARCHAR(32) PRIMARY KEY, version INT NOT NULL)"
+                ))
+            else:
+                conn.execute(text(
+                    "CREATE TABLE IF NOT EXISTS schema_version (name VARCHAR(32) PRIMARY KEY, version INT NOT NULL)"
+                ))
+            # Re-read under the lock: another run may have migrated while this one waited
+            current = conn.execute(
+                text("SELECT version FROM schema_version WHERE name = :name"), {'name': schema}
+            ).scalar() or 0
+
+        for version, step in MIGRATIONS:
+            if version <= current:
+                continue
+            logger.info(f"Applying {schema} schema migration {version}: {step.__doc__}")
+            # Each step commits together with its version bump
+            with begin() as conn:
+                step(conn, dialect, metadata, schema)
+                if current == 0:
+                    conn.execute(
+                        text("INSERT INTO schema_version (name, version) VALUES (:name, :version)"),
+                        {'name': schema, 'version': version}
+                    )
+                else:
+                    conn.execute(
+                        text("UPDATE schema_version SET version = :version WHERE name = :name"),
+                        {'name': schema, 'version': version}
+                    )
+            current = version
+
+    return current
+
+
+if __name__ == "__main__":
+    # Backfill / repair: python scripts/db_migrations.py rebuild-wallets|rebuild-totals telegram|x [sqlite-path]
+    commands = ('rebuild-wallets', 'rebuild-totals')
+    if len(sys.argv) < 3 or sys.argv[1] not in commands or sys.argv[2] not in SCHEMAS:
+        sys.exit("usage: db_migrations.py rebuild-wallets|rebuild-totals telegram|x [sqlite-path]")
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    if len(sys.argv) > 3:
+        engine = create_engine(f'sqlite:///{sys.argv[3]}')
+    else:
+        server = os.getenv('AZURE_SQL_SERVER')
+        database = os.getenv('AZURE_SQL_DATABASE')
+        username = os.getenv('AZURE_SQL_USERNAME')
+        password = os.getenv('AZURE_SQL_PASSWORD')
+        engine = create_engine(
+            f'mssql+pyodbc://{username}:{password}@{server}/{database}?driver=ODBC+Driver+18+for+SQL+Server',
+            connect_args={'timeout': 300}
+        )
+
+    command, schema = sys.argv[1], sys.argv[2]
+    with engine.begin() as conn:
+        if command == 'rebuild-wallets':
+            rebuild_current_wallets(conn, schema)
+            logger.info(f"Rebuilt {SCHEMAS[schema]['waCurrent']} from {SCHEMAS[schema]['waMap']}")
+        else:
+            rebuild_reward_totals(conn, engine.dialect.name, schema)
+            logger.info(f"Rebuilt {SCHEMAS[schema]['rewardTotals']} from {SCHEMAS[schema]['rewards']}")
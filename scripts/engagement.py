@@ -0,0 +1,94 @@
+import time
+from collections import Counter, deque
+
+from message_batch import MessageBatch
+
+
+SNAPSHOT_VERSION = 2  # version 1 snapshots kept counts only and cannot rebuild the window
+
+
+class EngagementCounter:
+    """Rolling window of live messages with per-user message and character counts.
+
+    Events live in a deque ordered by arrival, so expiring the window is a
+    pop from the left: ``add()`` only touches the messages that just fell
+    out of the window, and ``leaderboard()`` only sorts the active users.
+    ``window()`` hands the live messages to the same scorer that polling
+    mode uses, so both modes pick winners the same way.
+    """
+
+    def __init__(self, window_s):
+        self.window_s = window_s
+        self._events = deque()
+        self.messages = Counter()
+        self.chars = Counter()
+        self.usernames = {}
+
+    def add(self, userid, username=None, ts=None, text=None, msg_id=0, reply_to=None):
+        ts = time.time() if ts is None else ts
+        length = len(text or '')
+        self._events.append((ts, userid, length, msg_id, text, reply_to))
+        self.messages[userid] += 1
+        self.chars[userid] += length
+        if username:
+            self.usernames[userid] = username
+        self.expire()
+
+    def expire(self, now=None):
+        cutoff = (time.time() if now is None else now) - self.window_s
+        while self._events and self._events[0][0] < cutoff:
+            _, userid, length, _, _, _ = self._events.popleft()
+            self.messages[userid] -= 1
+            self.chars[userid] -= length
+            if self.messages[userid] <= 0:
+                del self.messages[userid]
+                del self.chars[userid]
+
+    def window(self):
+        """The live messages as a MessageBatch, newest first, ready for ``engagement_scorer``."""
+        self.expire()
+        return MessageBatch.from_rows(
+            (msg_id, userid, self.usernames.get(userid), text, int(ts), reply_to)
+            for ts, userid, _, msg_id, text, reply_to in reversed(self._events)
+        )
+
+    def leaderboard(self, limit=10, excluded=()):
+        """Top ``(userid, username, messages, chars)`` in the current window, most messages first.
+
+        For logging only: winners come from scoring ``window()``.
+        """
+        self.expire()
+        excluded = {str(userid) for userid in excluded}
+        ranked = sorted(
+            (userid for userid in self.messages if str(userid) not in excluded),
+            key=lambda userid: (self.messages[userid], self.chars[userid]),
+            reverse=True
+        )
+        return [
+            (userid, self.usernames.get(userid), self.messages[userid], self.chars[userid])
+            for userid in ranked[:limit]
+        ]
+
+    def snapshot(self):
+        self.expire()
+        return {
+            'version': SNAPSHOT_VERSION,
+            'window_s': self.window_s,
+            'taken_at': time.time(),
+            'events': list(self._events),
+            'usernames': {str(userid): username for userid, username in self.usernames.items()}
+        }
+
+    @classmethod
+    def restore(cls, snapshot, window_s):
+        """Counter rebuilt from ``snapshot()``, or None when the snapshot predates SNAPSHOT_VERSION."""
+        if snapshot.get('version') != SNAPSHOT_VERSION:
+            return None
+        counter = cls(window_s)
+        counter.usernames = {int(userid): username for userid, username in snapshot.get('usernames', {}).items()}
+        for ts, userid, length, msg_id, text, reply_to in snapshot.get('events', []):
+            counter._events.append((ts, userid, length, msg_id, text, reply_to))
+            counter.messages[userid] += 1
+            counter.chars[userid] += length
+        counter.expire()
+        return counter
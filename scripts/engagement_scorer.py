@@ -0,0 +1,75 @@
+import numpy as np
+
+from message_batch import NO_SENDER
+
+
+# Relative weight of each per-user feature after it is scaled to [0, 1] across the window
+WEIGHTS = {
+    'messages': 1.0,
+    'replies_received': 1.5,
+    'partners': 1.5,
+    'text_length': 0.5,
+}
+
+
+def score_users(messages, excluded=()):
+    """Score every eligible sender in a MessageBatch in one vectorized pass.
+
+    Returns ``(userids, scores, features)`` sorted best first, where
+    ``features`` maps each WEIGHTS key to a per-user array. Replies are
+    resolved inside the window only: a reply to an older message counts
+    for the sender's activity but credits nobody.
+    """
+    userids = np.frombuffer(messages.userids, dtype=np.int64)
+    if not len(userids):
+        return np.empty(0, dtype=np.int64), np.empty(0), {name: np.empty(0) for name in WEIGHTS}
+    msg_ids = np.frombuffer(messages.ids, dtype=np.int64)
+    reply_to = np.frombuffer(messages.reply_to, dtype=np.int64)
+    lengths = np.fromiter((len(text) if text else 0 for text in messages.texts), dtype=np.int64, count=len(userids))
+
+    users, user_index = np.unique(userids, return_inverse=True)
+    n_users = len(users)
+    message_count = np.bincount(user_index, minlength=n_users)
+    text_length = np.bincount(user_index, weights=lengths, minlength=n_users)
+
+    # Author of each replied-to message, found by binary search over the window's message ids
+    order = np.argsort(msg_ids)
+    pos = np.searchsorted(msg_ids, reply_to, sorter=order).clip(max=len(msg_ids) - 1)
+    target_row = order[pos]
+    is_reply = (reply_to != 0) & (msg_ids[target_row] == reply_to)
+    sender = user_index[is_reply]
+    target = user_index[target_row[is_reply]]
+    real = (sender != target) & (users[sender] != NO_SENDER) & (users[target] != NO_SENDER)
+    sender, target = sender[real], target[real]
+
+    replies_received = np.bincount(target, minlength=n_users)
+    # Distinct conversation partners in either direction
+    pairs = np.unique(np.concatenate([sender * n_users + target, target * n_users + sender]))
+    partners = np.bincount(pairs // n_users, minlength=n_users)
+
+    features = {
+        'messages': message_count.astype(float),
+        'replies_received': replies_received.astype(float),
+        'partners': partners.astype(float),
+        'text_length': text_length,
+    }
+    scores = np.zeros(n_users)
+    for name, weight in WEIGHTS.items():
+        peak = features[name].max()
+        if peak > 0:
+            scores += weight * features[name] / peak
+
+    eligible = users != NO_SENDER
+    if excluded:
+        eligible &= ~np.isin(users, np.fromiter({int(userid) for userid in excluded}, dtype=np.int64))
+    ranked = np.flatnonzero(eligible)[np.argsort(-scores[eligible], kind='stable')]
+    return users[ranked], scores[ranked], {name: values[ranked] for name, values in features.items()}
+
+
+def top_candidates(messages, excluded=(), limit=3, margin=0.1):
+    """The best scorer plus any runners-up within ``margin`` (relative) of it, at most ``limit`` users."""
+    users, scores, _ = score_users(messages, excluded)
+    if not len(users):
+        return []
+    close = scores >= scores[0] * (1 - margin)
+    return [int(userid) for userid in users[close][:limit]]
@@ -0,0 +1,189 @@
+import os
+import sys
+import json
+import logging
+from datetime import datetime, timezone
+
+from message_archive import MessageArchive
+from message_batch import MessageBatch
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 20  # bytes read from the export per refill
+BATCH_SIZE = 5000  # messages per archive transaction
+
+# Telegram Desktop exports bare ids; Telethon (and the archive) use marked peer ids
+_CHANNEL_TYPES = ('private_supergroup', 'public_supergroup', 'private_channel', 'public_channel')
+
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    """Decode one JSON value at a time from a file, keeping only the undecoded tail in memory."""
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.f.read(CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self):
+        """Next non-whitespace character, or '' at end of file."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos + 1]
+            self._fill()
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos} of the current chunk")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # A value split across chunks (or a number at the very end): read more and retry
+                if self.eof:
+                    raise
+                self._fill()
+                continue
+            if end == len(self.buf) and not self.eof:
+                self._fill()
+                continue
+            self.pos = end
+            return value
+
+
+def iter_export(path):
+    """Yield ``('header', dict)`` once the chat metadata is read, then each entry of ``messages``."""
+    with open(path, 'r', encoding='utf-8') as f:
+        reader = _Reader(f)
+        header = {}
+        reader.expect('{')
+        while reader.peek() != '}':
+            key = reader.value()
+            reader.expect(':')
+            if key != 'messages':
+                header[key] = reader.value()
+            else:
+                yield 'header', header
+                reader.expect('[')
+                while reader.peek() != ']':
+                    yield 'message', reader.value()
+                    if reader.peek() == ',':
+                        reader.expect(',')
+                reader.expect(']')
+            if reader.peek() == ',':
+                reader.expect(',')
+
+
+def chat_peer_id(header):
+    chat_id = int(header['id'])
+    if header.get('type') in _CHANNEL_TYPES:
+        return int(f'-100{chat_id}')
+    if header.get('type') == 'private_group':
+        return -chat_id
+    return chat_id
+
+
+def sender_id(from_id):
+    """'user123' -> 123, 'channel123' -> -100123; None for missing senders."""
+    if not from_id:
+        return None
+    if from_id.startswith('user'):
+        return int(from_id[4:])
+    if from_id.startswith('channel'):
+        return int(f'-100{from_id[7:]}')
+    if from_id.startswith('chat'):
+        return -int(from_id[4:])
+    return None
+
+
+def message_text(text):
+    # Formatted messages export text as a list of plain strings and entity objects
+    if isinstance(text, list):
+        return ''.join(part if isinstance(part, str) else part.get('text', '') for part in text)
+    return text
+
+
+def message_date(message):
+    if 'date_unixtime' in message:
+        return int(message['date_unixtime'])
+    # Older exports only carry the exporting machine's local time; treat it as UTC
+    return int(datetime.fromisoformat(message['date']).replace(tzinfo=timezone.utc).timestamp())
+
+
+def import_export(path, archive, group_id=None):
+    """Stream a Telegram Desktop ``result.json`` into ``archive``; returns (group_id, imported count).
+
+    Memory is bounded by CHUNK_SIZE plus one BATCH_SIZE batch. Usernames
+    are not part of the export, so they are attached from the archive's
+    sender cache where known.
+    """
+    imported = 0
+    first_date = last_date = None
+    last_id = 0
+    batch = MessageBatch()
+
+    def flush():
+        nonlocal batch, imported
+        if not len(batch):
+            return
+        batch.usernames.update(
+            (userid, username) for userid, username in archive.get_users(batch.senders()).items() if username
+        )
+        imported += archive.add_messages(group_id, batch)
+        logger.info(f"Imported {imported} messages into group {group_id}")
+        batch = MessageBatch()
+
+    for kind, item in iter_export(path):
+        if kind == 'header':
+            group_id = group_id or chat_peer_id(item)
+            continue
+        if item.get('type') != 'message':
+            continue
+        date = message_date(item)
+        batch.append(
+            item['id'], sender_id(item.get('from_id')), None, message_text(item.get('text')), date,
+            item.get('reply_to_message_id')
+        )
+        first_date = date if first_date is None else min(first_date, date)
+        last_date = date if last_date is None else max(last_date, date)
+        last_id = max(last_id, item['id'])
+        if len(batch) >= BATCH_SIZE:
+            flush()
+    flush()
+
+    if imported:
+        since = datetime.fromtimestamp(first_date, timezone.utc)
+        until = datetime.fromtimestamp(last_date, timezone.utc)
+        if not archive.extend_coverage(group_id, since, until, last_id):
+            logger.info("Export ends before the archived history starts; sync state left unchanged")
+    return group_id, imported
+
+
+if __name__ == "__main__":
+    # Backfill: python scripts/import_tg_export.py result.json [group-id]
+    if len(sys.argv) < 2:
+        sys.exit("usage: import_tg_export.py result.json [group-id]")
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    archive = MessageArchive(os.getenv('TG_ARCHIVE_DB', 'messages.db'))
+    try:
+        group_id, imported = import_export(sys.argv[1], archive, int(sys.argv[2]) if len(sys.argv) > 2 else None)
+    finally:
+        archive.close()
+    logger.info(f"Done: {imported} messages for group {group_id}")
@@ -0,0 +1,109 @@
+import json
+import time
+import hashlib
+import threading
+
+import openai
+
+from sqlite_db import connect
+
+
+class LLMCache:
+    """Persistent, content-addressed cache in front of ``openai.ChatCompletion.create``.
+
+    The key is a SHA-256 of (model, messages, params), so any call site
+    asking the same question gets the stored answer back, including a
+    rerun after a crash. Entries expire ``ttl`` seconds after they were
+    stored; beyond ``max_entries`` the least recently used are evicted.
+    Hit/miss/eviction counters are exposed through ``stats()``.
+    """
+
+    def __init__(self, db_name='llm_cache.db', ttl=7 * 24 * 3600, max_entries=2000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.conn = connect(db_name, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        with self._lock, self.conn:
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            ''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS ix_llm_cache_last_used ON llm_cache (last_used)')
+
+    @staticmethod
+    def key(model, messages, params):
+        payload = json.dumps([model, messages, params], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock, self.conn:
+            row = self.conn.execute(
+                'SELECT content FROM llm_cache WHERE key = ? AND created_at >= ?', (key, now - self.ttl)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute('UPDATE llm_cache SET last_used = ? WHERE key = ?', (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, model, content):
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute('''
+                INSERT INTO llm_cache (key, model, content, created_at, last_used) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    content = excluded.content,
+                    created_at = excluded.created_at,
+                    last_used = excluded.last_used
+            ''', (key, model, content, now, now))
+            self._evict(now)
+
+    def _evict(self, now):
+        expired = self.conn.execute('DELETE FROM llm_cache WHERE created_at < ?', (now - self.ttl,)).rowcount
+        overflow = self.conn.execute('''
+            DELETE FROM llm_cache WHERE key IN (
+                SELECT key FROM llm_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+        ''', (self.max_entries,)).rowcount
+        self.evictions += expired + overflow
+
+    def complete(self, model, messages, request_timeout=None, **params):
+        """Content of the first choice for this chat completion, from the cache when possible.
+
+        ``request_timeout`` is passed to the API but is not part of the key.
+        """
+        key = self.key(model, messages, params)
+        content = self.get(key)
+        if content is None:
+            if request_timeout is not None:
+                params['request_timeout'] = request_timeout
+            response = openai.ChatCompletion.create(model=model, messages=messages, **params)
+            content = response.choices[0].message['content']
+            self.set(key, model, content)
+        return content
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            size = self.conn.execute('SELECT COUNT(*) FROM llm_cache').fetchone()[0]
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': size,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,253 @@
+import json
+import threading
+from datetime import datetime, timezone
+
+from message_batch import NO_SENDER, MessageBatch
+from sqlite_db import connect
+
+
+class MessageArchive:
+    """On-disk store of fetched Telegram messages, keyed by (group_id, msg_id).
+
+    Each sync only asks Telegram for messages newer than the group's
+    ``last_id`` and upserts them here, so any window the bot needs (the
+    3 h round, a 24 h lookback) is answered from an indexed range scan.
+    Message text is mirrored into an FTS5 index for keyword search, and
+    sender usernames are cached in ``users`` with the time they were last
+    resolved. Dates are stored as UTC epoch seconds.
+    """
+
+    def __init__(self, db_name='messages.db'):
+        self.db_name = db_name
+        self.conn = connect(db_name, check_same_thread=False)
+        self._lock = threading.RLock()
+        self.setup_database()
+
+    def setup_database(self):
+        with self._lock, self.conn:
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS messages (
+                group_id INTEGER NOT NULL,
+                msg_id INTEGER NOT NULL,
+                userid INTEGER,
+                username TEXT,
+                text TEXT,
+                date INTEGER NOT NULL,
+                reply_to INTEGER,
+                PRIMARY KEY (group_id, msg_id)
+            )
+            ''')
+            columns = {row[1] for row in self.conn.execute('PRAGMA table_info(messages)')}
+            if 'reply_to' not in columns:
+                # Archives created before reply tracking
+                self.conn.execute('ALTER TABLE messages ADD COLUMN reply_to INTEGER')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS ix_messages_group_date ON messages (group_id, date)')
+            # Covered history per group: everything in [covered_since, now] up to last_id is archived
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS sync_state (
+                group_id INTEGER PRIMARY KEY,
+                last_id INTEGER NOT NULL,
+                covered_since INTEGER NOT NULL
+            )
+            ''')
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                userid INTEGER PRIMARY KEY,
+                username TEXT,
+                refreshed_at INTEGER NOT NULL
+            )
+            ''')
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS engagement_snapshots (
+                group_id INTEGER PRIMARY KEY,
+                taken_at INTEGER NOT NULL,
+                data TEXT NOT NULL
+            )
+            ''')
+            self.conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts
+            USING fts5(text, content='messages', content_rowid='rowid')
+            ''')
+            # External-content FTS: keep the index in step with the base table
+            self.conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+                INSERT INTO messages_fts (rowid, text) VALUES (new.rowid, new.text);
+            END
+            ''')
+            self.conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+            END
+            ''')
+            self.conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS messages_au AFTER UPDATE OF text ON messages BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+                INSERT INTO messages_fts (rowid, text) VALUES (new.rowid, new.text);
+            END
+            ''')
+
+    def sync_point(self, group_id, since):
+        """``min_id`` to fetch from so that the archive covers ``since`` onwards (0 = fetch the whole window)."""
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT last_id, covered_since FROM sync_state WHERE group_id = ?', (group_id,)
+            ).fetchone()
+        if row and row[1] <= _epoch(since):
+            return row[0]
+        return 0
+
+    def add_messages(self, group_id, messages, since=None, contiguous=True):
+        """Upsert a fetched MessageBatch and record that the archive now covers ``since`` onwards.
+
+        ``contiguous`` is False when the fetch stopped at the window edge
+        before reaching the previous ``last_id``; older coverage is then
+        dropped because the messages in between were never archived.
+        Without ``since`` (export backfills) the sync state is left alone.
+        """
+        rows = [
+            (group_id, msg_id, None if userid == NO_SENDER else userid, messages.usernames.get(userid), text, date,
+             reply_to or None)
+            for (msg_id, userid, text, date), reply_to in zip(messages, messages.reply_to)
+        ]
+        with self._lock, self.conn:
+            self.conn.executemany('''
+                INSERT INTO messages (group_id, msg_id, userid, username, text, date, reply_to)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (group_id, msg_id) DO UPDATE SET
+                    userid = excluded.userid,
+                    username = COALESCE(excluded.username, messages.username),
+                    text = excluded.text,
+                    date = excluded.date,
+                    reply_to = excluded.reply_to
+            ''', rows)
+            if since is None:
+                return len(rows)
+            self.conn.execute('''
+                INSERT INTO sync_state (group_id, last_id, covered_since)
+                VALUES (?, ?, ?)
+                ON CONFLICT (group_id) DO UPDATE SET
+                    last_id = MAX(last_id, excluded.last_id),
+                    covered_since = CASE WHEN ? THEN MIN(covered_since, excluded.covered_since)
+                                         ELSE excluded.covered_since END
+            ''', (group_id, max(messages.ids, default=0), _epoch(since), contiguous))
+        return len(rows)
+
+    def extend_coverage(self, group_id, since, until, last_id):
+        """Record a backfilled range [since, until] ending at ``last_id`` as archived.
+
+        It only joins existing coverage when it reaches into it; a range
+        that ends before the covered history starts would leave a gap.
+        Returns True when the sync state changed.
+        """
+        with self._lock, self.conn:
+            row = self.conn.execute(
+                'SELECT covered_since FROM sync_state WHERE group_id = ?', (group_id,)
+            ).fetchone()
+            if row is None:
+                self.conn.execute(
+                    'INSERT INTO sync_state (group_id, last_id, covered_since) VALUES (?, ?, ?)',
+                    (group_id, last_id, _epoch(since))
+                )
+                return True
+            if _epoch(until) < row[0]:
+                return False
+            self.conn.execute('''
+                UPDATE sync_state
+                SET last_id = MAX(last_id, ?), covered_since = MIN(covered_since, ?)
+                WHERE group_id = ?
+            ''', (last_id, _epoch(since), group_id))
+            return True
+
+    def get_window(self, group_id, since, until=None):
+        """Messages for ``group_id`` dated in [since, until), newest first, as a MessageBatch."""
+        query = '''
+            SELECT msg_id, userid, username, text, date, reply_to FROM messages
+            WHERE group_id = ? AND date >= ? AND date < ?
+            ORDER BY date DESC, msg_id DESC
+        '''
+        until = _epoch(until) if until else 2 ** 62
+        with self._lock:
+            rows = self.conn.execute(query, (group_id, _epoch(since), until)).fetchall()
+        return MessageBatch.from_rows(rows)
+
+    def search(self, group_id, match, since=None, limit=50):
+        """Full-text search (FTS5 MATCH syntax) over a group's archived messages, newest first."""
+        with self._lock:
+            rows = self.conn.execute('''
+                SELECT m.msg_id, m.userid, m.username, m.text, m.date, m.reply_to
+                FROM messages_fts
+                JOIN messages m ON m.rowid = messages_fts.rowid
+                WHERE messages_fts MATCH ? AND m.group_id = ? AND m.date >= ?
+                ORDER BY m.date DESC
+                LIMIT ?
+            ''', (match, group_id, _epoch(since) if since else 0, limit)).fetchall()
+        return MessageBatch.from_rows(rows)
+
+    def get_users(self, userids, max_age=None):
+        """Cached ``{userid: username}`` for ``userids``; entries older than ``max_age`` seconds are left out."""
+        userids = list(userids)
+        cutoff = int(datetime.now(timezone.utc).timestamp()) - max_age if max_age else 0
+        users = {}
+        with self._lock:
+            # Chunked to stay under SQLite's bound-parameter limit
+            for i in range(0, len(userids), 500):
+                chunk = userids[i:i + 500]
+                placeholders = ', '.join('?' * len(chunk))
+                rows = self.conn.execute(
+                    f'SELECT userid, username FROM users WHERE userid IN ({placeholders}) AND refreshed_at >= ?',
+                    (*chunk, cutoff)
+                ).fetchall()
+                users.update(rows)
+        return users
+
+    def set_users(self, users):
+        """Store freshly resolved ``{userid: username}`` pairs."""
+        now = int(datetime.now(timezone.utc).timestamp())
+        with self._lock, self.conn:
+            self.conn.executemany('''
+                INSERT INTO users (userid, username, refreshed_at) VALUES (?, ?, ?)
+                ON CONFLICT (userid) DO UPDATE SET
+                    username = excluded.username,
+                    refreshed_at = excluded.refreshed_at
+            ''', [(userid, username, now) for userid, username in users.items()])
+
+    def save_snapshot(self, group_id, snapshot):
+        """Persist a listener's EngagementCounter snapshot for ``group_id``, replacing the previous one."""
+        with self._lock, self.conn:
+            self.conn.execute('''
+                INSERT INTO engagement_snapshots (group_id, taken_at, data) VALUES (?, ?, ?)
+                ON CONFLICT (group_id) DO UPDATE SET
+                    taken_at = excluded.taken_at,
+                    data = excluded.data
+            ''', (group_id, int(snapshot['taken_at']), json.dumps(snapshot)))
+
+    def load_snapshot(self, group_id):
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT data FROM engagement_snapshots WHERE group_id = ?', (group_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def prune(self, max_age):
+        """Forget messages and cached senders older than ``max_age`` seconds; returns messages removed.
+
+        Coverage is clipped to the retained range, so a later sync refetches
+        rather than trusting history that is no longer here.
+        """
+        cutoff = int(datetime.now(timezone.utc).timestamp()) - max_age
+        with self._lock, self.conn:
+            removed = self.conn.execute('DELETE FROM messages WHERE date < ?', (cutoff,)).rowcount
+            self.conn.execute('DELETE FROM users WHERE refreshed_at < ?', (cutoff,))
+            self.conn.execute('DELETE FROM engagement_snapshots WHERE taken_at < ?', (cutoff,))
+            self.conn.execute('UPDATE sync_state SET covered_since = ? WHERE covered_since < ?', (cutoff, cutoff))
+        return removed
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def _epoch(value):
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
@@ -0,0 +1,92 @@
+import sys
+from array import array
+from datetime import datetime, timezone
+
+
+NO_SENDER = 0  # userid stored for messages without a sender (anonymous admins, channel posts)
+
+
+class MessageBatch:
+    """Column-oriented window of group messages, newest first.
+
+    Message ids, sender ids, epoch timestamps and replied-to message ids
+    (0 when not a reply) are packed into int64 arrays and texts are kept
+    in one list, instead of a dict with an ISO date string per message.
+    Each sender's username is stored once, and per-user row indexes give
+    O(1) ``has_user`` / ``username`` / ``count`` lookups, so callers
+    compare ints instead of ``str(m['userid'])``.
+    """
+
+    __slots__ = ('ids', 'userids', 'dates', 'reply_to', 'texts', 'usernames', '_rows_by_user')
+
+    def __init__(self):
+        self.ids = array('q')
+        self.userids = array('q')
+        self.dates = array('q')
+        self.reply_to = array('q')
+        self.texts = []
+        self.usernames = {}
+        self._rows_by_user = {}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build a batch from ``(msg_id, userid, username, text, epoch[, reply_to])`` tuples."""
+        batch = cls()
+        for row in rows:
+            batch.append(*row)
+        return batch
+
+    def append(self, msg_id, userid, username, text, date, reply_to=None):
+        """Add one message; ``date`` is epoch seconds or an aware datetime."""
+        userid = NO_SENDER if userid is None else int(userid)
+        if isinstance(date, datetime):
+            date = int(date.timestamp())
+        self._rows_by_user.setdefault(userid, []).append(len(self.ids))
+        self.ids.append(msg_id)
+        self.userids.append(userid)
+        self.dates.append(date)
+        self.reply_to.append(reply_to or 0)
+        # Interning lets repeated short messages ("gm", stickers' empty text) share one object
+        self.texts.append(sys.intern(text) if text and len(text) < 32 else text)
+        if username and userid != NO_SENDER:
+            self.usernames[userid] = username
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        """Yield ``(msg_id, userid, text, epoch)`` per message, newest first."""
+        return zip(self.ids, self.userids, self.texts, self.dates)
+
+    def has_user(self, userid):
+        return _as_int(userid) in self._rows_by_user
+
+    def username(self, userid):
+        return self.usernames.get(_as_int(userid))
+
+    def count(self, userid):
+        return len(self._rows_by_user.get(_as_int(userid), ()))
+
+    def senders(self):
+        """Distinct sender ids in the batch."""
+        return [userid for userid in self._rows_by_user if userid != NO_SENDER]
+
+    def to_dicts(self):
+        """The per-message dict format, for JSON dumps and debugging."""
+        return [
+            {
+                "id": msg_id,
+                "username": self.usernames.get(userid),
+                "userid": None if userid == NO_SENDER else userid,
+                "text": text,
+                "date": datetime.fromtimestamp(date, timezone.utc).isoformat()
+            }
+            for msg_id, userid, text, date in self
+        ]
+
+
+def _as_int(userid):
+    try:
+        return int(userid)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,43 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Async token bucket: ``rate`` requests per second with bursts of up to ``capacity``.
+
+    ``pause()`` drains the bucket and blocks every caller until a server
+    imposed wait (a Telegram FloodWait/RetryAfter) has passed, so one
+    bucket per group or chat keeps a penalised peer from stalling the rest.
+    """
+
+    def __init__(self, rate=1.0, capacity=5):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds):
+        now = time.monotonic()
+        self._blocked_until = max(self._blocked_until, now + seconds)
+        # Exactly one request (the retry) may go once the wait is over
+        self._tokens = 1
+        self._updated = self._blocked_until
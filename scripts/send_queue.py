@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from rate_limit import TokenBucket
+
+
+logger = logging.getLogger(__name__)
+
+
+class SendQueue:
+    """Outbound Bot API queue with one ordered worker per chat.
+
+    ``put()`` returns immediately; each chat's worker paces sends with its
+    own TokenBucket (the Bot API allows about 20 messages a minute in a
+    group), waits out ``RetryAfter`` and retries other transient errors
+    with exponential backoff. ``drain()`` waits for everything queued and
+    ``stats()`` reports delivery latency and failure counts.
+    """
+
+    def __init__(self, bot, rate=20 / 60, burst=3, max_retries=5, backoff=1.0):
+        self.bot = bot
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._queues = {}
+        self._workers = {}
+        self._buckets = {}
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self._latencies = []
+
+    def put(self, chat_id, text):
+        """Queue ``text`` for ``chat_id``; the returned future resolves to True once delivered, False if dropped."""
+        if chat_id not in self._queues:
+            self._queues[chat_id] = asyncio.Queue()
+            self._buckets[chat_id] = TokenBucket(self.rate, self.burst)
+            self._workers[chat_id] = asyncio.create_task(self._worker(chat_id))
+        delivered = asyncio.get_running_loop().create_future()
+        self._queues[chat_id].put_nowait((text, time.monotonic(), delivered))
+        return delivered
+
+    async def _worker(self, chat_id):
+        queue = self._queues[chat_id]
+        while True:
+            text, queued_at, delivered = await queue.get()
+            try:
+                ok = await self._deliver(chat_id, text)
+                if ok:
+                    self.sent += 1
+                    self._latencies.append(time.monotonic() - queued_at)
+                else:
+                    self.failed += 1
+                delivered.set_result(ok)
+            finally:
+                queue.task_done()
+
+    async def _deliver(self, chat_id, text):
+        bucket = self._buckets[chat_id]
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.retries += 1
+            await bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text)
+                return True
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                logger.warning(f"RetryAfter {retry_after}s sending to {chat_id}")
+                bucket.pause(retry_after)
+            except (BadRequest, Forbidden) as e:
+                # The message or chat is invalid; retrying cannot help
+                logger.error(f"Dropping message to {chat_id}: {e}")
+                return False
+            except Exception as e:
+                if attempt == self.max_retries:
+                    break
+                delay = self.backoff * 2 ** attempt
+                logger.warning(f"Send to {chat_id} failed ({e}), retrying in {delay}s")
+                await asyncio.sleep(delay)
+        logger.error(f"Giving up on message to {chat_id} after {self.max_retries} retries")
+        return False
+
+    async def drain(self):
+        """Wait until every queued message is delivered or dropped, then stop the workers."""
+        for queue in self._queues.values():
+            await queue.join()
+        for worker in self._workers.values():
+            worker.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+        self._queues.clear()
+        self._workers.clear()
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'retries': self.retries,
+            'avg_latency_s': round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            'p95_latency_s': round(latencies[int(0.95 * (len(latencies) - 1))], 3) if latencies else 0.0,
+            'max_latency_s': round(latencies[-1], 3) if latencies else 0.0
+        }
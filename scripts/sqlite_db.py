@@ -0,0 +1,301 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import create_engine, MetaData
+
+try:
+    from db_migrations import migrate, sync_current_wallets, telegram_tables
+    from ttl_cache import TTLCache
+except ImportError:  # imported as scripts.sqlite_db by the maintenance scripts in the repo root
+    from .db_migrations import migrate, sync_current_wallets, telegram_tables
+    from .ttl_cache import TTLCache
+
+
+# Applied to every connection: WAL lets readers run while a writer commits,
+# NORMAL only fsyncs at checkpoints, and mmap serves reads from the page cache
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA busy_timeout=5000',
+)
+
+
+def connect(db_name, check_same_thread=True):
+    """Open a tuned, long-lived connection to one of the local SQLite databases."""
+    conn = sqlite3.connect(
+        db_name,
+        cached_statements=256,  # keep prepared statements for every query we issue
+        check_same_thread=check_same_thread
+    )
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def upsert_current_wallets(cursor, rows, current='waCurrent'):
+    """Point each (platform, id_type, user_key, wa, date) row's user at its new wallet."""
+    cursor.executemany(f'''
+    INSERT INTO {current} (platform, id_type, user_key, wa, date)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (platform, id_type, user_key) DO UPDATE SET
+        wa = excluded.wa,
+        date = excluded.date
+    ''', rows)
+
+
+class SQLiteDatabaseManager:
+    """Local gmetis.db backend with the same interface as the Azure DatabaseManager.
+
+    The schema comes from the same db_migrations steps, so rewardTotals
+    is maintained here exactly as on Azure. Holds one connection for the
+    lifetime of the manager instead of connecting per call. Writes commit
+    immediately unless they run inside ``batch()``, which commits once at
+    the end.
+    """
+
+    def __init__(self, db_name='gmetis.db'):
+        self.db_name = db_name
+        self.setup_database()
+        # Shared with the AsyncDatabaseManager worker threads; the lock serialises access
+        self.conn = connect(db_name, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._batch_depth = 0
+        self.cache = TTLCache(
+            maxsize=int(os.getenv('DB_CACHE_SIZE', 1024)),
+            ttl=int(os.getenv('DB_CACHE_TTL', 300))
+        )
+
+    def setup_database(self):
+        # Versioned migrations shared with the Azure backend; a single version check when already current
+        engine = create_engine(f'sqlite:///{self.db_name}')
+        try:
+            metadata = MetaData()
+            telegram_tables(metadata)
+            migrate(engine, metadata, 'telegram')
+            # Pick up wallets inserted into waMap outside the bots
+            with engine.begin() as conn:
+                sync_current_wallets(conn, 'sqlite', 'telegram')
+        finally:
+            engine.dispose()
+
+    @contextmanager
+    def batch(self):
+        """Group writes into one transaction; nested batches commit with the outermost one."""
+        with self._lock:
+            self._batch_depth += 1
+            try:
+                yield self.conn.cursor()
+            except Exception:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self.conn.rollback()
+                raise
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.conn.commit()
+
+    def _fetchone(self, query, params=()):
+        with self._lock:
+            return self.conn.execute(query, params).fetchone()
+
+    def get_last_winner(self):
+        return self.cache.get_or_load(('last_winner',), self._load_last_winner)
+
+    def _load_last_winner(self):
+        result = self._fetchone('SELECT userid FROM rewards ORDER BY date DESC, reward_round DESC LIMIT 1')
+        return result[0] if result else None
+
+    def get_latest_wa(self, identifier, value):
+        id_type = 'userID' if identifier == 'userID' else 'username'
+        return self.cache.get_or_load(('wa', id_type, str(value)), lambda: self._load_latest_wa(id_type, value))
+
+    def _load_latest_wa(self, id_type, value):
+        result = self._fetchone(
+            "SELECT wa FROM waCurrent WHERE platform = 'Telegram' AND id_type = ? AND user_key = ?",
+            (id_type, str(value))
+        )
+        return result[0] if result else None
+
+    def get_username(self, userid):
+        """Latest registered username for a Telegram userID, or None."""
+        return self.cache.get_or_load(('username', str(userid)), lambda: self._load_identity(
+            'username', 'userID', str(userid)
+        ))
+
+    def get_userid(self, username):
+        """Latest registered Telegram userID for a username, or None."""
+        return self.cache.get_or_load(('userID', username), lambda: self._load_identity(
+            'userID', 'username', username
+        ))
+
+    def _load_identity(self, wanted, column, value):
+        result = self._fetchone(
+            f'SELECT {wanted} FROM waMap WHERE {column} = ? ORDER BY ID DESC LIMIT 1',
+            (value,)
+        )
+        return result[0] if result else None
+
+    def invalidate_user(self, userid=None, username=None):
+        """Drop cached wallet/identity entries after this process writes waMap for a user."""
+        keys = []
+        if userid is not None:
+            keys += [('wa', 'userID', str(userid)), ('username', str(userid))]
+        if username is not None:
+            keys += [('wa', 'username', username), ('userID', username)]
+        self.cache.invalidate(*keys)
+
+    def _allocate_round(self, cursor):
+        cursor.execute("UPDATE round_counters SET value = value + 1 WHERE name = 'rewards' RETURNING value")
+        return cursor.fetchone()[0]
+
+    def allocate_reward_round(self):
+        with self.batch() as cursor:
+            return self._allocate_round(cursor)
+
+    def get_next_reward_round(self):
+        result = self._fetchone("SELECT value FROM round_counters WHERE name = 'rewards'")
+        return (result[0] if result else 0) + 1
+
+    def add_reward_entry(self, userid, reward_round=None, wa=None, balance=None, reward=None, tx=None):
+        current_date = datetime.now().date().isoformat()
+        with self.batch() as cursor:
+            if tx:
+                paid = cursor.execute(
+                    'SELECT userid, reward, date, tx FROM rewards WHERE reward_round = ? AND userid = ?',
+                    (reward_round, userid)
+                ).fetchall()
+                cursor.execute(
+                    'UPDATE rewards SET tx = ? WHERE reward_round = ? AND userid = ?',
+                    (tx, reward_round, userid)
+                )
+                # A first tx marks the reward paid
+                for paid_user, paid_reward, paid_date, previous_tx in paid:
+                    if previous_tx is None and paid_reward:
+                        self._add_to_totals(cursor, paid_user, paid_reward, paid_date)
+                self.cache.invalidate(('last_winner',))
+                return reward_round
+
+            if not reward_round:
+                reward_round = self._allocate_round(cursor)
+            cursor.execute('''
+                INSERT INTO rewards (userid, wa, balance, reward, tx, date, reward_round)
+                VALUES (?, ?, ?, ?, NULL, ?, ?)
+                ON CONFLICT (reward_round, userid) DO UPDATE SET
+                    wa = excluded.wa,
+                    balance = excluded.balance,
+                    reward = excluded.reward,
+                    date = excluded.date
+            ''', (userid, wa, balance, reward, current_date, reward_round))
+            self.cache.invalidate(('last_winner',))
+            return reward_round
+
+    def _add_to_totals(self, cursor, user, reward, paid_date):
+        # Runs inside the ledger write's transaction, so totals and ledger never diverge
+        paid_date = str(paid_date or datetime.now().date().isoformat())
+        cursor.executemany('''
+            INSERT INTO rewardTotals (period, userid, total_reward, reward_count, last_date)
+            VALUES (?, ?, ?, 1, ?)
+            ON CONFLICT (period, userid) DO UPDATE SET
+                total_reward = total_reward + excluded.total_reward,
+                reward_count = reward_count + 1,
+                last_date = MAX(last_date, excluded.last_date)
+        ''', [(period, user, reward, paid_date) for period in ('all', paid_date[:7])])
+
+    def get_leaderboard(self, period='all', limit=10):
+        """Top earners for ``period`` ('all' or 'YYYY-MM') as (userid, total_reward, reward_count) rows."""
+        with self._lock:
+            return self.conn.execute('''
+                SELECT userid, total_reward, reward_count FROM rewardTotals
+                WHERE period = ?
+                ORDER BY total_reward DESC
+                LIMIT ?
+            ''', (period, limit)).fetchall()
+
+    def get_user_totals(self, userid):
+        """All-time and per-month (period, total_reward, reward_count, last_date) rows for one user."""
+        with self._lock:
+            return self.conn.execute('''
+                SELECT period, total_reward, reward_count, last_date FROM rewardTotals
+                WHERE userid = ?
+                ORDER BY period DESC
+            ''', (str(userid),)).fetchall()
+
+    def get_user_history(self, userid, limit=20):
+        """Most recent ledger rows for one user, newest round first."""
+        with self._lock:
+            return self.conn.execute('''
+                SELECT reward_round, date, reward, wa, tx FROM rewards
+                WHERE userid = ?
+                ORDER BY reward_round DESC
+                LIMIT ?
+            ''', (str(userid), limit)).fetchall()
+
+    def add_pending_reward(self, userid):
+        with self.batch() as cursor:
+            reward_round = self._allocate_round(cursor)
+            cursor.execute(
+                'INSERT INTO rewards (userid, date, reward_round) VALUES (?, ?, ?)',
+                (userid, datetime.now().date().isoformat(), reward_round)
+            )
+            self.cache.invalidate(('last_winner',))
+            return reward_round
+
+    def get_pending_rewards(self):
+        with self._lock:
+            return self.conn.execute('''
+                SELECT reward_round, userid, date
+                FROM rewards
+                WHERE wa IS NULL AND tx IS NULL
+                ORDER BY date ASC, reward_round ASC
+            ''').fetchall()
+
+    def get_settleable_rewards(self, userid=None):
+        with self._lock:
+            return self.conn.execute('''
+                SELECT r.reward_round, r.userid, r.date, c.wa
+                FROM rewards r
+                JOIN waCurrent c
+                    ON c.platform = 'Telegram' AND c.id_type = 'userID' AND c.user_key = r.userid
+                WHERE r.wa IS NULL AND r.tx IS NULL AND c.wa IS NOT NULL
+                    AND (? IS NULL OR r.userid = ?)
+                ORDER BY r.date ASC, r.reward_round ASC
+            ''', (userid, None if userid is None else str(userid))).fetchall()
+
+    def add_wallets(self, rows):
+        """Insert (platform, userID, username, wa, date) rows into waMap in one transaction."""
+        with self.batch() as cursor:
+            cursor.executemany(
+                'INSERT INTO waMap (platform, userID, username, wa, date) VALUES (?, ?, ?, ?, ?)',
+                rows
+            )
+            inserted = cursor.rowcount
+            upsert_current_wallets(cursor, [
+                (platform or 'Telegram', id_type, key, wa, date_value)
+                for platform, userID, username, wa, date_value in rows
+                for id_type, key in (('userID', userID), ('username', username)) if key
+            ])
+        for _, userID, username, _, _ in rows:
+            self.invalidate_user(userid=userID, username=username)
+        return inserted
+
+    def update_wa(self, userID, new_wa):
+        with self.batch() as cursor:
+            cursor.execute('UPDATE waMap SET wa = ? WHERE userID = ?', (new_wa, userID))
+            updated = cursor.rowcount
+            cursor.execute('''
+                UPDATE waCurrent SET wa = ?
+                WHERE (id_type = 'userID' AND user_key = ?)
+                   OR (id_type = 'username' AND user_key IN (SELECT username FROM waMap WHERE userID = ?))
+            ''', (new_wa, userID, userID))
+        # The user's usernames are not known here; drop every cached wallet
+        self.cache.clear()
+        return updated
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,83 @@
+import csv
+import os
+import sys
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, text
+
+# addUsersFromCSV lives at the repository root and imports scripts.db_migrations
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+import addUsersFromCSV  # noqa: E402
+
+ALICE = '0x' + 'a1' * 20
+BOB = '0x' + 'b2' * 20
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    engine = create_engine(f'sqlite:///{tmp_path / "gmetis.db"}')
+    with engine.begin() as conn:
+        conn.execute(text(
+            'CREATE TABLE waMap (ID INTEGER PRIMARY KEY AUTOINCREMENT, platform TEXT, userID TEXT, username TEXT, wa TEXT, date DATE)'
+        ))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(addUsersFromCSV, 'get_engine', lambda: engine)
+    addUsersFromCSV.has_current_wallets.cache_clear()
+    yield engine
+    engine.dispose()
+
+
+def _register(engine, userID, username, wa):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO waMap (platform, userID, username, wa, date) VALUES ('Telegram', :u, :n, :w, '2025-01-01')"
+        ), {'u': userID, 'n': username, 'w': wa})
+
+
+def _write_csv(rows):
+    with open('newusers.csv', 'w', newline='') as f:
+        csv.writer(f).writerows([['userID', 'username', 'wa'], *rows])
+
+
+def _csv_rows(path='newusers.csv'):
+    with open(path, newline='') as f:
+        return list(csv.reader(f))
+
+
+def test_drop_existing_keeps_username_changes(engine):
+    checksummed = addUsersFromCSV.to_checksum_address(ALICE)
+    _register(engine, '1', 'alice', checksummed)
+    rows = [
+        ('Telegram', '1', 'alice', checksummed, date.today()),      # exact repeat
+        ('Telegram', '1', 'alice_new', checksummed, date.today()),  # renamed, same wallet
+        ('Telegram', '2', 'bob', BOB, date.today()),
+    ]
+    kept = addUsersFromCSV.drop_existing(engine, rows)
+    assert [row[2] for row in kept] == ['alice_new', 'bob']
+
+
+def test_csv_cleared_with_actual_insert_count(engine, caplog):
+    _register(engine, '1', 'alice', addUsersFromCSV.to_checksum_address(ALICE))
+    _write_csv([['1', 'alice', ALICE], ['2', '@bob', BOB], ['3', 'carol', '0x' + 'ab' * 32]])
+
+    with caplog.at_level('INFO'):
+        addUsersFromCSV.read_csv_and_insert('newusers.csv', 'Telegram')
+
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT username FROM waMap WHERE userID = '2'")).scalar() == 'bob'
+        assert conn.execute(text('SELECT COUNT(*) FROM waMap')).scalar() == 2
+    assert 'Inserted 1 of 3 rows' in caplog.text
+    assert _csv_rows() == [['userID', 'username', 'wa']]
+    assert [row[0] for row in _csv_rows(addUsersFromCSV.REJECTED_CSV)] == ['userID', '3']
+
+
+def test_csv_kept_when_ingest_fails(engine, monkeypatch):
+    _write_csv([['2', 'bob', BOB]])
+
+    def failing(engine, rows):
+        raise RuntimeError('database unavailable')
+    monkeypatch.setattr(addUsersFromCSV, 'bulk_ingest', failing)
+
+    addUsersFromCSV.read_csv_and_insert('newusers.csv', 'Telegram')
+    assert _csv_rows() == [['userID', 'username', 'wa'], ['2', 'bob', BOB]]
@@ -0,0 +1,98 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from announcement_pool import TEMPLATES, VARIANTS_FILE, AnnouncementPool
+
+VALUES = {'reward_round': 12, 'username': 'alice', 'reward_amount': 5, 'tx_hash': 'ab' * 32}
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = AnnouncementPool(str(tmp_path / 'announcements.db'))
+    yield pool
+    pool.close()
+
+
+def test_template_is_used_until_variants_exist(pool):
+    assert pool.render('winner', **VALUES) == TEMPLATES['winner'].format(**VALUES)
+
+
+def test_variants_must_keep_the_placeholders(pool):
+    good = "Round #{reward_round}: well done @{username}, {reward_amount} gMetis sent! Tx 0x{tx_hash}"
+    assert pool.add('winner', good)
+    assert not pool.add('winner', good)  # already pooled
+    assert not pool.add('winner', "Well done @{username}!")  # drops the amount and tx
+    assert not pool.add('winner', good + " {bot_username}")
+    assert not pool.add('winner', good + " {unbalanced")
+    assert not pool.add('winner', good + "!" * 2 * len(TEMPLATES['winner']))  # rambling
+    assert pool.stats() == {'winner': {'variants': 1, 'posted': 0}}
+
+
+def test_rotation_uses_every_variant_before_repeating(pool):
+    texts = [f"#{i} Round {{reward_round}} @{{username}} {{reward_amount}} 0x{{tx_hash}}" for i in range(3)]
+    for text in texts:
+        pool.add('winner', text)
+
+    posted = [pool.render('winner', **VALUES).split()[0] for _ in range(9)]
+    for cycle in range(3):
+        assert sorted(posted[cycle * 3:cycle * 3 + 3]) == ['#0', '#1', '#2']
+    assert all(a != b for a, b in zip(posted, posted[1:]))
+
+    # A new variant joins the current cycle instead of being replayed until it catches up
+    pool.add('winner', "#3 Round {reward_round} @{username} {reward_amount} 0x{tx_hash}")
+    posted = [pool.render('winner', **VALUES).split()[0] for _ in range(4)]
+    assert sorted(posted) == ['#0', '#1', '#2', '#3']
+
+
+def test_rejected_variants_are_not_posted(pool):
+    pool.add('pending', "Round {reward_round}: @{username}, DM @{bot_username} your wallet!")
+    variant_id = pool.conn.execute('SELECT variant_id FROM variants').fetchone()[0]
+    assert pool.reject(variant_id)
+    values = {'reward_round': 1, 'username': 'bob', 'bot_username': 'AgentG'}
+    assert pool.render('pending', **values) == TEMPLATES['pending'].format(**values)
+
+
+def test_generate_keeps_only_valid_choices(pool, monkeypatch):
+    choices = [
+        "Round {reward_round} - @{username} - {reward_amount} gMetis - 0x{tx_hash} - {date}",
+        "Congrats @{username}!",
+    ]
+    monkeypatch.setattr('announcement_pool.openai.ChatCompletion.create', lambda **kwargs: SimpleNamespace(
+        choices=[SimpleNamespace(message={'content': text}) for text in choices[:kwargs['n']]]
+    ))
+    assert pool.generate('retroactive', count=2) == 1
+
+
+def test_committed_variants_are_valid(pool):
+    with open(VARIANTS_FILE, encoding='utf-8') as f:
+        variants = json.load(f)
+    assert set(variants) == set(TEMPLATES)
+    for template, texts in variants.items():
+        assert texts
+        assert [pool.validate(template, text) for text in texts] == [None] * len(texts)
+
+
+def test_seeding_is_idempotent_and_keeps_rejections(pool):
+    seeded = pool.seed()
+    assert seeded == sum(stats['variants'] for stats in pool.stats().values())
+    assert set(pool.stats()) == set(TEMPLATES)
+    assert pool.render('winner', **VALUES) != TEMPLATES['winner'].format(**VALUES)
+
+    pool.reject(1)
+    assert pool.seed() == 0
+    assert sum(stats['variants'] for stats in pool.stats().values()) == seeded - 1
+
+
+def test_export_round_trips_through_seed(pool, tmp_path):
+    pool.add('winner', "Round #{reward_round}: well done @{username}, {reward_amount} gMetis sent! Tx 0x{tx_hash}")
+    path = str(tmp_path / 'variants.json')
+    assert pool.export(path) == 1
+
+    fresh = AnnouncementPool(str(tmp_path / 'fresh.db'))
+    try:
+        assert fresh.seed(path) == 1
+        assert fresh.stats() == {'winner': {'variants': 1, 'posted': 0}}
+    finally:
+        fresh.close()
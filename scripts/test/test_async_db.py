@@ -0,0 +1,51 @@
+import asyncio
+import threading
+
+from sqlalchemy import create_engine
+
+from async_db import AsyncDatabaseManager
+
+
+class FakeManager:
+    """Stands in for DatabaseManager: a pooled engine and blocking methods."""
+
+    def __init__(self, path):
+        self.engine = create_engine(f'sqlite:///{path}')
+        self.threads = []
+        self.label = 'fake'
+
+    def get_last_winner(self):
+        self.threads.append(threading.current_thread())
+        return '7'
+
+    def close(self):
+        self.engine.dispose()
+
+
+def test_methods_run_off_the_event_loop(tmp_path):
+    async def main():
+        db = await AsyncDatabaseManager.create(FakeManager, tmp_path / 'gmetis.db')
+        try:
+            assert await db.get_last_winner() == '7'
+            assert db.db_manager.threads[0] is not threading.current_thread()
+            # Attributes that are not methods pass straight through
+            assert db.label == 'fake'
+        finally:
+            db.close()
+
+    asyncio.run(main())
+
+
+def test_workers_match_the_connection_pool(tmp_path):
+    manager = FakeManager(tmp_path / 'gmetis.db')
+    db = AsyncDatabaseManager(manager)
+    assert db._executor._max_workers == manager.engine.pool.size()
+    db.close()
+
+
+def test_sqlite_backend_gets_one_worker(tmp_path):
+    from sqlite_db import SQLiteDatabaseManager
+
+    db = AsyncDatabaseManager(SQLiteDatabaseManager(str(tmp_path / 'gmetis.db')))
+    assert db._executor._max_workers == 1
+    db.close()
@@ -0,0 +1,61 @@
+import asyncio
+import threading
+import time
+
+from async_llm import AsyncLLMClient
+
+
+class FakeCache:
+    def __init__(self, delay=0.0, error=None):
+        self.delay = delay
+        self.error = error
+        self.calls = []
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def complete(self, model, messages, request_timeout=None, **params):
+        with self._lock:
+            self.calls.append(request_timeout)
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            time.sleep(self.delay)
+            if self.error:
+                raise self.error
+            return f'{model}: {messages[0]["content"]}'
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    def stats(self):
+        return {'hits': 0}
+
+
+def _ask(client, count, fallback=None):
+    async def main():
+        try:
+            return await asyncio.gather(*(
+                client.complete('gpt-4', [{'role': 'user', 'content': str(i)}], fallback=fallback) for i in range(count)
+            ))
+        finally:
+            client.close()
+    return asyncio.run(main())
+
+
+def test_calls_are_bounded_and_pass_the_timeout():
+    cache = FakeCache(delay=0.05)
+    answers = _ask(AsyncLLMClient(cache, max_concurrency=2, timeout=7), 6)
+    assert answers == [f'gpt-4: {i}' for i in range(6)]
+    assert cache.peak == 2
+    assert cache.calls == [7] * 6
+
+
+def test_timeouts_and_errors_return_the_fallback():
+    client = AsyncLLMClient(FakeCache(delay=0.5), timeout=0.05)
+    assert _ask(client, 2, fallback='top scorer') == ['top scorer', 'top scorer']
+    assert client.stats() == {'timeouts': 2, 'failures': 0, 'hits': 0}
+
+    client = AsyncLLMClient(FakeCache(error=RuntimeError('rate limited')))
+    assert _ask(client, 1) == [None]
+    assert client.failures == 1
@@ -0,0 +1,36 @@
+from conversation_packer import pack_conversation
+from message_batch import MessageBatch
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def _batch(rows):
+    # Given oldest first; a MessageBatch is newest first
+    return MessageBatch.from_rows(
+        (msg_id, userid, None, text, 1700000000 + msg_id) for msg_id, (userid, text) in reversed(list(enumerate(rows, 1)))
+    )
+
+
+def test_whole_window_fits_after_folding_repeats():
+    batch = _batch([(1, 'gm'), (1, 'gm'), (2, 'hello   \n world'), (1, 'gm'), (3, '')])
+    text, stats = pack_conversation(batch, budget=100, count_tokens=count_words)
+    assert text == '1: gm (x3)\n2: hello world'
+    assert stats['messages_included'] == stats['messages_with_text'] == 4
+    assert stats['char_cap'] == 400
+
+
+def test_long_messages_are_clipped_before_lines_are_dropped():
+    batch = _batch([(1, 'word ' * 150), (2, 'short')])
+    text, stats = pack_conversation(batch, budget=60, count_tokens=count_words)
+    assert stats['char_cap'] < 400
+    assert stats['lines'] == 2 and stats['tokens'] <= 60
+    assert text.splitlines()[0].endswith('…')
+
+
+def test_oldest_lines_dropped_as_last_resort():
+    batch = _batch([(userid, f'message number {userid}') for userid in range(1, 11)])
+    text, stats = pack_conversation(batch, budget=15, count_tokens=count_words)
+    assert text.splitlines() == ['8: message number 8', '9: message number 9', '10: message number 10']
+    assert stats['messages_included'] == 3 and stats['messages_in_window'] == 10
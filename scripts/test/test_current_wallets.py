@@ -0,0 +1,46 @@
+import sqlite3
+
+from sqlalchemy import create_engine, text
+
+from db_migrations import sync_current_wallets
+from sqlite_db import SQLiteDatabaseManager
+
+
+def test_out_of_band_registrations_become_visible(tmp_path):
+    path = str(tmp_path / 'gmetis.db')
+    SQLiteDatabaseManager(path).close()
+
+    # e.g. a manual INSERT in the database console, bypassing waCurrent
+    conn = sqlite3.connect(path)
+    conn.executemany('INSERT INTO waMap (platform, userID, username, wa, date) VALUES (?, ?, ?, ?, ?)', [
+        ('Telegram', '9', 'bob', '0xold', '2025-01-01'),
+        ('Telegram', '9', 'bob', '0xnew', '2025-01-02'),
+    ])
+    conn.commit()
+    conn.close()
+
+    db = SQLiteDatabaseManager(path)
+    assert db.get_latest_wa('userID', 9) == '0xnew'
+    assert db.get_latest_wa('username', 'bob') == '0xnew'
+    db.close()
+
+
+def test_x_schema_sync_is_incremental(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "x.db"}')
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE sync_marks (name VARCHAR(32) PRIMARY KEY, value INTEGER NOT NULL)'))
+        conn.execute(text(
+            'CREATE TABLE xwaMap (ID INTEGER PRIMARY KEY AUTOINCREMENT, platform TEXT, username TEXT, wa TEXT, date DATE)'
+        ))
+        conn.execute(text('''
+            CREATE TABLE xwaCurrent (platform VARCHAR(32), id_type VARCHAR(16), user_key VARCHAR(64), wa VARCHAR(128),
+                                     date DATE, PRIMARY KEY (platform, id_type, user_key))
+        '''))
+        conn.execute(text("INSERT INTO xwaMap (platform, username, wa, date) VALUES ('twitter', 'carol', '0xc', '2025-01-01')"))
+        assert sync_current_wallets(conn, 'sqlite', 'x') == 1
+        assert sync_current_wallets(conn, 'sqlite', 'x') == 0
+        conn.execute(text("INSERT INTO xwaMap (platform, username, wa, date) VALUES (NULL, 'carol', '0xd', '2025-01-02')"))
+        assert sync_current_wallets(conn, 'sqlite', 'x') == 1
+        rows = conn.execute(text('SELECT platform, id_type, user_key, wa FROM xwaCurrent')).fetchall()
+    engine.dispose()
+    assert rows == [('twitter', 'username', 'carol', '0xd')]
@@ -0,0 +1,164 @@
+import threading
+
+import pytest
+from sqlalchemy import create_engine, text, MetaData
+
+import db_migrations
+from db_migrations import LATEST_VERSION, migrate, get_schema_version, telegram_tables
+
+
+def _legacy_tables(engine):
+    # Shape of the tables before the first migration, with a duplicated payout
+    with engine.begin() as conn:
+        conn.execute(text('''
+            CREATE TABLE rewards (ID INTEGER PRIMARY KEY AUTOINCREMENT, userid TEXT, wa TEXT, balance INTEGER,
+                                  reward INTEGER, tx TEXT, date DATE, reward_round INTEGER)
+        '''))
+        conn.execute(text(
+            'CREATE TABLE waMap (ID INTEGER PRIMARY KEY AUTOINCREMENT, platform TEXT, userID TEXT, username TEXT, wa TEXT, date DATE)'
+        ))
+        conn.execute(text('''
+            INSERT INTO rewards (reward_round, userid, wa, date, reward, tx) VALUES
+                (1, '7', '0xa', '2025-01-01', 100, 'aa'),
+                (1, '7', NULL, '2025-01-01', 100, NULL),
+                (2, '8', '0xb', '2025-02-01', 50, 'bb')
+        '''))
+        conn.execute(text(
+            "INSERT INTO waMap (platform, userID, username, wa, date) VALUES ('Telegram', '7', 'alice', '0xa', '2025-01-01')"
+        ))
+
+
+def test_migration_steps_from_legacy_tables(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "gmetis.db"}')
+    _legacy_tables(engine)
+    metadata = MetaData()
+    telegram_tables(metadata)
+
+    assert migrate(engine, metadata, 'telegram') == LATEST_VERSION
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT COUNT(*) FROM rewards WHERE reward_round = 1')).scalar() == 1
+        # The folded unpaid copy is kept for audit
+        assert conn.execute(text('SELECT reward_round, userid, tx FROM rewards_duplicates')).all() == [(1, '7', None)]
+        assert conn.execute(text("SELECT value FROM round_counters WHERE name = 'rewards'")).scalar() == 2
+        # The waMap sync mark is kept apart from the round counters
+        assert conn.execute(text('SELECT name, value FROM sync_marks')).all() == [('waCurrent', 1)]
+        assert conn.execute(text('SELECT name FROM round_counters')).scalars().all() == ['rewards']
+        assert conn.execute(text(
+            "SELECT wa FROM waCurrent WHERE id_type = 'userID' AND user_key = '7'"
+        )).scalar() == '0xa'
+        totals = dict(conn.execute(text("SELECT userid, total_reward FROM rewardTotals WHERE period = 'all'")).all())
+    assert totals == {'7': 100, '8': 50}
+
+    # Already current: a no-op
+    assert migrate(engine, metadata, 'telegram') == LATEST_VERSION
+    engine.dispose()
+
+
+def test_sync_mark_moves_out_of_round_counters(tmp_path, monkeypatch):
+    engine = create_engine(f'sqlite:///{tmp_path / "gmetis.db"}')
+    _legacy_tables(engine)
+    metadata = MetaData()
+    telegram_tables(metadata)
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM rewards WHERE tx IS NULL"))
+
+    # A database migrated before sync_marks existed kept the mark in round_counters
+    monkeypatch.setattr(db_migrations, 'MIGRATIONS', db_migrations.MIGRATIONS[:4])
+    monkeypatch.setattr(db_migrations, 'LATEST_VERSION', 4)
+    migrate(engine, metadata, 'telegram')
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO round_counters (name, value) SELECT name, value FROM sync_marks"))
+        conn.execute(text("DROP TABLE sync_marks"))
+    monkeypatch.undo()
+
+    assert migrate(engine, metadata, 'telegram') == LATEST_VERSION
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT name, value FROM sync_marks')).all() == [('waCurrent', 1)]
+        assert conn.execute(text('SELECT name FROM round_counters')).scalars().all() == ['rewards']
+    engine.dispose()
+
+
+def test_possible_double_payment_fails_the_migration(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "gmetis.db"}')
+    _legacy_tables(engine)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO rewards (reward_round, userid, wa, date, reward, tx) VALUES (2, '8', '0xb', '2025-02-01', 50, 'cc')"
+        ))
+    metadata = MetaData()
+    telegram_tables(metadata)
+
+    with pytest.raises(RuntimeError, match='double payments') as error:
+        migrate(engine, metadata, 'telegram')
+    assert "'tx': 'bb'" in str(error.value) and "'tx': 'cc'" in str(error.value)
+    # Nothing was deleted or migrated
+    assert get_schema_version(engine, 'telegram') == 0
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT COUNT(*) FROM rewards')).scalar() == 4
+    engine.dispose()
+
+
+def test_concurrent_first_runs_apply_each_step_once(tmp_path, monkeypatch):
+    path = tmp_path / 'gmetis.db'
+    _legacy_tables(create_engine(f'sqlite:///{path}'))
+
+    applied = []
+    steps = [(version, step) for version, step in db_migrations.MIGRATIONS]
+
+    def counted(version, step):
+        def run(conn, dialect, metadata, schema):
+            applied.append(version)
+            step(conn, dialect, metadata, schema)
+        run.__doc__ = step.__doc__
+        return run
+    monkeypatch.setattr(db_migrations, 'MIGRATIONS', [(version, counted(version, step)) for version, step in steps])
+
+    # Both runs pass the unlocked version check before either takes the lock
+    barrier = threading.Barrier(2)
+    real_version = db_migrations.get_schema_version
+
+    def version_then_wait(engine, schema):
+        version = real_version(engine, schema)
+        barrier.wait(timeout=10)
+        return version
+    monkeypatch.setattr(db_migrations, 'get_schema_version', version_then_wait)
+
+    results, errors = [], []
+
+    def run():
+        engine = create_engine(f'sqlite:///{path}')
+        metadata = MetaData()
+        telegram_tables(metadata)
+        try:
+            results.append(migrate(engine, metadata, 'telegram'))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            engine.dispose()
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=60)
+
+    assert errors == []
+    assert results == [LATEST_VERSION, LATEST_VERSION]
+    assert sorted(applied) == [version for version, _ in steps]
+    assert real_version(create_engine(f'sqlite:///{path}'), 'telegram') == LATEST_VERSION
+
+
+def test_failed_step_rolls_back_on_sqlite(tmp_path, monkeypatch):
+    engine = create_engine(f'sqlite:///{tmp_path / "gmetis.db"}')
+    _legacy_tables(engine)
+    metadata = MetaData()
+    telegram_tables(metadata)
+
+    def broken(conn, dialect, metadata, schema):
+        raise RuntimeError('boom')
+    monkeypatch.setattr(db_migrations, 'MIGRATIONS', db_migrations.MIGRATIONS[:1] + [(2, broken)])
+
+    with pytest.raises(RuntimeError):
+        migrate(engine, metadata, 'telegram')
+    assert get_schema_version(engine, 'telegram') == 0
+    engine.dispose()
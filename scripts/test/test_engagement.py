@@ -0,0 +1,65 @@
+import json
+
+from engagement import EngagementCounter
+from engagement_scorer import top_candidates
+
+
+def test_window_expires_old_messages(monkeypatch):
+    monkeypatch.setattr('engagement.time.time', lambda: 60)
+    counter = EngagementCounter(window_s=100)
+    counter.add(1, 'alice', ts=0, text='hello')
+    counter.add(2, 'bob', ts=50, text='hi')
+    counter.add(2, 'bob', ts=60, text='again')
+    counter.expire(now=120)
+    assert dict(counter.messages) == {2: 2}
+    assert 1 not in counter.chars
+
+
+def test_leaderboard_ranks_and_excludes(monkeypatch):
+    monkeypatch.setattr('engagement.time.time', lambda: 1000)
+    counter = EngagementCounter(window_s=3600)
+    for userid, text in [(1, 'a'), (1, 'bb'), (2, 'c'), (3, 'dddd'), (3, 'e')]:
+        counter.add(userid, f'user{userid}', ts=999, text=text)
+    assert [row[0] for row in counter.leaderboard()] == [3, 1, 2]
+    assert [row[0] for row in counter.leaderboard(excluded=[3])] == [1, 2]
+    assert counter.leaderboard(limit=1) == [(3, 'user3', 2, 5)]
+
+
+def test_snapshot_round_trip(monkeypatch):
+    monkeypatch.setattr('engagement.time.time', lambda: 1000)
+    counter = EngagementCounter(window_s=3600)
+    counter.add(7, 'carol', ts=900, text='gm')
+    restored = EngagementCounter.restore(counter.snapshot(), 3600)
+    assert restored.leaderboard() == counter.leaderboard()
+
+
+def test_window_feeds_the_scorer(monkeypatch):
+    monkeypatch.setattr('engagement.time.time', lambda: 1000)
+    counter = EngagementCounter(window_s=3600)
+    counter.add(9, 'old', ts=-3000, text='expired', msg_id=1)
+    counter.add(1, 'alice', ts=900, text='How do I bridge METIS to L2 without paying the high fees?', msg_id=10)
+    for i, userid in enumerate((2, 3, 4)):
+        counter.add(userid, f'user{userid}', ts=901 + i, text='Use the native bridge, it is cheaper', msg_id=11 + i,
+                    reply_to=10)
+    # A spammer posts the most messages but starts no conversation
+    for i in range(10):
+        counter.add(5, 'spammer', ts=910 + i, text='gm', msg_id=20 + i)
+
+    window = counter.window()
+    assert list(window.ids) == list(range(29, 19, -1)) + [13, 12, 11, 10]
+    assert list(window.reply_to)[-4:] == [10, 10, 10, 0]
+    assert window.username(1) == 'alice'
+    assert counter.leaderboard(limit=1)[0][0] == 5
+    assert top_candidates(window, excluded=[], limit=3, margin=0.1)[0] == 1
+
+
+def test_old_snapshots_are_not_restored(monkeypatch):
+    monkeypatch.setattr('engagement.time.time', lambda: 1000)
+    legacy = {'window_s': 3600, 'taken_at': 990, 'events': [[900, 7, 2]], 'usernames': {'7': 'carol'}}
+    assert EngagementCounter.restore(legacy, 3600) is None
+
+    counter = EngagementCounter(window_s=3600)
+    counter.add(7, 'carol', ts=900, text='gm', msg_id=3, reply_to=2)
+    restored = EngagementCounter.restore(json.loads(json.dumps(counter.snapshot())), 3600)
+    assert restored.window().to_dicts() == counter.window().to_dicts()
+    assert list(restored.window().reply_to) == [2]
@@ -0,0 +1,44 @@
+from engagement_scorer import score_users, top_candidates
+from message_batch import MessageBatch
+
+
+def _batch(rows):
+    # (msg_id, userid, text, reply_to); dates do not affect the score
+    return MessageBatch.from_rows(
+        (msg_id, userid, f'user{userid}', text, 1700000000 + msg_id, reply_to)
+        for msg_id, userid, text, reply_to in rows
+    )
+
+
+def test_replies_and_partners_outweigh_volume():
+    batch = _batch([
+        (1, 1, 'question about staking', 0),
+        (2, 2, 'answer', 1),
+        (3, 3, 'me too', 1),
+        (4, 1, 'thanks', 2),
+        (5, 4, 'gm', 0),
+        (6, 4, 'gm', 0),
+        (7, 4, 'gm', 0),
+        (8, 2, 'reply to a message outside the window', 999),
+    ])
+    users, scores, features = score_users(batch)
+    assert users[0] == 1
+    assert list(scores) == sorted(scores, reverse=True)
+    first = list(users).index(1)
+    assert features['replies_received'][first] == 2
+    assert features['partners'][first] == 2
+    assert features['messages'][list(users).index(4)] == 3
+
+
+def test_self_replies_and_anonymous_senders_do_not_count():
+    batch = _batch([(1, 5, 'a', 0), (2, 5, 'b', 1), (3, None, 'channel post', 1), (4, 6, 'c', 3)])
+    users, _, features = score_users(batch)
+    assert 0 not in users
+    assert features['replies_received'][list(users).index(5)] == 0
+
+
+def test_excluded_users_and_candidate_margin():
+    batch = _batch([(1, 1, 'hello there', 0), (2, 2, 'hello there', 0), (3, 3, 'x', 0)])
+    assert top_candidates(batch, margin=0.1) == [1, 2]
+    assert top_candidates(batch, excluded=['1']) == [2]
+    assert top_candidates(MessageBatch()) == []
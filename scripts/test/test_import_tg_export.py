@@ -0,0 +1,54 @@
+import json
+from datetime import datetime, timezone
+
+import import_tg_export
+from import_tg_export import chat_peer_id, import_export, sender_id
+from message_archive import MessageArchive
+
+
+EXPORT = {
+    'name': 'Metis Community',
+    'type': 'private_supergroup',
+    'id': 1234,
+    'messages': [
+        {'id': 1, 'type': 'service', 'date': '2024-01-01T00:00:00', 'date_unixtime': '1704067200', 'from_id': 'user7'},
+        {'id': 2, 'type': 'message', 'date': '2024-01-01T00:01:00', 'date_unixtime': '1704067260', 'from_id': 'user7',
+         'text': 'gm'},
+        {'id': 3, 'type': 'message', 'date': '2024-01-01T00:02:00', 'from_id': 'channel99',
+         'text': ['see ', {'type': 'link', 'text': 'metis.io'}, '!'], 'reply_to_message_id': 2},
+        {'id': 4, 'type': 'message', 'date': '2024-01-01T00:03:00', 'date_unixtime': '1704067380', 'from_id': 'user8',
+         'text': 'ünïcode ✓ ' * 5},
+    ],
+    'trailing': {'after': 'messages'},
+}
+
+
+def test_ids_use_telethon_peer_format():
+    assert chat_peer_id({'id': 1234, 'type': 'public_supergroup'}) == -1001234
+    assert chat_peer_id({'id': 1234, 'type': 'private_group'}) == -1234
+    assert sender_id('user7') == 7
+    assert sender_id('channel99') == -10099
+    assert sender_id(None) is None
+
+
+def test_streams_export_across_chunk_boundaries(tmp_path, monkeypatch):
+    # Tiny chunks split keys, strings and multi-byte characters between reads
+    monkeypatch.setattr(import_tg_export, 'CHUNK_SIZE', 7)
+    monkeypatch.setattr(import_tg_export, 'BATCH_SIZE', 2)
+    path = tmp_path / 'result.json'
+    path.write_text(json.dumps(EXPORT, ensure_ascii=False, indent=1), encoding='utf-8')
+
+    archive = MessageArchive(str(tmp_path / 'messages.db'))
+    archive.set_users({7: 'alice'})
+    group_id, imported = import_export(str(path), archive)
+    assert (group_id, imported) == (-1001234, 3)
+
+    window = archive.get_window(group_id, datetime(2024, 1, 1, tzinfo=timezone.utc))
+    assert list(window.ids) == [4, 3, 2]
+    assert window.texts[1] == 'see metis.io!'
+    assert window.texts[0] == 'ünïcode ✓ ' * 5
+    assert window.username(7) == 'alice'
+    assert list(window.reply_to) == [0, 2, 0]
+    # The backfill is recorded as covered history
+    assert archive.sync_point(group_id, datetime(2024, 1, 1, 0, 1, tzinfo=timezone.utc)) == 4
+    archive.close()
@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+import pytest
+
+from llm_cache import LLMCache
+
+QUESTION = [{'role': 'user', 'content': 'Who was most engaging?'}]
+
+
+@pytest.fixture
+def api(monkeypatch):
+    calls = []
+
+    def create(model, messages, **params):
+        calls.append(params)
+        return SimpleNamespace(choices=[SimpleNamespace(message={'content': f'answer {len(calls)}'})])
+    monkeypatch.setattr('llm_cache.openai.ChatCompletion.create', create)
+    return calls
+
+
+def test_repeated_question_is_served_from_disk(tmp_path, api):
+    path = str(tmp_path / 'llm_cache.db')
+    cache = LLMCache(path)
+    assert cache.complete('gpt-4', QUESTION, temperature=0, request_timeout=5) == 'answer 1'
+    # The timeout is sent to the API but does not change the key
+    assert api == [{'temperature': 0, 'request_timeout': 5}]
+    assert cache.complete('gpt-4', QUESTION, temperature=0) == 'answer 1'
+    assert cache.complete('gpt-4', QUESTION, temperature=1) == 'answer 2'
+    cache.close()
+
+    # A rerun after a crash gets the stored answer
+    cache = LLMCache(path)
+    assert cache.complete('gpt-4', QUESTION, temperature=0) == 'answer 1'
+    assert len(api) == 2
+    assert cache.stats()['hits'] == 1
+    cache.close()
+
+
+def test_expiry_and_lru_eviction(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('llm_cache.time.time', lambda: now[0])
+    cache = LLMCache(str(tmp_path / 'llm_cache.db'), ttl=100, max_entries=2)
+    cache.set('a', 'gpt-4', 'A')
+    now[0] += 1
+    cache.set('b', 'gpt-4', 'B')
+    now[0] += 1
+    cache.get('a')  # 'b' is now the least recently used
+    cache.set('c', 'gpt-4', 'C')
+    assert cache.get('b') is None
+    assert cache.get('a') == 'A'
+
+    now[0] += 101
+    assert cache.get('c') is None  # stored 101s ago
+    assert cache.stats()['evictions'] == 1
+    cache.close()
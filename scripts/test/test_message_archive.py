@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta, timezone
+
+from message_archive import MessageArchive
+from message_batch import MessageBatch
+
+
+NOW = datetime.now(timezone.utc).replace(microsecond=0)
+
+
+def _batch(*messages, text='message {}'):
+    batch = MessageBatch()
+    for msg_id, userid, minutes_ago in messages:
+        batch.append(msg_id, userid, f'user{userid}', text.format(msg_id), int((NOW - timedelta(minutes=minutes_ago)).timestamp()))
+    return batch
+
+
+def test_sync_point_covers_only_fetched_range(tmp_path):
+    archive = MessageArchive(str(tmp_path / 'messages.db'))
+    since = NOW - timedelta(hours=3)
+    assert archive.sync_point(-100, since) == 0
+
+    archive.add_messages(-100, _batch((5, 1, 60), (6, 2, 30)), since=since)
+    assert archive.sync_point(-100, since) == 6
+    # A longer window than was ever fetched needs a full fetch
+    assert archive.sync_point(-100, NOW - timedelta(hours=24)) == 0
+
+    # An incremental fetch extends coverage and keeps the older range
+    archive.add_messages(-100, _batch((7, 1, 5)), since=NOW - timedelta(hours=1))
+    assert archive.sync_point(-100, since) == 7
+    assert list(archive.get_window(-100, since).ids) == [7, 6, 5]
+    archive.close()
+
+
+def test_non_contiguous_fetch_drops_older_coverage(tmp_path):
+    archive = MessageArchive(str(tmp_path / 'messages.db'))
+    archive.add_messages(-100, _batch((5, 1, 600)), since=NOW - timedelta(hours=12))
+    # The fetch hit the window edge before reaching id 5: ids in between were never seen
+    archive.add_messages(-100, _batch((50, 1, 10)), since=NOW - timedelta(hours=3), contiguous=False)
+    assert archive.sync_point(-100, NOW - timedelta(hours=12)) == 0
+    assert archive.sync_point(-100, NOW - timedelta(hours=3)) == 50
+    archive.close()
+
+
+def test_edited_messages_are_searchable(tmp_path):
+    archive = MessageArchive(str(tmp_path / 'messages.db'))
+    archive.add_messages(-100, _batch((1, 1, 10)), since=NOW - timedelta(hours=1))
+    archive.add_messages(-100, _batch((1, 1, 10), text='staking question'), since=NOW - timedelta(hours=1))
+    assert list(archive.search(-100, 'staking').ids) == [1]
+    assert len(archive.search(-100, 'message')) == 0
+    archive.close()
+
+
+def test_user_cache_refreshes_and_expires(tmp_path, monkeypatch):
+    archive = MessageArchive(str(tmp_path / 'messages.db'))
+    archive.set_users({1: 'alice', 2: 'bob'})
+    archive.set_users({1: 'alice_new'})
+    assert archive.get_users([1, 2, 3]) == {1: 'alice_new', 2: 'bob'}
+    assert archive.get_users(range(2000)) == {1: 'alice_new', 2: 'bob'}  # more ids than one chunk
+
+    later = NOW + timedelta(hours=2)
+    monkeypatch.setattr('message_archive.datetime', type('FrozenDatetime', (datetime,), {
+        'now': classmethod(lambda cls, tz=None: later)
+    }))
+    assert archive.get_users([1, 2], max_age=3600) == {}
+    archive.close()
+
+
+def test_prune_applies_retention(tmp_path):
+    archive = MessageArchive(str(tmp_path / 'messages.db'))
+    archive.add_messages(-100, _batch((1, 1, 60 * 24 * 10), (2, 2, 60)), since=NOW - timedelta(days=11))
+    archive.set_users({1: 'old'})
+    assert archive.prune(7 * 24 * 3600) == 1
+    assert list(archive.get_window(-100, NOW - timedelta(days=30)).ids) == [2]
+    # Coverage now starts at the retention cutoff
+    assert archive.sync_point(-100, NOW - timedelta(days=11)) == 0
+    assert archive.sync_point(-100, NOW - timedelta(days=6)) == 2
+    assert archive.search(-100, 'message').ids.tolist() == [2]
+    archive.close()
+
+
+def test_live_messages_do_not_advance_sync_state(tmp_path):
+    archive = MessageArchive(str(tmp_path / 'messages.db'))
+    since = NOW - timedelta(hours=3)
+    archive.add_messages(-100, _batch((5, 1, 60)), since=since)
+    # Listener mode stores events without a coverage range; 6..8 were missed during a reconnect
+    archive.add_messages(-100, _batch((9, 2, 1)))
+    assert archive.sync_point(-100, since) == 5
+    assert list(archive.get_window(-100, since).ids) == [9, 5]
+    archive.close()
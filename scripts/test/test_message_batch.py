@@ -0,0 +1,31 @@
+from datetime import datetime, timezone
+
+from message_batch import MessageBatch, NO_SENDER
+
+
+def _batch():
+    return MessageBatch.from_rows([
+        (3, 7, 'alice', 'gm', 1700000300),
+        (2, None, None, 'channel post', 1700000200),
+        (1, '8', 'bob', 'hello', datetime.fromtimestamp(1700000100, timezone.utc), 3),
+    ])
+
+
+def test_columns_and_lookups():
+    batch = _batch()
+    assert len(batch) == 3
+    assert list(batch.userids) == [7, NO_SENDER, 8]
+    assert list(batch.dates) == [1700000300, 1700000200, 1700000100]
+    assert list(batch.reply_to) == [0, 0, 3]
+    # String and int ids find the same sender
+    assert batch.has_user('8') and batch.count(8) == 1
+    assert batch.username('7') == 'alice'
+    assert not batch.has_user('not-a-number')
+    assert sorted(batch.senders()) == [7, 8]
+
+
+def test_to_dicts_round_trip():
+    rows = _batch().to_dicts()
+    assert rows[1] == {'id': 2, 'username': None, 'userid': None, 'text': 'channel post',
+                       'date': '2023-11-14T22:16:40+00:00'}
+    assert [row['username'] for row in rows] == ['alice', None, 'bob']
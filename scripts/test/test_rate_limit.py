@@ -0,0 +1,57 @@
+import asyncio
+
+from rate_limit import TokenBucket
+
+
+class FakeClock:
+    """Drives time.monotonic and asyncio.sleep so the bucket can be tested without waiting."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 6))
+        self.now += seconds
+
+
+def _patch(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr('rate_limit.time.monotonic', clock.monotonic)
+    monkeypatch.setattr('rate_limit.asyncio.sleep', clock.sleep)
+    return clock
+
+
+def test_burst_then_steady_rate(monkeypatch):
+    clock = _patch(monkeypatch)
+
+    async def main():
+        bucket = TokenBucket(rate=2.0, capacity=3)
+        for _ in range(5):
+            await bucket.acquire()
+
+    asyncio.run(main())
+    # Three requests go at once, then one every half second
+    assert clock.sleeps == [0.5, 0.5]
+    assert clock.now == 1.0
+
+
+def test_pause_blocks_until_the_flood_wait_is_over(monkeypatch):
+    clock = _patch(monkeypatch)
+
+    async def main():
+        bucket = TokenBucket(rate=1.0, capacity=5)
+        await bucket.acquire()
+        bucket.pause(30)
+        await bucket.acquire()  # the retry
+        retried_at = clock.now
+        await bucket.acquire()
+        return retried_at
+
+    retried_at = asyncio.run(main())
+    assert retried_at == 30
+    # Only the retry goes when the wait ends; the next request waits for a fresh token
+    assert clock.now == 31
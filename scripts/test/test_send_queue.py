@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('telegram')
+from telegram.error import BadRequest, RetryAfter  # noqa: E402
+
+from send_queue import SendQueue  # noqa: E402
+
+
+class FakeBot:
+    def __init__(self, errors=None):
+        # text -> exceptions raised by its next sends, in order
+        self.errors = errors or {}
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        if self.errors.get(text):
+            raise self.errors[text].pop(0)
+        self.sent.append((chat_id, text))
+
+
+def _run(bot, messages, **kwargs):
+    async def main():
+        queue = SendQueue(bot, rate=1000, burst=100, backoff=0, **kwargs)
+        results = [queue.put(chat_id, text) for chat_id, text in messages]
+        await queue.drain()
+        return [future.result() for future in results], queue.stats()
+    return asyncio.run(main())
+
+
+def test_messages_keep_their_order_per_chat():
+    bot = FakeBot()
+    results, stats = _run(bot, [(1, 'a'), (2, 'x'), (1, 'b'), (1, 'c')])
+    assert results == [True] * 4
+    assert [text for chat_id, text in bot.sent if chat_id == 1] == ['a', 'b', 'c']
+    assert stats['sent'] == 4 and stats['failed'] == 0
+
+
+def test_transient_errors_are_retried_and_bad_requests_dropped():
+    bot = FakeBot(errors={
+        'first': [RetryAfter(0), ConnectionError('reset')],
+        'second': [BadRequest('Message is too long')],
+    })
+    results, stats = _run(bot, [(1, 'first'), (1, 'second')])
+    assert results == [True, False]
+    assert bot.sent == [(1, 'first')]
+    assert stats['retries'] == 2 and stats['failed'] == 1
+
+
+def test_gives_up_after_max_retries():
+    bot = FakeBot(errors={'hello': [ConnectionError('down')] * 3})
+    results, stats = _run(bot, [(1, 'hello')], max_retries=2)
+    assert results == [False]
+    assert bot.sent == []
+    assert stats['retries'] == 2
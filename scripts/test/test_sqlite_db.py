@@ -0,0 +1,138 @@
+import sqlite3
+
+from sqlalchemy import create_engine
+
+from db_migrations import LATEST_VERSION, get_schema_version, rebuild_reward_totals
+from sqlite_db import SQLiteDatabaseManager
+
+
+def _totals(path):
+    conn = sqlite3.connect(path)
+    try:
+        return sorted(conn.execute('SELECT period, userid, total_reward, reward_count FROM rewardTotals').fetchall())
+    finally:
+        conn.close()
+
+
+def test_fresh_database_is_fully_migrated(tmp_path):
+    path = str(tmp_path / 'gmetis.db')
+    SQLiteDatabaseManager(path).close()
+    engine = create_engine(f'sqlite:///{path}')
+    assert get_schema_version(engine, 'telegram') == LATEST_VERSION
+    engine.dispose()
+
+
+def test_first_tx_updates_totals_once(tmp_path):
+    path = str(tmp_path / 'gmetis.db')
+    db = SQLiteDatabaseManager(path)
+    first = db.add_reward_entry('1', wa='0xa', balance=0, reward=100)
+    db.add_reward_entry('1', tx='aa', reward_round=first)
+    db.add_reward_entry('1', tx='aa', reward_round=first)  # a retried stamp must not count twice
+    second = db.add_reward_entry('1', wa='0xa', balance=0, reward=50)
+    db.add_reward_entry('1', tx='bb', reward_round=second)
+    pending = db.add_pending_reward('2')
+    assert db.get_leaderboard() == [('1', 150, 2)]
+    assert db.get_user_totals('1')[0][:3] == ('all', 150, 2)
+    assert [row[0] for row in db.get_user_history('1')] == [second, first]
+    assert db.get_last_winner() == '2' and pending > second
+    db.close()
+
+    # Incremental maintenance agrees with a full rebuild from the ledger
+    before = _totals(path)
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.begin() as conn:
+        rebuild_reward_totals(conn, 'sqlite', 'telegram')
+    engine.dispose()
+    assert _totals(path) == before
+
+
+def test_wallet_registration_is_visible_through_cache(tmp_path):
+    db = SQLiteDatabaseManager(str(tmp_path / 'gmetis.db'))
+    assert db.get_latest_wa('userID', 7) is None
+    reward_round = db.add_pending_reward('7')
+    db.add_wallets([('Telegram', '7', 'alice', '0xwallet', '2025-01-01')])
+    assert db.get_latest_wa('userID', 7) == '0xwallet'
+    assert db.get_userid('alice') == '7' and db.get_username(7) == 'alice'
+    assert db.get_settleable_rewards() == [(reward_round, '7', db.get_pending_rewards()[0][2], '0xwallet')]
+    db.close()
+
+
+def test_other_platform_wallets_stay_apart(tmp_path):
+    db = SQLiteDatabaseManager(str(tmp_path / 'gmetis.db'))
+    assert db.add_wallets([('twitter', None, 'alice', '0xx', '2025-01-01')]) == 1
+    assert db.get_latest_wa('username', 'alice') is None  # Telegram lookups only see Telegram wallets
+    assert db.conn.execute('SELECT platform, id_type, user_key, wa FROM waCurrent').fetchall() == [
+        ('twitter', 'username', 'alice', '0xx')
+    ]
+    db.close()
+
+
+def test_legacy_duplicate_rewards_are_folded(tmp_path):
+    path = str(tmp_path / 'gmetis.db')
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE rewards (ID INTEGER PRIMARY KEY AUTOINCREMENT, userid TEXT, wa TEXT, balance INT,
+                              reward INT, tx TEXT, date DATE, reward_round INTEGER)
+    ''')
+    conn.executemany(
+        'INSERT INTO rewards (userid, wa, reward, tx, date, reward_round) VALUES (?, ?, ?, ?, ?, ?)', [
+            ('1', '0xa', 10, 'paid', '2025-01-01', 1),
+            ('1', '0xa', 10, None, '2025-01-01', 1),
+            ('2', None, None, None, '2025-01-02', None),
+            ('3', None, None, None, '2025-01-02', None),
+        ]
+    )
+    conn.commit()
+    conn.close()
+
+    db = SQLiteDatabaseManager(path)
+    assert db.get_user_history('1') == [(1, '2025-01-01', 10, '0xa', 'paid')]
+    assert db.get_leaderboard() == [('1', 10, 1)]
+    # The counter continues after the legacy rounds
+    assert db.add_pending_reward('4') == 2
+    db.close()
+
+
+def test_reward_entry_is_upserted_per_round_and_user(tmp_path):
+    db = SQLiteDatabaseManager(str(tmp_path / 'gmetis.db'))
+    reward_round = db.add_pending_reward('1')
+    # The winner registers later: the pending row is filled in, not duplicated
+    assert db.add_reward_entry('1', reward_round=reward_round, wa='0xa', balance=5, reward=100) == reward_round
+    assert db.add_reward_entry('1', reward_round=reward_round, wa='0xb', balance=5, reward=100) == reward_round
+    assert [row[3] for row in db.get_user_history('1')] == ['0xb']
+    assert db.get_pending_rewards() == []
+    db.close()
+
+
+def test_rounds_are_unique_across_threads(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    db = SQLiteDatabaseManager(str(tmp_path / 'gmetis.db'))
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        rounds = list(pool.map(lambda _: db.allocate_reward_round(), range(50)))
+    assert sorted(rounds) == list(range(1, 51))
+    assert db.get_next_reward_round() == 51
+    db.close()
+
+
+def test_batch_commits_once_and_rolls_back_together(tmp_path):
+    path = str(tmp_path / 'gmetis.db')
+    db = SQLiteDatabaseManager(path)
+    with db.batch():
+        db.add_pending_reward('1')
+        db.add_pending_reward('2')
+        # Nested writes are not visible to other connections until the outer batch ends
+        other = sqlite3.connect(path)
+        assert other.execute('SELECT COUNT(*) FROM rewards').fetchone()[0] == 0
+    assert other.execute('SELECT COUNT(*) FROM rewards').fetchone()[0] == 2
+
+    try:
+        with db.batch():
+            db.add_pending_reward('3')
+            raise RuntimeError('transfer failed')
+    except RuntimeError:
+        pass
+    assert other.execute('SELECT COUNT(*) FROM rewards').fetchone()[0] == 2
+    assert db.get_next_reward_round() == 3
+    other.close()
+    db.close()
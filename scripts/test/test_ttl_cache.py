@@ -0,0 +1,62 @@
+from ttl_cache import TTLCache
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('ttl_cache.time.monotonic', lambda: now[0])
+    cache = TTLCache(ttl=10)
+    cache.set('wa', '0xa')
+    now[0] = 109.9
+    assert cache.get('wa') == '0xa'
+    now[0] = 110.0
+    assert cache.get('wa', 'gone') == 'gone'
+    assert cache.stats()['size'] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')  # refreshes 'a', leaving 'b' as the oldest
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_none_is_cached_and_invalidated():
+    cache = TTLCache()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return None  # e.g. a user without a registered wallet
+
+    assert cache.get_or_load('wa', loader) is None
+    assert cache.get_or_load('wa', loader) is None
+    assert len(calls) == 1
+
+    cache.invalidate('wa')
+    cache.get_or_load('wa', loader)
+    assert len(calls) == 2
+    assert cache.stats()['hit_rate'] == round(1 / 3, 3)
+
+
+def test_invalidation_during_load_is_not_undone():
+    cache = TTLCache()
+
+    def stale_loader():
+        cache.invalidate('wa')  # the wallet changes while the old one is being read
+        return '0xold'
+
+    assert cache.get_or_load('wa', stale_loader) == '0xold'
+    assert cache.get_or_load('wa', lambda: '0xnew') == '0xnew'
+    assert cache.get('wa') == '0xnew'
+
+    def cleared_loader():
+        cache.clear()
+        return '0xold'
+
+    cache.invalidate('wa')
+    cache.get_or_load('wa', cleared_loader)
+    assert cache.get('wa', 'gone') == 'gone'
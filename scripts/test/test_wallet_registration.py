@@ -0,0 +1,98 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from wallet_registration import WalletRegistrar, parse_wallet
+
+
+ADDRESS = '0x52908400098527886E0F7030069857D2E4169EE7'  # valid EIP-55 checksum
+
+
+def test_parse_wallet_accepts_register_command():
+    assert parse_wallet(f'/register {ADDRESS}') == ADDRESS
+    assert parse_wallet(f'my wallet: {ADDRESS.lower()}.') == ADDRESS
+
+
+@pytest.mark.parametrize('text', [
+    '/register 0x' + 'ab' * 32,  # tx hash or private key
+    '/register 0x' + 'a' * 39,
+    '/register 0x' + 'a' * 40 + 'g',
+    '/register ' + ADDRESS + '00',
+    '/register ' + ADDRESS.replace('E0F', 'e0F'),  # broken checksum
+    f'/register {ADDRESS} 0x' + 'b' * 40,
+    '/register',
+    'hello',
+])
+def test_parse_wallet_rejects(text):
+    with pytest.raises(ValueError):
+        parse_wallet(text)
+
+
+def test_parse_wallet_same_address_twice():
+    assert parse_wallet(f'{ADDRESS} {ADDRESS}') == ADDRESS
+
+
+def _update(update_id, userid, text):
+    return SimpleNamespace(update_id=update_id, message=SimpleNamespace(
+        text=text, chat=SimpleNamespace(type='private', id=userid),
+        from_user=SimpleNamespace(id=userid, username=f'user{userid}')
+    ))
+
+
+class FakeBot:
+    def __init__(self, updates):
+        self.updates = updates
+        self.offsets = []
+
+    async def get_updates(self, offset=None, limit=100, timeout=0, allowed_updates=None):
+        self.offsets.append(offset)
+        return [u for u in self.updates if offset is None or u.update_id >= offset][:limit]
+
+
+class FlakyDB:
+    def __init__(self, failures):
+        self.failures = failures
+        self.rows = []
+
+    async def add_wallets(self, rows):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('database unavailable')
+        self.rows.extend(rows)
+
+
+def _registrar(bot, db):
+    replies, settled = [], []
+
+    async def reply(text, chat_id):
+        replies.append((chat_id, text))
+
+    async def on_registered(userid):
+        settled.append(userid)
+
+    return WalletRegistrar(bot, db, reply, on_registered), replies, settled
+
+
+def test_failed_write_keeps_registrations_unacknowledged():
+    bot = FakeBot([_update(10, 1, f'/register {ADDRESS}'), _update(11, 2, '/register 0x' + 'ab' * 32)])
+    db = FlakyDB(failures=1)
+    registrar, replies, settled = _registrar(bot, db)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(registrar.poll())
+    assert registrar.offset is None and db.rows == [] and settled == []
+
+    asyncio.run(registrar.drain())
+    assert [row[1] for row in db.rows] == ['1']
+    assert settled == ['1']
+    assert bot.offsets[-1] == 12
+    # The tx hash was answered with an error, never registered
+    assert any(chat_id == 2 and 'transaction hash' in text for chat_id, text in replies)
+
+
+def test_drain_survives_database_errors():
+    bot = FakeBot([_update(5, 1, f'/register {ADDRESS}')])
+    registrar, _, _ = _registrar(bot, FlakyDB(failures=100))
+    asyncio.run(registrar.drain())
+    assert registrar.offset is None
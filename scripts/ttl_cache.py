@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire ``ttl`` seconds after they are stored.
+
+    ``None`` is a valid cached value, so "user has no wallet" lookups are
+    cached too. Hit/miss/eviction counters are exposed through ``stats()``.
+    ``invalidate`` and ``clear`` bump a per-key generation, so a
+    ``get_or_load`` that was already loading does not cache its now stale
+    result.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._generations = {}  # key -> times invalidated
+        self._epoch = 0  # times cleared
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._store(key, value)
+
+    def _store(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def _generation(self, key):
+        return self._epoch, self._generations.get(key, 0)
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for ``key``, calling ``loader()`` and caching its result on a miss.
+
+        The result is not cached when ``key`` was invalidated while ``loader()`` ran.
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            with self._lock:
+                generation = self._generation(key)
+            value = loader()
+            with self._lock:
+                if self._generation(key) == generation:
+                    self._store(key, value)
+        return value
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+                self._generations[key] = self._generations.get(key, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._generations.clear()
+            self._epoch += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._data),
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
@@ -0,0 +1,126 @@
+import re
+import asyncio
+import logging
+from datetime import date
+
+from web3 import Web3
+
+
+logger = logging.getLogger(__name__)
+
+ADDRESS_RE = re.compile(r'0x[0-9a-fA-F]{40}')
+# Any whole 0x-prefixed word, so a 64-hex tx hash or key is seen as one (invalid) token, never cut to 40
+CANDIDATE_RE = re.compile(r'(?<![0-9A-Za-z])0[xX][0-9A-Za-z]*')
+PAGE_SIZE = 100  # updates fetched, written and acknowledged together
+
+
+def parse_wallet(text):
+    """Checksummed address from a DM or ``/register 0x...`` command.
+
+    The message must contain exactly one 0x token and it must be a whole
+    40-hex address. All-lower/all-upper hex is accepted and checksummed;
+    mixed case must already carry a valid EIP-55 checksum, so typos are
+    not silently accepted. Raises ValueError with a user-facing reason.
+    """
+    candidates = set(CANDIDATE_RE.findall(text or ''))
+    if not candidates:
+        raise ValueError("No wallet address found. Send /register followed by your Metis wallet address.")
+    if len(candidates) > 1:
+        raise ValueError("Please send exactly one wallet address.")
+    address = candidates.pop()
+    if not ADDRESS_RE.fullmatch(address):
+        raise ValueError(
+            "That doesn't look like a wallet address (0x followed by exactly 40 hex characters). "
+            "Never send a transaction hash or private key."
+        )
+    body = address[2:]
+    if body != body.lower() and body != body.upper() and not Web3.is_checksum_address(address):
+        raise ValueError("That address has an invalid checksum; please copy it again from your wallet.")
+    return Web3.to_checksum_address(address)
+
+
+class WalletRegistrar:
+    """Turns private messages to the reward bot into waMap registrations.
+
+    Updates are long-polled with ``bot.get_updates`` a page at a time.
+    Valid addresses on a page are written with one ``db_manager.add_wallets``
+    call, after which ``on_registered(userid)`` runs for every new wallet,
+    so the user's pending rounds settle immediately. The page is only
+    acknowledged to Telegram once that write succeeds; after a failure
+    the same updates are fetched again.
+    """
+
+    def __init__(self, bot, db_manager, reply, on_registered, platform='Telegram'):
+        self.bot = bot
+        self.db_manager = db_manager
+        self.reply = reply
+        self.on_registered = on_registered
+        self.platform = platform
+        self.offset = None
+        self._pending = {}
+
+    async def poll(self, timeout=0):
+        """Fetch, handle and write one page of updates; returns how many were handled."""
+        updates = await self.bot.get_updates(
+            offset=self.offset, limit=PAGE_SIZE, timeout=timeout, allowed_updates=['message']
+        )
+        for update in updates:
+            await self._handle(update.message)
+        await self.flush()
+        if updates:
+            # Passed to the next get_updates call, which is what confirms this page with Telegram
+            self.offset = updates[-1].update_id + 1
+        return len(updates)
+
+    async def _handle(self, message):
+        if message is None or message.chat.type != 'private' or message.from_user is None:
+            return
+        text = message.text or ''
+        if not text.startswith('/register') and not CANDIDATE_RE.search(text):
+            await self.reply("Send /register followed by your Metis wallet address to receive rewards.", message.chat.id)
+            return
+        try:
+            wallet = parse_wallet(text)
+        except ValueError as e:
+            await self.reply(str(e), message.chat.id)
+            return
+        user = message.from_user
+        # A later message from the same user within the batch replaces the earlier one
+        self._pending[user.id] = (self.platform, str(user.id), user.username, wallet, date.today(), message.chat.id)
+
+    async def flush(self):
+        """Write buffered registrations in one batch, then settle each user's pending rounds.
+
+        The buffer is only cleared once the write succeeds.
+        """
+        if not self._pending:
+            return 0
+        pending = list(self._pending.values())
+        await self.db_manager.add_wallets([row[:5] for row in pending])
+        self._pending.clear()
+        for _, userid, _, wallet, _, chat_id in pending:
+            await self.reply(f"✅ Wallet {wallet} registered! Any pending rewards are on their way.", chat_id)
+            try:
+                await self.on_registered(userid)
+            except Exception as e:
+                logger.error(f"Settlement for {userid} failed: {e}")
+        return len(pending)
+
+    async def drain(self):
+        """One-shot runs: handle every queued DM once, acknowledging them with Telegram."""
+        try:
+            # The final empty poll confirms the last written page with Telegram
+            while await self.poll():
+                pass
+        except Exception as e:
+            # Unacknowledged updates are delivered again on the next run
+            logger.error(f"Registering wallets failed, leaving the rest for the next run: {e}")
+
+    async def run(self, poll_timeout=10):
+        """Long-running mode: poll continuously, writing each page of registrations as it arrives."""
+        while True:
+            try:
+                await self.poll(timeout=poll_timeout)
+            except Exception as e:
+                logger.error(f"Registering wallets failed, retrying: {e}")
+                await asyncio.sleep(5)
@@ -1,21 +1,11 @@
-import sqlite3
+from scripts.sqlite_db import SQLiteDatabaseManager
 
-def update_wa(userID, new_wa):
-    # Connect to the SQLite database
-    conn = sqlite3.connect('gmetis.db')
-    cursor = conn.cursor()
-    
-    # Update the wa field for the given userID
-    cursor.execute('''
-    UPDATE waMap
-    SET wa = ?
-    WHERE userID = ?
-    ''', (new_wa, userID))
-    
-    # Commit the changes and close the connection
-    conn.commit()
-    conn.close()
+def update_wa(db_manager, userID, new_wa):
+    # Update the wa field for the given userID on the manager's open connection
+    return db_manager.update_wa(userID, new_wa)
 
 # Example usage
-update_wa('123', '0x6c')
+db_manager = SQLiteDatabaseManager('gmetis.db')
+update_wa(db_manager, '123', '0x6c')
+db_manager.close()
 